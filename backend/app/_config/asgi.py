@@ -2,15 +2,34 @@
 ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections are authenticated with the
+same Knox tokens as the REST API and routed to the real-time consumers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+https://channels.readthedocs.io/en/latest/deploying.html
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', '_config.settings')
 
-application = get_asgi_application()
+# Set up Django before importing anything that uses models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import OriginValidator  # noqa: E402
+from django.conf import settings  # noqa: E402
+from sdg_action_plan.routing import websocket_urlpatterns  # noqa: E402
+from users.middleware import KnoxTokenAuthMiddleware  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    # browsers connect from the frontend, so accept the origins CORS already trusts
+    'websocket': OriginValidator(
+        KnoxTokenAuthMiddleware(URLRouter(websocket_urlpatterns)),
+        settings.CORS_ALLOWED_ORIGINS,
+    ),
+})
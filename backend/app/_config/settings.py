@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 from corsheaders.defaults import default_headers
 
@@ -36,6 +37,8 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
+    # serves ASGI, including WebSockets, from runserver
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -51,6 +54,8 @@ INSTALLED_APPS = [
     'users',
     'teams',
     'admin_portal',
+    'catalogue',
+    'channels',
     'knox',
     'mock',
     'corsheaders',
@@ -89,6 +94,23 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = '_config.wsgi.application'
+ASGI_APPLICATION = '_config.asgi.application'
+
+# Serve the read-heavy catalogue and analytics views from the event loop (see catalogue/async_views.py);
+# set ASYNC_VIEWS=false to fall back to their sync implementations
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'true').lower() in ('1', 'true', 'yes')
+
+# Real-time editing: the ASGI processes of one host share channels through a SQLite file.
+# Each plan's room is served by one process at a time (see sdg_action_plan/collab.py),
+# so editors on different workers still share one document.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'sdg_action_plan.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': os.environ.get('CHANNEL_LAYER_PATH', BASE_DIR / 'channels.sqlite3'),
+        },
+    },
+}
 
 
 # Database
@@ -105,6 +127,48 @@ DATABASES = {
     }
 }
 
+# Caches
+# The `catalogue` cache holds rendered responses of the public catalogue endpoints
+# (see catalogue/cache.py), and saves invalidate them by bumping a version kept in
+# the same cache; the in-memory search and autocomplete indexes of each worker
+# rebuild when those versions change. Every process that serves or writes the
+# catalogue (ASGI workers, load_catalogue and other management commands) must
+# therefore share it, so it is kept on disk by default. Set CATALOGUE_CACHE_BACKEND=locmem only when a single
+# process serves the site and nothing else writes the catalogue; with more than
+# one host, point CATALOGUE_CACHE_DIR at shared storage or use a network cache.
+# Tests run with it in memory (see _config/test_runner.py).
+
+CATALOGUE_CACHE_BACKEND = os.environ.get('CATALOGUE_CACHE_BACKEND', 'file')
+
+if CATALOGUE_CACHE_BACKEND == 'locmem':
+    CATALOGUE_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalogue',
+    }
+else:
+    CATALOGUE_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'CATALOGUE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sdg-catalogue-cache')),
+    }
+CATALOGUE_CACHE.update({
+    'TIMEOUT': int(os.environ.get('CATALOGUE_CACHE_TIMEOUT', 600)),
+    'OPTIONS': {'MAX_ENTRIES': 5000},
+})
+
+# How often (seconds) each worker's in-memory catalogue indexes read those versions
+# to reload, in the background, what other processes changed (see catalogue/live_index.py)
+CATALOGUE_INDEX_CHECK_INTERVAL = float(os.environ.get('CATALOGUE_INDEX_CHECK_INTERVAL', 2))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': CATALOGUE_CACHE,
+}
+
+TEST_RUNNER = '_config.test_runner.TestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -210,3 +274,27 @@ EMAIL_SUBJECT_PREFIX = '[SDG Knowledge System] '
 
 # Site URL for email invitations
 SITE_URL = os.environ.get('SITE_URL', 'http://localhost:3000')
+
+# Google Docs sync queue (see sdg_action_plan/docs_sync.py)
+# Plan edits are written to their Google Doc by background worker threads once
+# the plan has been idle for DEBOUNCE seconds (or at most MAX_DELAY seconds after
+# the first pending edit). Failed writes are retried after BACKOFF, 2*BACKOFF, ...
+# seconds, up to MAX_ATTEMPTS times.
+GOOGLE_DOCS_SYNC = {
+    'DEBOUNCE': float(os.environ.get('GOOGLE_DOCS_SYNC_DEBOUNCE', 2)),
+    'MAX_DELAY': float(os.environ.get('GOOGLE_DOCS_SYNC_MAX_DELAY', 15)),
+    'BACKOFF': float(os.environ.get('GOOGLE_DOCS_SYNC_BACKOFF', 5)),
+    'MAX_ATTEMPTS': int(os.environ.get('GOOGLE_DOCS_SYNC_MAX_ATTEMPTS', 5)),
+    'WORKERS': int(os.environ.get('GOOGLE_DOCS_SYNC_WORKERS', 2)),
+}
+
+# Page views are queued in memory and a spool file, then inserted in batches
+# (see admin_portal/interaction_log.py). The same thread refreshes the analytics
+# rollups at most every ROLLUP_INTERVAL. Intervals are in seconds.
+INTERACTION_LOG = {
+    'SPOOL_DIR': os.environ.get('INTERACTION_SPOOL_DIR', os.path.join(BASE_DIR, 'interaction_spool')),
+    'BATCH_SIZE': int(os.environ.get('INTERACTION_LOG_BATCH_SIZE', 200)),
+    'FLUSH_INTERVAL': float(os.environ.get('INTERACTION_LOG_FLUSH_INTERVAL', 1)),
+    'CAPACITY': int(os.environ.get('INTERACTION_LOG_CAPACITY', 10000)),
+    'ROLLUP_INTERVAL': float(os.environ.get('INTERACTION_ROLLUP_INTERVAL', 60)),
+}
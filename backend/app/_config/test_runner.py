@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with the `catalogue` cache in memory, so a run never reads
+    responses or versions another run left in the on-disk cache.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        catalogue = {**settings.CACHES['catalogue'],
+                     'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalogue'}
+        self._caches = override_settings(CACHES={**settings.CACHES, 'catalogue': catalogue})
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -34,4 +34,6 @@ urlpatterns = [
     path('api/sdg-action-plan/', include('sdg_action_plan.urls')),
     path('api/sdg-actions/', include('sdg_actions.urls')),
     path('api/sdg-education/', include('sdg_education.urls')),
+    path('api/catalogue/', include('catalogue.urls')),
+    path('api/sdg-targets/', include('sdg_targets.urls')),
 ]
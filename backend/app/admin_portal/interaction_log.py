@@ -0,0 +1,336 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .rollups import count_sdg_views, refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+LIVE_SUFFIX = '.spool'
+SEALED_SUFFIX = '.sealed'
+# events the database rejected while it took others; kept for inspection, never retried
+FAILED_SUFFIX = '.failed'
+
+
+def education_interaction(education, user_id, timestamp):
+    from .models import EducationInteraction
+    return EducationInteraction(
+        userId_id=user_id,
+        educationId=education,
+        # untitled pages are logged with an empty name rather than failing the batch
+        educationName=education.title or '',
+        related_sdgs=education.sdgs_related,
+        related_disciplines=education.related_to_which_discipline,
+        related_industries=education.useful_for_which_industries,
+        timestamp=timestamp,
+    )
+
+
+def action_interaction(action, user_id, timestamp):
+    from .models import ActionInteraction
+    return ActionInteraction(
+        userId_id=user_id,
+        actionId=action,
+        actionName=action.actions or '',
+        related_sdgs=action.sdgs,
+        related_industries=action.related_industry,
+        timestamp=timestamp,
+    )
+
+
+def interaction_kinds():
+    """kind -> (page model, builder of the interaction row)"""
+    from sdg_actions.models import ActionDb
+    from sdg_education.models import EducationDb
+    return {
+        'education': (EducationDb, education_interaction),
+        'action': (ActionDb, action_interaction),
+    }
+
+
+class SpoolFile:
+    """An append-only file of JSON events, flock-ed for as long as it is open"""
+
+    def __init__(self, path, file):
+        self.path = path
+        self.file = file
+
+    @classmethod
+    def create(cls, path) -> 'SpoolFile':
+        while True:
+            file = open(path, 'a+', encoding='utf-8')
+            fcntl.flock(file, fcntl.LOCK_EX)
+            if os.fstat(file.fileno()).st_nlink:
+                return cls(path, file)
+            # another process took the new, empty file for an abandoned one; start over
+            file.close()
+
+    @classmethod
+    def claim(cls, path) -> Optional['SpoolFile']:
+        """Lock a file another process left behind; None if it is still in use or already gone"""
+        try:
+            file = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return None
+        if not os.fstat(file.fileno()).st_nlink:
+            # its owner inserted and removed it between our open and our lock
+            file.close()
+            return None
+        return cls(path, file)
+
+    def append(self, event):
+        self.file.write(json.dumps(event) + '\n')
+        # once the write reaches the OS the event outlives a crash of this process
+        self.file.flush()
+
+    def seal(self, path):
+        """Rename the file; it stays locked, so no other process picks it up"""
+        os.replace(self.path, path)
+        self.path = path
+
+    def events(self) -> List[list]:
+        self.file.seek(0)
+        events = []
+        for line in self.file:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                # a line cut short by a crash
+                continue
+        return events
+
+    def remove(self):
+        os.remove(self.path)
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+
+class InteractionLog:
+    """
+    Records page views without a database round trip per request.
+
+    `record()` appends the event to an in-memory batch and to this process's
+    spool file, then returns. A background thread inserts the batch with
+    `bulk_create` once it holds `batch_size` events or `flush_interval` seconds
+    have passed, looking up the pages (and copying their title, SDGs and
+    industries) with one query per kind. Events for pages that no longer
+    exist are dropped at that point.
+
+    The spool file is what makes this safe across restarts: it is renamed
+    ("sealed") when its batch is taken, and only removed once that batch is
+    committed. Sealed or live files left behind by a crashed process are
+    claimed by whichever process flushes next; flock keeps files that are in
+    use out of reach. A batch that fails to insert is retried one event at a
+    time: events the database still rejects while it takes the others are
+    moved to a `.failed` file, and a batch none of which goes in (the database
+    is down) stays sealed on disk for a later flush. Events are thus delivered
+    at least once, and one bad event cannot hold back the rest of its batch.
+
+    When the database falls behind, the memory batch is capped at `capacity`;
+    beyond that the batch is sealed without waiting for the insert, leaving it
+    for the next flush to read back from disk.
+
+    The thread also folds new rows into the analytics rollups (see rollups.py),
+    at most every `rollup_interval` seconds.
+
+    With `background=False` no thread is started and `flush()` does the work,
+    which is how the tests drive it.
+    """
+
+    def __init__(self, spool_dir=None, batch_size=None, flush_interval=None, capacity=None, rollup_interval=None,
+                 background=None, clock: Callable[[], datetime] = timezone.now):
+        config = getattr(settings, 'INTERACTION_LOG', {})
+        self.spool_dir = str(config.get('SPOOL_DIR', os.path.join(settings.BASE_DIR, 'interaction_spool'))
+                             if spool_dir is None else spool_dir)
+        self.batch_size = config.get('BATCH_SIZE', 200) if batch_size is None else batch_size
+        self.flush_interval = config.get('FLUSH_INTERVAL', 1.0) if flush_interval is None else flush_interval
+        self.capacity = config.get('CAPACITY', 10000) if capacity is None else capacity
+        self.rollup_interval = config.get('ROLLUP_INTERVAL', 60) if rollup_interval is None else rollup_interval
+        self.background = config.get('BACKGROUND', True) if background is None else background
+        self.clock = clock
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._events = []
+        self._spool = None
+        self._thread = None
+        self._rollups_due = False
+        self._last_rollup = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def record(self, kind, item_id, user_id=None):
+        """Queue one page view; safe to call on every request"""
+        event = [kind, item_id, user_id, self.clock().isoformat()]
+        if self._pid != os.getpid():
+            # a forked worker starts with its own spool and thread
+            self._reset()
+        with self._lock:
+            if self._spool is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._spool = SpoolFile.create(self._spool_path(LIVE_SUFFIX))
+            self._spool.append(event)
+            self._events.append(event)
+            full = len(self._events) >= self.batch_size
+            if len(self._events) >= self.capacity:
+                self._seal().close()
+                self._events = []
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Insert every queued event, and any left on disk by other processes; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                events, spool = self._events, self._spool and self._seal()
+                self._events = []
+            # listed first so a batch that fails below is not retried straight away
+            abandoned = [path for path in self._abandoned() if spool is None or path != spool.path]
+            written = 0
+            if spool is not None:
+                written += self._insert_spool(spool, events)
+            for path in abandoned:
+                spool = SpoolFile.claim(path)
+                if spool is not None:
+                    written += self._insert_spool(spool, spool.events())
+            return written
+
+    def stop(self, timeout=None):
+        """Stop the flush thread after a final flush"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            atexit.unregister(self.stop)
+            self._wake.set()
+            thread.join(timeout)
+        self.flush()
+
+    def _spool_path(self, suffix):
+        return os.path.join(self.spool_dir, f'interactions-{self._pid}-{uuid.uuid4().hex[:8]}{suffix}')
+
+    def _seal(self) -> SpoolFile:
+        """Take the live spool out of use; the caller holds `_lock`"""
+        spool, self._spool = self._spool, None
+        spool.seal(self._spool_path(SEALED_SUFFIX))
+        return spool
+
+    def _abandoned(self):
+        paths = glob.glob(os.path.join(self.spool_dir, '*' + SEALED_SUFFIX))
+        paths += glob.glob(os.path.join(self.spool_dir, '*' + LIVE_SUFFIX))
+        own = self._spool.path if self._spool is not None else None
+        return sorted(path for path in paths if path != own)
+
+    def _insert_spool(self, spool, events) -> int:
+        try:
+            written = self.insert(events)
+        except Exception as e:
+            written, failed = self._insert_each(events) if len(events) > 1 else (0, events)
+            if len(failed) == len(events):
+                # the sealed file stays on disk and is retried by a later flush
+                logger.warning(f"Could not insert {len(events)} interaction events from {spool.path}: {e}")
+                spool.close()
+                return 0
+            # the database took the other events, so retrying these would only fail again
+            self._set_aside(failed, e)
+        spool.remove()
+        return written
+
+    def _insert_each(self, events):
+        """Insert events one at a time; returns how many were written and the events that failed"""
+        written, failed = 0, []
+        for event in events:
+            try:
+                written += self.insert([event])
+            except Exception:
+                failed.append(event)
+        return written, failed
+
+    def _set_aside(self, events, error):
+        path = self._spool_path(FAILED_SUFFIX)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines(json.dumps(event) + '\n' for event in events)
+        logger.error(f"Could not insert {len(events)} interaction events, moved them to {path}: {error}")
+
+    def insert(self, events) -> int:
+        """Write events to the interaction tables in one transaction"""
+        if not events:
+            return 0
+        kinds = interaction_kinds()
+        user_ids = {user_id for _, _, user_id, _ in events if user_id is not None}
+        # accounts deleted since the view become anonymous, as deleting a user does to older rows
+        users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True)) if user_ids else set()
+
+        rows = {}
+        for kind, (model, build) in kinds.items():
+            matching = [event for event in events if event[0] == kind]
+            if not matching:
+                continue
+            pages = model.objects.in_bulk({item_id for _, item_id, _, _ in matching})
+            rows[kind] = [build(pages[item_id], user_id if user_id in users else None, datetime.fromisoformat(when))
+                          for _, item_id, user_id, when in matching if item_id in pages]
+
+        with transaction.atomic():
+            for objects in rows.values():
+                if objects:
+                    type(objects[0]).objects.bulk_create(objects, batch_size=500)
+                    # bulk_create sends no post_save, so the SDG counts are added here
+                    count_sdg_views(objects)
+        written = sum(len(objects) for objects in rows.values())
+        if written < len(events):
+            logger.info(f"Dropped {len(events) - written} interaction events for pages that do not exist")
+        return written
+
+    def _ensure_thread(self):
+        if not self.background or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='interaction-log', daemon=True)
+                self._thread.start()
+                # whatever is still queued at a clean shutdown is inserted rather than left to the spool
+                atexit.register(self.stop, timeout=5)
+
+    def _work(self):
+        while self._thread is threading.current_thread():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                if self.flush():
+                    self._rollups_due = True
+                if self._rollups_due and (self._last_rollup is None
+                                          or time.monotonic() - self._last_rollup >= self.rollup_interval):
+                    self._rollups_due = False
+                    self._last_rollup = time.monotonic()
+                    refresh_rollups()
+            except Exception:
+                logger.exception("Flushing interaction events failed")
+            finally:
+                close_old_connections()
+
+
+interaction_log = InteractionLog()
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from admin_portal.rollups import rebuild_rollups, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ("Fold new page views into the hourly, daily and per-user rollups the admin analytics "
+            "endpoints read. Only interactions added since the last run are read, so it can run "
+            "from cron; --loop keeps it running as a background job.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop the rollups and rebuild them from every interaction.')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Refresh again every SECONDS until interrupted.')
+
+    def handle(self, *args, **options):
+        if options['loop'] is not None and options['loop'] <= 0:
+            raise CommandError('--loop must be positive')
+
+        if options['rebuild']:
+            self.stdout.write(f'Rebuilt rollups from {rebuild_rollups()} interactions')
+            if options['loop'] is None:
+                return
+        while True:
+            started = time.perf_counter()
+            folded = refresh_rollups()
+            self.stdout.write(f'{folded} new interactions folded in {time.perf_counter() - started:.2f}s')
+            if options['loop'] is None:
+                break
+            close_old_connections()
+            time.sleep(options['loop'])
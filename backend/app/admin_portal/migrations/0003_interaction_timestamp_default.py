@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_portal', '0002_globalsettings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actioninteraction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='educationinteraction',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,150 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:13
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+HOURLY_RETENTION = timedelta(days=8)
+# (watermark table, interaction model, page field, page name field, rollup model, per-user rollup model)
+SOURCES = [
+    ('education', 'EducationInteraction', 'educationId', 'educationName', 'EducationViewRollup', 'EducationUserRollup'),
+    ('action', 'ActionInteraction', 'actionId', 'actionName', 'ActionViewRollup', 'ActionUserRollup'),
+]
+
+
+def fold_existing_views(apps, schema_editor):
+    """Roll up the interactions logged so far, as rollups.rebuild_rollups() would"""
+    RollupWatermark = apps.get_model('admin_portal', 'RollupWatermark')
+    now = timezone.now()
+    for table, interaction, item_field, name_field, rollup, user_rollup in SOURCES:
+        Interaction = apps.get_model('admin_portal', interaction)
+        Rollup = apps.get_model('admin_portal', rollup)
+        UserRollup = apps.get_model('admin_portal', user_rollup)
+        top = Interaction.objects.aggregate(top=Max('id'))['top']
+        if top is None:
+            continue
+        interactions = Interaction.objects.filter(id__lte=top)
+
+        buckets = [('hour', TruncHour, interactions.filter(timestamp__gte=now - HOURLY_RETENTION)),
+                   ('day', TruncDay, interactions)]
+        for granularity, trunc, rows in buckets:
+            rows = (rows.annotate(bucket=trunc('timestamp')).values('bucket', item_field)
+                    .annotate(view_count=Count('id'), user_count=Count('userId', distinct=True),
+                              latest=Max('timestamp'), page_name=Max(name_field))
+                    .order_by())
+            Rollup.objects.bulk_create([
+                Rollup(**{f'{item_field}_id': row[item_field]}, granularity=granularity, bucket=row['bucket'],
+                       name=row['page_name'], views=row['view_count'], unique_users=row['user_count'],
+                       last_viewed=row['latest'])
+                for row in rows.iterator(chunk_size=2000)
+            ], batch_size=500)
+
+        rows = (interactions.exclude(userId=None).values(item_field, 'userId')
+                .annotate(view_count=Count('id'), latest=Max('timestamp'), page_name=Max(name_field)).order_by())
+        UserRollup.objects.bulk_create([
+            UserRollup(**{f'{item_field}_id': row[item_field]}, userId_id=row['userId'], name=row['page_name'],
+                       views=row['view_count'], last_viewed=row['latest'])
+            for row in rows.iterator(chunk_size=2000)
+        ], batch_size=500)
+
+        users = dict(UserRollup.objects.values(item_field).annotate(user_count=Count('id')).order_by()
+                     .values_list(item_field, 'user_count'))
+        days = (Rollup.objects.filter(granularity='day').values(item_field)
+                .annotate(view_count=Sum('views'), latest=Max('last_viewed'), page_name=Max('name')).order_by())
+        Rollup.objects.bulk_create([
+            Rollup(**{f'{item_field}_id': row[item_field]}, granularity='total', bucket=EPOCH, name=row['page_name'],
+                   views=row['view_count'], unique_users=users.get(row[item_field], 0), last_viewed=row['latest'])
+            for row in days
+        ], batch_size=500)
+        RollupWatermark.objects.update_or_create(table=table, defaults={'last_id': top})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_portal', '0003_interaction_timestamp_default'),
+        ('sdg_actions', '0003_actionfacet_location'),
+        ('sdg_education', '0002_educationfacet'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActionUserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('last_viewed', models.DateTimeField()),
+                ('actionId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sdg_actions.actiondb')),
+                ('userId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('actionId', 'userId'), name='action_rollup_user')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActionViewRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('name', models.TextField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('unique_users', models.PositiveIntegerField(default=0)),
+                ('last_viewed', models.DateTimeField()),
+                ('actionId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sdg_actions.actiondb')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='admin_porta_granula_854e5e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('actionId', 'granularity', 'bucket'), name='action_rollup_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EducationUserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.TextField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('last_viewed', models.DateTimeField()),
+                ('educationId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sdg_education.educationdb')),
+                ('userId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('educationId', 'userId'), name='education_rollup_user')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EducationViewRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('name', models.TextField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('unique_users', models.PositiveIntegerField(default=0)),
+                ('last_viewed', models.DateTimeField()),
+                ('educationId', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sdg_education.educationdb')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='admin_porta_granula_faef9e_idx')],
+                'constraints': [models.UniqueConstraint(fields=('educationId', 'granularity', 'bucket'), name='education_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(fold_existing_views, migrations.RunPython.noop),
+    ]
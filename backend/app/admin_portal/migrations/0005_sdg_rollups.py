@@ -0,0 +1,82 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:17
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# copied from admin_portal/rollups.py as of this migration, which must not change with it
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+HOURLY_RETENTION = timedelta(days=8)
+
+
+def split_sdgs(related_sdgs):
+    """The SDGs of an interaction's comma-separated `related_sdgs`"""
+    if isinstance(related_sdgs, list):
+        related_sdgs = ','.join(related_sdgs)
+    return [sdg.strip() for sdg in (related_sdgs or '').split(',') if sdg.strip()]
+
+
+def sdg_buckets(timestamp, now):
+    """The (granularity, bucket) of every SDG rollup row a view at `timestamp` counts towards"""
+    buckets = [('day', timestamp.replace(hour=0, minute=0, second=0, microsecond=0)), ('total', EPOCH)]
+    if timestamp >= now - HOURLY_RETENTION:
+        buckets.append(('hour', timestamp.replace(minute=0, second=0, microsecond=0)))
+    return buckets
+
+
+def count_existing_views(apps, schema_editor):
+    now = timezone.now()
+    for interaction, rollup in (('EducationInteraction', 'EducationSDGRollup'),
+                                ('ActionInteraction', 'ActionSDGRollup')):
+        Interaction = apps.get_model('admin_portal', interaction)
+        Rollup = apps.get_model('admin_portal', rollup)
+        counts = Counter()
+        rows = Interaction.objects.exclude(related_sdgs=None).values_list('related_sdgs', 'timestamp')
+        for related_sdgs, timestamp in rows.iterator(chunk_size=2000):
+            for sdg in split_sdgs(related_sdgs):
+                for granularity, bucket in sdg_buckets(timestamp.astimezone(dt_timezone.utc), now):
+                    counts[sdg, granularity, bucket] += 1
+        Rollup.objects.bulk_create(
+            [Rollup(sdg=sdg, granularity=granularity, bucket=bucket, views=views)
+             for (sdg, granularity, bucket), views in counts.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_portal', '0004_interaction_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionSDGRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('sdg', models.CharField(max_length=100)),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket', 'sdg'], name='admin_porta_granula_19b778_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sdg', 'granularity', 'bucket'), name='action_sdg_rollup_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EducationSDGRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('total', 'All time')], max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('sdg', models.CharField(max_length=100)),
+                ('views', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket', 'sdg'], name='admin_porta_granula_e21773_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sdg', 'granularity', 'bucket'), name='education_sdg_rollup_bucket')],
+            },
+        ),
+        migrations.RunPython(count_existing_views, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
 from sdg_education.models import EducationDb
 from sdg_actions.models import ActionDb
 
@@ -30,7 +33,8 @@ class EducationInteraction(models.Model):
     related_sdgs = models.TextField(null=True, blank=True)
     related_disciplines = models.TextField(null=True, blank=True)
     related_industries = models.TextField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # set by the interaction log to when the page was viewed, which can be before the row is written
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [
@@ -49,7 +53,8 @@ class ActionInteraction(models.Model):
 
     related_sdgs = models.TextField(null=True, blank=True)
     related_industries = models.TextField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # set by the interaction log to when the page was viewed, which can be before the row is written
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [
@@ -60,3 +65,111 @@ class ActionInteraction(models.Model):
     def __str__(self):
         return f"{self.userId or 'Anonymous'} viewed Action {self.actionId.id}"
 
+
+#Rollups of the interaction tables that the analytics endpoints read (see admin_portal/rollups.py)
+class RollupBucket(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    TOTAL = 'total'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day'), (TOTAL, 'All time')]
+
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    # start of the hour or day (UTC); the epoch for the all-time row
+    bucket = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+class ViewRollup(RollupBucket):
+    name = models.TextField()
+    views = models.PositiveIntegerField(default=0)
+    unique_users = models.PositiveIntegerField(default=0)
+    last_viewed = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+#Views of an education page per hour, day and all time
+class EducationViewRollup(ViewRollup):
+    educationId = models.ForeignKey(EducationDb, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["educationId", "granularity", "bucket"], name="education_rollup_bucket"),
+        ]
+        indexes = [models.Index(fields=["granularity", "bucket"])]
+
+#Views of an action page per hour, day and all time
+class ActionViewRollup(ViewRollup):
+    actionId = models.ForeignKey(ActionDb, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["actionId", "granularity", "bucket"], name="action_rollup_bucket"),
+        ]
+        indexes = [models.Index(fields=["granularity", "bucket"])]
+
+#Views of one page by one signed-in user
+class UserViewRollup(models.Model):
+    userId = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    name = models.TextField()
+    views = models.PositiveIntegerField(default=0)
+    last_viewed = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+class EducationUserRollup(UserViewRollup):
+    educationId = models.ForeignKey(EducationDb, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["educationId", "userId"], name="education_rollup_user"),
+        ]
+
+class ActionUserRollup(UserViewRollup):
+    actionId = models.ForeignKey(ActionDb, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["actionId", "userId"], name="action_rollup_user"),
+        ]
+
+#Views per SDG per hour, day and all time, counted as interactions are written
+class SDGViewRollup(RollupBucket):
+    sdg = models.CharField(max_length=100)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class EducationSDGRollup(SDGViewRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sdg", "granularity", "bucket"], name="education_sdg_rollup_bucket"),
+        ]
+        indexes = [models.Index(fields=["granularity", "bucket", "sdg"])]
+
+class ActionSDGRollup(SDGViewRollup):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sdg", "granularity", "bucket"], name="action_sdg_rollup_bucket"),
+        ]
+        indexes = [models.Index(fields=["granularity", "bucket", "sdg"])]
+
+#Highest interaction id folded into the rollups of a table
+class RollupWatermark(models.Model):
+    table = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table}: {self.last_id}"
+
+@receiver(post_save, sender=EducationInteraction)
+@receiver(post_save, sender=ActionInteraction)
+def count_interaction_sdgs(sender, instance, created, raw=False, **kwargs):
+    """Interactions saved one at a time; the interaction log counts its bulk inserts itself"""
+    if created and not raw:
+        from .rollups import count_sdg_views
+        count_sdg_views([instance])
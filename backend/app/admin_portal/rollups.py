@@ -0,0 +1,277 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import (ActionInteraction, ActionSDGRollup, ActionUserRollup, ActionViewRollup, EducationInteraction,
+                     EducationSDGRollup, EducationUserRollup, EducationViewRollup, RollupWatermark, ViewRollup)
+from .utils import time_range_filter
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# hourly buckets answer "past day" and "past week"; older ones are pruned
+HOURLY_RANGE = timedelta(days=7)
+HOURLY_RETENTION = timedelta(days=8)
+# interactions just below the watermark are read again on every refresh, so rows that
+# committed out of id order (concurrent flushes) are still counted; recomputing is idempotent
+ID_OVERLAP = 1000
+
+GRANULARITIES = {
+    ViewRollup.HOUR: (TruncHour, timedelta(hours=1)),
+    ViewRollup.DAY: (TruncDay, timedelta(days=1)),
+}
+
+
+class RollupSource:
+    """An interaction table and the rollups kept from it"""
+
+    def __init__(self, table, model, item_field, name_field, rollup_model, user_rollup_model, sdg_rollup_model):
+        self.table = table
+        self.model = model
+        self.item_field = item_field
+        self.name_field = name_field
+        self.rollup_model = rollup_model
+        self.user_rollup_model = user_rollup_model
+        self.sdg_rollup_model = sdg_rollup_model
+
+
+EDUCATION = RollupSource('education', EducationInteraction, 'educationId', 'educationName',
+                         EducationViewRollup, EducationUserRollup, EducationSDGRollup)
+ACTION = RollupSource('action', ActionInteraction, 'actionId', 'actionName',
+                      ActionViewRollup, ActionUserRollup, ActionSDGRollup)
+SOURCES = [EDUCATION, ACTION]
+SOURCE_BY_MODEL = {source.model: source for source in SOURCES}
+
+
+def upsert(model, objects, unique_fields, update_fields):
+    if not objects:
+        return
+    # MySQL upserts on any unique key and does not take the conflict target
+    target = unique_fields if connection.features.supports_update_conflicts_with_target else None
+    model.objects.bulk_create(objects, batch_size=500, update_conflicts=True,
+                              unique_fields=target, update_fields=update_fields)
+
+
+def refresh_rollups(now=None) -> int:
+    """Fold new interactions into the rollups of every table; returns how many interactions were new"""
+    return sum(refresh_source(source, now) for source in SOURCES)
+
+
+def refresh_source(source: RollupSource, now=None) -> int:
+    now = now or timezone.now()
+    watermark, _ = RollupWatermark.objects.get_or_create(table=source.table)
+    top = source.model.objects.aggregate(top=Max('id'))['top']
+    if top is None or top <= watermark.last_id:
+        return 0
+
+    new = source.model.objects.filter(id__gt=max(0, watermark.last_id - ID_OVERLAP), id__lte=top)
+    with transaction.atomic():
+        for granularity, (trunc, _) in GRANULARITIES.items():
+            recent = new.filter(timestamp__gte=now - HOURLY_RETENTION) if granularity == ViewRollup.HOUR else new
+            buckets = set(recent.annotate(bucket=trunc('timestamp')).values_list('bucket', flat=True).distinct())
+            recompute_buckets(source, granularity, buckets)
+        pairs = set(new.exclude(userId=None).values_list(source.item_field, 'userId').distinct())
+        recompute_users(source, pairs)
+        # after the per-user rows, which the all-time rows count their users from
+        items = set(new.values_list(source.item_field, flat=True).distinct())
+        recompute_totals(source, items)
+
+        for model in (source.rollup_model, source.sdg_rollup_model):
+            model.objects.filter(granularity=ViewRollup.HOUR, bucket__lt=now - HOURLY_RETENTION).delete()
+        RollupWatermark.objects.filter(pk=watermark.pk, last_id__lt=top).update(last_id=top)
+    return top - watermark.last_id
+
+
+def recompute_buckets(source, granularity, buckets):
+    """Count the views of every page in the given hour or day buckets from the interaction table"""
+    if not buckets:
+        return
+    trunc, step = GRANULARITIES[granularity]
+    rows = (
+        source.model.objects
+        .filter(timestamp__gte=min(buckets), timestamp__lt=max(buckets) + step)
+        .annotate(bucket=trunc('timestamp'))
+        .values('bucket', source.item_field)
+        .annotate(view_count=Count('id'), user_count=Count('userId', distinct=True),
+                  latest=Max('timestamp'), page_name=Max(source.name_field))
+        .order_by()
+    )
+    upsert(source.rollup_model, [
+        source.rollup_model(**{f'{source.item_field}_id': row[source.item_field]}, granularity=granularity,
+                            bucket=row['bucket'], name=row['page_name'], views=row['view_count'],
+                            unique_users=row['user_count'], last_viewed=row['latest'])
+        for row in rows if row['bucket'] in buckets
+    ], [source.item_field, 'granularity', 'bucket'], ['name', 'views', 'unique_users', 'last_viewed'])
+
+
+def recompute_totals(source, items):
+    """All-time rows: views summed from the daily rows, distinct users counted from the per-user rows"""
+    if not items:
+        return
+    item_filter = {f'{source.item_field}__in': items}
+    users = dict(
+        source.user_rollup_model.objects.filter(**item_filter).values(source.item_field)
+        .annotate(user_count=Count('id')).order_by()
+        .values_list(source.item_field, 'user_count')
+    )
+    days = (
+        source.rollup_model.objects.filter(granularity=ViewRollup.DAY, **item_filter)
+        .values(source.item_field)
+        .annotate(view_count=Sum('views'), latest=Max('last_viewed'), page_name=Max('name'))
+        .order_by()
+    )
+    upsert(source.rollup_model, [
+        source.rollup_model(**{f'{source.item_field}_id': row[source.item_field]}, granularity=ViewRollup.TOTAL,
+                            bucket=EPOCH, name=row['page_name'], views=row['view_count'],
+                            unique_users=users.get(row[source.item_field], 0), last_viewed=row['latest'])
+        for row in days
+    ], [source.item_field, 'granularity', 'bucket'], ['name', 'views', 'unique_users', 'last_viewed'])
+
+
+def recompute_users(source, pairs):
+    """Per-user rows for the (page, user) pairs that have new views"""
+    if not pairs:
+        return
+    rows = (
+        source.model.objects
+        .filter(**{f'{source.item_field}__in': {item for item, _ in pairs}},
+                userId__in={user for _, user in pairs})
+        .values(source.item_field, 'userId')
+        .annotate(view_count=Count('id'), latest=Max('timestamp'), page_name=Max(source.name_field))
+        .order_by()
+    )
+    upsert(source.user_rollup_model, [
+        source.user_rollup_model(**{f'{source.item_field}_id': row[source.item_field]}, userId_id=row['userId'],
+                                 name=row['page_name'], views=row['view_count'], last_viewed=row['latest'])
+        for row in rows if (row[source.item_field], row['userId']) in pairs
+    ], [source.item_field, 'userId'], ['name', 'views', 'last_viewed'])
+
+
+def split_sdgs(related_sdgs):
+    """The SDGs of an interaction's comma-separated `related_sdgs`"""
+    if isinstance(related_sdgs, list):
+        # still the page's MultiSelectField value, which is saved comma-joined
+        related_sdgs = ','.join(related_sdgs)
+    return [sdg.strip() for sdg in (related_sdgs or '').split(',') if sdg.strip()]
+
+
+def sdg_buckets(timestamp, now=None):
+    """The (granularity, bucket) of every SDG rollup row a view at `timestamp` counts towards"""
+    buckets = [(ViewRollup.DAY, timestamp.replace(hour=0, minute=0, second=0, microsecond=0)),
+               (ViewRollup.TOTAL, EPOCH)]
+    if timestamp >= (now or timezone.now()) - HOURLY_RETENTION:
+        buckets.append((ViewRollup.HOUR, timestamp.replace(minute=0, second=0, microsecond=0)))
+    return buckets
+
+
+def count_sdg_views(interactions, now=None):
+    """
+    Add newly written interactions to the SDG rollups of their table.
+
+    Call it in the transaction that writes them, so a batch that is rolled back
+    (and retried by the interaction log) is not counted twice.
+    """
+    counts = Counter()
+    for interaction in interactions:
+        timestamp = interaction.timestamp.astimezone(dt_timezone.utc)
+        for sdg in split_sdgs(interaction.related_sdgs):
+            for granularity, bucket in sdg_buckets(timestamp, now):
+                counts[sdg, granularity, bucket] += 1
+    if counts:
+        add_sdg_views(SOURCE_BY_MODEL[type(interactions[0])].sdg_rollup_model, counts)
+
+
+def add_sdg_views(model, counts):
+    # in key order, so concurrent batches lock shared rows in the same order instead of deadlocking
+    for (sdg, granularity, bucket), views in sorted(counts.items()):
+        rows = model.objects.filter(sdg=sdg, granularity=granularity, bucket=bucket)
+        if rows.update(views=F('views') + views):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(sdg=sdg, granularity=granularity, bucket=bucket, views=views)
+        except IntegrityError:
+            # another process created the row first
+            rows.update(views=F('views') + views)
+
+
+def rebuild_sdg_rollups(interaction_model, sdg_rollup_model):
+    """Count the SDG views of a whole interaction table again, streaming it in chunks"""
+    now = timezone.now()
+    counts = Counter()
+    rows = interaction_model.objects.exclude(related_sdgs=None).values_list('related_sdgs', 'timestamp')
+    for related_sdgs, timestamp in rows.iterator(chunk_size=2000):
+        for sdg in split_sdgs(related_sdgs):
+            for granularity, bucket in sdg_buckets(timestamp.astimezone(dt_timezone.utc), now):
+                counts[sdg, granularity, bucket] += 1
+    sdg_rollup_model.objects.all().delete()
+    sdg_rollup_model.objects.bulk_create(
+        [sdg_rollup_model(sdg=sdg, granularity=granularity, bucket=bucket, views=views)
+         for (sdg, granularity, bucket), views in counts.items()], batch_size=500)
+
+
+def rebuild_rollups():
+    """Drop every rollup and fold in the interaction tables from the start"""
+    with transaction.atomic():
+        for source in SOURCES:
+            source.rollup_model.objects.all().delete()
+            source.user_rollup_model.objects.all().delete()
+            rebuild_sdg_rollups(source.model, source.sdg_rollup_model)
+        RollupWatermark.objects.filter(table__in=[source.table for source in SOURCES]).delete()
+    return refresh_rollups()
+
+
+def rollup_window(time_range, now=None):
+    """
+    The granularity and first bucket that answer a `time_range_filter` range.
+
+    The bucket holding the start of the range is counted whole, so a range can
+    include up to an hour (or a day, past a week) more than it names.
+    """
+    since = time_range_filter(time_range)
+    if since is None:
+        return ViewRollup.TOTAL, None
+    if (now or timezone.now()) - since <= HOURLY_RANGE:
+        return ViewRollup.HOUR, since.replace(minute=0, second=0, microsecond=0)
+    return ViewRollup.DAY, since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def top_pages(source, time_range, limit=20):
+    """Most viewed pages in the range, most recently viewed first on ties"""
+    granularity, since = rollup_window(time_range)
+    rollups = source.rollup_model.objects.filter(granularity=granularity)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=since)
+    return (
+        rollups
+        .values(source.item_field)
+        .annotate(**{source.name_field: Max('name')}, total_views=Sum('views'), last_accessed=Max('last_viewed'))
+        .order_by("-total_views", "-last_accessed")[:limit]
+    )
+
+
+def total_views(source, item_id):
+    total = source.rollup_model.objects.filter(
+        **{f'{source.item_field}_id': item_id}, granularity=ViewRollup.TOTAL).values_list('views', flat=True).first()
+    return total or 0
+
+
+def user_pages(source, user_id):
+    """Pages a user viewed, most recent first"""
+    return (
+        source.user_rollup_model.objects.filter(userId=user_id)
+        .values(source.item_field, **{source.name_field: F('name')}, count=F('views'), last_accessed=F('last_viewed'))
+        .order_by("-last_accessed")
+    )
+
+
+def top_sdgs(source, time_range, limit=5):
+    """Most viewed SDGs in the range, summed from the SDG rollups"""
+    granularity, since = rollup_window(time_range)
+    rollups = source.sdg_rollup_model.objects.filter(granularity=granularity)
+    if since is not None:
+        rollups = rollups.filter(bucket__gte=since)
+    return rollups.values('sdg').annotate(total_views=Sum('views')).order_by('-total_views', 'sdg')[:limit]
+
@@ -1,11 +1,28 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from importlib import import_module
+from unittest import mock
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from django.test import TransactionTestCase
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
 from django.contrib.auth.models import User
 from teams.models import Team, TeamMember
 from sdg_education.models import EducationDb
 from sdg_actions.models import ActionDb
 from admin_portal.models import EducationInteraction, ActionInteraction
+from admin_portal.interaction_log import InteractionLog
+from admin_portal.rollups import rebuild_rollups, refresh_rollups
+from admin_portal.models import (ActionSDGRollup, ActionUserRollup, ActionViewRollup, EducationUserRollup,
+                                 RollupWatermark, ViewRollup)
+from django.apps import apps
 from sdg_action_plan.models import SDGActionPlan
 from datetime import timedelta
 from django.utils import timezone
@@ -13,6 +30,12 @@ from django.utils import timezone
 class AdminPortalTests(APITestCase):
     def setUp(self):
         self.client = APIClient()
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        self.interaction_log = InteractionLog(spool_dir=spool_dir, background=False)
+        patcher = mock.patch('admin_portal.views.interaction_log', self.interaction_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
         # Create users
         self.admin_user = User.objects.create_superuser(username='AdminUser', email='admin@example.com', password='adminpass')
@@ -67,6 +90,8 @@ class AdminPortalTests(APITestCase):
         self.action_interaction_url = reverse('logActionInteraction')
         self.client.post(self.education_interaction_url, {'educationId': self.education1.id}, format='json')
         self.client.post(self.action_interaction_url, {'actionId': self.action1.id}, format='json')
+        self.interaction_log.flush()
+        refresh_rollups()
 
     def authenticate_as_admin(self):
         self.client.force_authenticate(user=self.admin_user)
@@ -131,14 +156,29 @@ class AdminPortalTests(APITestCase):
     def test_log_education_interaction(self):
         self.client.force_authenticate(user=self.user1)
         response = self.client.post(self.education_interaction_url, {'educationId': self.education2.id}, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['educationName'], 'Education 2')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.interaction_log.flush(), 1)
+        interaction = EducationInteraction.objects.get(educationId=self.education2)
+        self.assertEqual((interaction.educationName, interaction.userId), ('Education 2', self.user1))
 
     def test_log_action_interaction(self):
         self.client.force_authenticate(user=self.user1)
         response = self.client.post(self.action_interaction_url, {'actionId': self.action2.id}, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['actionName'], 'Action 2')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.interaction_log.flush(), 1)
+        self.assertEqual(ActionInteraction.objects.get(actionId=self.action2).actionName, 'Action 2')
+
+    def test_log_interaction_does_not_query_database(self):
+        self.client.force_authenticate(user=None)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.action_interaction_url, {'actionId': self.action2.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(self.interaction_log), 1)
+
+    def test_log_interaction_invalid_id(self):
+        response = self.client.post(self.action_interaction_url, {'actionId': 'abc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.interaction_log), 0)
 
     ### View Counts and Analytics Tests 
 
@@ -202,4 +242,284 @@ class AdminPortalTests(APITestCase):
         url = reverse('allSDGPlansCount')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn('total_count', response.data)
\ No newline at end of file
+        self.assertIn('total_count', response.data)
+
+class InteractionLogTestCase(APITestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        self.log = InteractionLog(spool_dir=self.spool_dir, batch_size=3, background=False)
+        self.user = User.objects.create_user(username='Viewer', password='viewerpass')
+        self.education = EducationDb.objects.create(title='Education 1', sdgs_related=['SDG1'])
+        self.action = ActionDb.objects.create(actions='Action 1', sdgs=['SDG5'])
+
+    def spool_files(self):
+        return sorted(os.listdir(self.spool_dir))
+
+    def test_flush_writes_batch_with_page_details(self):
+        viewed_at = timezone.now() - timedelta(hours=2)
+        with mock.patch.object(self.log, 'clock', return_value=viewed_at):
+            self.log.record('education', self.education.id, self.user.id)
+        self.log.record('action', self.action.id)
+        self.log.record('action', self.action.id)
+
+        # the users, one lookup per kind and one INSERT per table, inside a savepoint in tests;
+        # then an UPDATE of the hour, day and all-time count of each SDG (created on first use)
+        with self.assertNumQueries(5 + 2 + 2 * 3 * 4):
+            self.assertEqual(self.log.flush(), 3)
+        education_view = EducationInteraction.objects.get()
+        self.assertEqual((education_view.educationName, education_view.userId, education_view.timestamp),
+                         ('Education 1', self.user, viewed_at))
+        self.assertEqual(ActionInteraction.objects.filter(actionId=self.action, userId=None).count(), 2)
+        self.assertEqual((len(self.log), self.spool_files()), (0, []))
+
+    def test_events_for_missing_pages_and_users_are_dropped_or_anonymised(self):
+        self.log.record('action', 999)
+        self.log.record('action', self.action.id, user_id=999)
+        self.assertEqual(self.log.flush(), 1)
+        self.assertIsNone(ActionInteraction.objects.get().userId)
+
+    def test_full_batch_wakes_flusher(self):
+        self.log.record('action', self.action.id)
+        self.log.record('action', self.action.id)
+        self.assertFalse(self.log._wake.is_set())
+        self.log.record('action', self.action.id)
+        self.assertTrue(self.log._wake.is_set())
+
+    def test_spool_of_crashed_process_is_recovered(self):
+        self.log.record('action', self.action.id)
+        self.log.record('education', self.education.id)
+        # the process dies: its lock goes away with it, its memory batch is lost, a line is cut short
+        self.log._spool.file.write('["action", ')
+        self.log._spool.close()
+
+        restarted = InteractionLog(spool_dir=self.spool_dir, background=False)
+        self.assertEqual(restarted.flush(), 2)
+        self.assertEqual((ActionInteraction.objects.count(), EducationInteraction.objects.count()), (1, 1))
+        self.assertEqual(self.spool_files(), [])
+
+    def test_spool_in_use_by_another_log_is_left_alone(self):
+        self.log.record('action', self.action.id)
+        other = InteractionLog(spool_dir=self.spool_dir, background=False)
+        self.assertEqual(other.flush(), 0)
+        self.assertEqual(self.log.flush(), 1)
+
+    def test_failed_insert_is_retried_from_disk(self):
+        self.log.record('action', self.action.id)
+        with mock.patch.object(InteractionLog, 'insert', side_effect=RuntimeError('database is down')):
+            self.assertEqual(self.log.flush(), 0)
+        self.assertEqual(len(self.spool_files()), 1)
+        self.assertEqual(ActionInteraction.objects.count(), 0)
+
+        self.assertEqual(self.log.flush(), 1)
+        self.assertEqual((ActionInteraction.objects.count(), self.spool_files()), (1, []))
+
+    def test_untitled_pages_are_logged_with_an_empty_name(self):
+        self.log.record('education', EducationDb.objects.create(title=None).id)
+        self.log.record('action', ActionDb.objects.create(actions=None).id)
+        self.log.record('action', self.action.id)
+        self.assertEqual(self.log.flush(), 3)
+        self.assertEqual(EducationInteraction.objects.get().educationName, '')
+        self.assertEqual(sorted(ActionInteraction.objects.values_list('actionName', flat=True)), ['', 'Action 1'])
+
+    def test_events_that_never_insert_do_not_hold_back_their_batch(self):
+        insert = InteractionLog.insert
+
+        def reject_education(log, events):
+            if any(kind == 'education' for kind, *_ in events):
+                raise IntegrityError('NOT NULL constraint failed')
+            return insert(log, events)
+
+        self.log.record('action', self.action.id)
+        self.log.record('education', self.education.id)
+        self.log.record('action', self.action.id)
+        with mock.patch.object(InteractionLog, 'insert', autospec=True, side_effect=reject_education):
+            self.assertEqual(self.log.flush(), 2)
+            self.assertEqual(self.log.flush(), 0)
+        self.assertEqual(ActionInteraction.objects.count(), 2)
+        # the rejected event is set aside rather than retried
+        [failed] = self.spool_files()
+        self.assertTrue(failed.endswith('.failed'))
+        with open(os.path.join(self.spool_dir, failed)) as f:
+            self.assertEqual([json.loads(line)[:2] for line in f], [['education', self.education.id]])
+
+    def test_capacity_moves_batch_to_disk(self):
+        log = InteractionLog(spool_dir=self.spool_dir, batch_size=10, capacity=2, background=False)
+        for _ in range(3):
+            log.record('action', self.action.id)
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log.flush(), 3)
+
+
+class InteractionLogWorkerTestCase(TransactionTestCase):
+    def test_thread_flushes_full_batch(self):
+        action = ActionDb.objects.create(actions='Action 1')
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        log = InteractionLog(spool_dir=spool_dir, batch_size=2, flush_interval=60)
+        self.addCleanup(log.stop, 5)
+
+        log.record('action', action.id)
+        log.record('action', action.id)
+        for _ in range(50):
+            if ActionInteraction.objects.count() == 2:
+                break
+            time.sleep(0.1)
+        self.assertEqual(ActionInteraction.objects.count(), 2)
+
+
+class InteractionRollupTestCase(APITestCase):
+    def setUp(self):
+        # half past the previous hour, so views a few minutes apart share an hourly bucket
+        # whenever the tests run, and the ranges measured from the real time still cover them
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0) - timedelta(hours=1)
+        self.user = User.objects.create_user(username='Viewer', password='viewerpass')
+        self.other = User.objects.create_user(username='Other', password='otherpass')
+        self.action1 = ActionDb.objects.create(actions='Action 1', sdgs=['SDG5'])
+        self.action2 = ActionDb.objects.create(actions='Action 2', sdgs=['SDG7'])
+        self.education = EducationDb.objects.create(title='Education 1')
+
+    def view(self, action, ago, user=None):
+        # the SDGs are copied as the log does, from the saved page
+        action = ActionDb.objects.get(pk=action.pk)
+        return ActionInteraction.objects.create(
+            actionId=action, actionName=action.actions, related_sdgs=action.sdgs, userId=user,
+            timestamp=self.now - ago)
+
+    def top_actions(self, time_range):
+        response = self.client.post(reverse('topActions'), {'time_range': time_range}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['actionName'], item['total_views']) for item in response.data]
+
+    def test_ranges_are_answered_from_rollups(self):
+        self.view(self.action1, timedelta(minutes=5), self.user)
+        self.view(self.action1, timedelta(minutes=10), self.user)
+        for days in (3, 3, 3, 40):
+            self.view(self.action2, timedelta(days=days), self.other)
+        self.view(self.action1, timedelta(days=400))
+        refresh_rollups(now=self.now)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.top_actions('past day'), [('Action 1', 2)])
+            self.assertEqual(self.top_actions('past week'), [('Action 2', 3), ('Action 1', 2)])
+            self.assertEqual(self.top_actions('past 6 months'), [('Action 2', 4), ('Action 1', 2)])
+            self.assertEqual(self.top_actions('all time'), [('Action 2', 4), ('Action 1', 3)])
+        self.assertFalse(any('actioninteraction' in query['sql'] for query in queries.captured_queries))
+
+        total = ActionViewRollup.objects.get(actionId=self.action1, granularity=ViewRollup.TOTAL)
+        self.assertEqual((total.views, total.unique_users), (3, 1))
+
+    def test_refresh_folds_in_only_new_interactions(self):
+        self.view(self.action1, timedelta(minutes=5), self.user)
+        self.assertEqual(refresh_rollups(now=self.now), 1)
+        with self.assertNumQueries(4):
+            # a watermark and a MAX(id) per table; nothing new, so nothing recomputed
+            self.assertEqual(refresh_rollups(now=self.now), 0)
+
+        self.view(self.action1, timedelta(minutes=1), self.other)
+        self.assertEqual(refresh_rollups(now=self.now), 1)
+        hour = ActionViewRollup.objects.get(actionId=self.action1, granularity=ViewRollup.HOUR,
+                                            bucket__lte=self.now - timedelta(minutes=5))
+        self.assertEqual((hour.views, hour.unique_users), (2, 2))
+        self.assertEqual(RollupWatermark.objects.get(table='action').last_id, ActionInteraction.objects.latest('id').id)
+
+    def test_view_counts_and_user_pages(self):
+        self.view(self.action1, timedelta(hours=2), self.user)
+        self.view(self.action1, timedelta(hours=1), self.user)
+        EducationInteraction.objects.create(
+            educationId=self.education, educationName='Education 1', userId=self.user, timestamp=self.now)
+        refresh_rollups(now=self.now)
+
+        self.client.force_authenticate(user=User.objects.create_superuser(username='Admin', password='adminpass'))
+        response = self.client.get(reverse('actionViewCount', kwargs={'action_id': self.action1.id}))
+        self.assertEqual(response.data['total_views'], 2)
+        response = self.client.get(reverse('actionViewCount', kwargs={'action_id': self.action2.id}))
+        self.assertEqual(response.data['total_views'], 0)
+
+        response = self.client.get(reverse('userInteractions', kwargs={'user_id': self.user.id}))
+        self.assertEqual([(item['actionName'], item['count']) for item in response.data['action_plans_viewed']],
+                         [('Action 1', 2)])
+        self.assertEqual(response.data['education_pages_viewed'][0]['educationId'], self.education.id)
+        self.assertEqual(EducationUserRollup.objects.get().views, 1)
+
+    def test_old_hourly_buckets_are_pruned(self):
+        self.view(self.action1, timedelta(days=2))
+        refresh_rollups(now=self.now)
+        self.assertTrue(ActionViewRollup.objects.filter(granularity=ViewRollup.HOUR).exists())
+
+        self.view(self.action1, timedelta(minutes=1))
+        refresh_rollups(now=self.now + timedelta(days=7))
+        self.assertEqual(ActionViewRollup.objects.filter(granularity=ViewRollup.HOUR).count(), 1)
+        self.assertEqual(ActionViewRollup.objects.get(granularity=ViewRollup.TOTAL).views, 2)
+
+    def test_command_rebuilds_rollups(self):
+        self.view(self.action1, timedelta(minutes=5))
+        refresh_rollups(now=self.now)
+        ActionViewRollup.objects.update(views=99)
+
+        out = StringIO()
+        call_command('rollup_interactions', '--rebuild', stdout=out)
+        self.assertIn('Rebuilt rollups from 1 interactions', out.getvalue())
+        self.assertEqual(ActionViewRollup.objects.get(granularity=ViewRollup.TOTAL).views, 1)
+
+    def test_migration_rolls_up_existing_interactions(self):
+        self.view(self.action1, timedelta(minutes=5), self.user)
+        self.view(self.action1, timedelta(days=3), self.other)
+        self.view(self.action1, timedelta(days=3), self.other)
+        self.view(self.action2, timedelta(days=40))
+
+        def rollups():
+            return (sorted(ActionViewRollup.objects.values_list(
+                        'actionId', 'granularity', 'bucket', 'views', 'unique_users', 'last_viewed')),
+                    sorted(ActionUserRollup.objects.values_list('actionId', 'userId', 'views', 'last_viewed')))
+
+        rebuild_rollups()
+        expected = rollups()
+        ActionViewRollup.objects.all().delete()
+        ActionUserRollup.objects.all().delete()
+        RollupWatermark.objects.all().delete()
+
+        import_module('admin_portal.migrations.0004_interaction_rollups').fold_existing_views(apps, None)
+        self.assertEqual(rollups(), expected)
+        total = ActionViewRollup.objects.get(actionId=self.action1, granularity=ViewRollup.TOTAL)
+        self.assertEqual((total.views, total.unique_users), (3, 2))
+        # the watermark is where the rollups left off
+        self.assertEqual(refresh_rollups(), 0)
+
+    def test_top_sdgs_are_summed_from_sdg_counts(self):
+        ActionDb.objects.filter(pk=self.action1.pk).update(sdgs='5,6')
+        ActionDb.objects.filter(pk=self.action2.pk).update(sdgs='7')
+        self.view(self.action1, timedelta(minutes=5))
+        self.view(self.action2, timedelta(minutes=5))
+        self.view(self.action2, timedelta(days=3))
+        self.view(self.action2, timedelta(days=90))
+        self.assertEqual(ActionSDGRollup.objects.get(sdg='7', granularity=ViewRollup.TOTAL).views, 3)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse('topActionSdgs')
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {'time_range': 'past day'}, format='json')
+        self.assertEqual([(item['sdg'], item['total_views']) for item in response.data],
+                         [('5', 1), ('6', 1), ('7', 1)])
+        response = self.client.post(url, {'time_range': 'past month'}, format='json')
+        self.assertEqual(response.data[0], {'sdg': '7', 'sdg_name': 'Affordable and Clean Energy', 'total_views': 2})
+        response = self.client.post(url, {'time_range': 'all time'}, format='json')
+        self.assertEqual(response.data[0]['total_views'], 3)
+
+    def test_rebuild_recounts_sdgs(self):
+        self.view(self.action2, timedelta(minutes=5))
+        ActionSDGRollup.objects.all().delete()
+        call_command('rollup_interactions', '--rebuild', stdout=StringIO())
+        self.assertEqual(ActionSDGRollup.objects.get(sdg='SDG7', granularity=ViewRollup.DAY).views, 1)
+
+    def test_migration_counts_existing_sdg_views(self):
+        ActionDb.objects.filter(pk=self.action1.pk).update(sdgs='5,6')
+        self.view(self.action1, timedelta(minutes=5))
+        self.view(self.action2, timedelta(days=30))
+        expected = sorted(ActionSDGRollup.objects.values_list('sdg', 'granularity', 'bucket', 'views'))
+        ActionSDGRollup.objects.all().delete()
+
+        import_module('admin_portal.migrations.0005_sdg_rollups').count_existing_views(apps, None)
+        self.assertEqual(sorted(ActionSDGRollup.objects.values_list('sdg', 'granularity', 'bucket', 'views')),
+                         expected)
+
@@ -1,20 +1,16 @@
+from asgiref.sync import sync_to_async
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from teams.models import Team, TeamMember
 from teams.serializers import TeamMemberSerializer
 from rest_framework.permissions import BasePermission
-from .models import EducationInteraction, ActionInteraction
-from .serializers import EducationInteractionSerializer, ActionInteractionSerializer
-from sdg_education.models import EducationDb
-from sdg_actions.models import ActionDb
+from .interaction_log import interaction_log
+from . import rollups
 from sdg_action_plan.models import SDGActionPlan
-from django.utils.timezone import now
-from django.db.models import Sum, Max, F, Count
-from django.db import models
 from .utils import time_range_filter
-from collections import Counter
 from .utils import get_sdg_name
+from catalogue.async_views import AsyncViewMixin
 
 # Helper permission class to check is_staff or is_superuser
 class IsSiteAdmin(BasePermission):
@@ -118,50 +114,44 @@ class AdminUpdateRoleView(generics.GenericAPIView):
 
         return Response({"message": f"{username} changed to {new_role}."}, status=status.HTTP_200_OK)
 
-###Function to log an education interaction
-class LogEducationInteractionView(generics.CreateAPIView):
-    serializer_class = EducationInteractionSerializer
+###Base view for logging page views; events are queued and written in batches
+class LogInteractionView(AsyncViewMixin, generics.GenericAPIView):
     permission_classes = []
+    kind = None
+    id_field = None
 
     def post(self, request, *args, **kwargs):
-        education_id = request.data.get('educationId')
-        education = EducationDb.objects.get(id=education_id)
-        user = request.user if request.user.is_authenticated else None
-
-        #Create education interaction object
-        interaction = EducationInteraction.objects.create(
-            userId=user,
-            educationId=education,
-            educationName=education.title,
-            related_sdgs=education.sdgs_related,
-            related_disciplines=education.related_to_which_discipline,
-            related_industries=education.useful_for_which_industries
-        )
-
-        serializer = self.get_serializer(interaction)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        event = self.parse_event(request)
+        if isinstance(event, Response):
+            return event
+        interaction_log.record(self.kind, *event)
+        return Response({"message": "Interaction recorded."}, status=status.HTTP_202_ACCEPTED)
+
+    async def apost(self, request, *args, **kwargs):
+        event = self.parse_event(request)
+        if isinstance(event, Response):
+            return event
+        # record() can create, lock and rename spool files, so it stays off the event loop
+        await sync_to_async(interaction_log.record, thread_sensitive=False)(self.kind, *event)
+        return Response({"message": "Interaction recorded."}, status=status.HTTP_202_ACCEPTED)
+
+    def parse_event(self, request):
+        """(item id, user id) of the page view, or a 400 response"""
+        try:
+            item_id = int(request.data.get(self.id_field))
+        except (TypeError, ValueError):
+            return Response({self.id_field: "A valid integer is required."}, status=status.HTTP_400_BAD_REQUEST)
+        return item_id, request.user.id if request.user.is_authenticated else None
 
-###Function to log an action interaction
-class LogActionInteractionView(generics.CreateAPIView):
-    serializer_class = ActionInteractionSerializer
-    permission_classes = []
+###Function to log an education interaction
+class LogEducationInteractionView(LogInteractionView):
+    kind = 'education'
+    id_field = 'educationId'
 
-    def post(self, request, *args, **kwargs):
-        action_id = request.data.get('actionId')
-        action = ActionDb.objects.get(id=action_id)
-        user = request.user if request.user.is_authenticated else None
-
-        #Create an action interaction object
-        interaction = ActionInteraction.objects.create(
-            userId=user,
-            actionId=action,
-            actionName=action.actions,
-            related_sdgs=action.sdgs,
-            related_industries=action.related_industry
-        )
-
-        serializer = self.get_serializer(interaction)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+###Function to log an action interaction
+class LogActionInteractionView(LogInteractionView):
+    kind = 'action'
+    id_field = 'actionId'
 
 # Function to show how many times an education page has been viewed
 class EducationViewCountView(generics.GenericAPIView):
@@ -169,8 +159,7 @@ class EducationViewCountView(generics.GenericAPIView):
 
     def get(self, request, *args, **kwargs):
         education_id = kwargs.get('education_id')
-        total_views = EducationInteraction.objects.filter(
-            educationId=education_id).aggregate(total=Count('id'))['total'] or 0
+        total_views = rollups.total_views(rollups.EDUCATION, education_id)
         return Response({"education_id": education_id, "total_views": total_views}, status=status.HTTP_200_OK)
 
 ### Function to show how many times an action page has been viewed
@@ -179,8 +168,7 @@ class ActionViewCountView(generics.GenericAPIView):
 
     def get(self, request, *args, **kwargs):
         action_id = kwargs.get('action_id')
-        total_views = ActionInteraction.objects.filter(
-            actionId=action_id).aggregate(total=Count('id'))['total'] or 0
+        total_views = rollups.total_views(rollups.ACTION, action_id)
         return Response({"action_id": action_id, "total_views": total_views}, status=status.HTTP_200_OK)
 
 ### Function to show the education/action pages a user has viewed, sorted by their most recently viewed
@@ -190,19 +178,8 @@ class UserInteractionsView(generics.GenericAPIView):
     def get(self, request, *args, **kwargs):
         user_id = kwargs.get("user_id")
 
-        educations = (
-            EducationInteraction.objects.filter(userId=user_id)
-            .values("educationId", "educationName")
-            .annotate(count=models.Count("id"), last_accessed=Max("timestamp"))
-            .order_by("-last_accessed")
-        )
-
-        actions = (
-            ActionInteraction.objects.filter(userId=user_id)
-            .values("actionId", "actionName")
-            .annotate(count=models.Count("id"), last_accessed=Max("timestamp"))
-            .order_by("-last_accessed")
-        )
+        educations = rollups.user_pages(rollups.EDUCATION, user_id)
+        actions = rollups.user_pages(rollups.ACTION, user_id)
 
         # Formats date-time into human readable string
         for item in educations:
@@ -217,61 +194,44 @@ class UserInteractionsView(generics.GenericAPIView):
             "action_plans_viewed": list(actions)
         }, status=status.HTTP_200_OK)
 
+#Convert to human readable string
+def format_last_accessed(item):
+    item["last_accessed"] = item["last_accessed"].strftime('%d %b %Y, %I:%M:%S %p')
+    return item
+
 ### Function to return the top education pages based on view count
-class TopEducationsView(generics.GenericAPIView):
+class TopEducationsView(AsyncViewMixin, generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        time_range = request.data.get("time_range", "all time")
-        time_filter = time_range_filter(time_range)
-
-        # Filter based on time
-        queryset = EducationInteraction.objects.all()
-        if time_filter:
-            queryset = queryset.filter(timestamp__gte=time_filter)
-
-        #Sort by total views, then most recently accessed to break ties
-        top_educations = (
-            queryset
-            .values("educationId", "educationName")
-            .annotate(total_views=Count("id"), last_accessed=Max("timestamp"))
-            .order_by("-total_views", "-last_accessed")[:20]
-        )
-
-        #Convert to human readable string
-        for item in top_educations:
-            item["last_accessed"] = item["last_accessed"].strftime(
-                '%d %b %Y, %I:%M:%S %p')
+        top_educations = [format_last_accessed(item) for item in self.get_queryset()]
+        return Response(top_educations, status=status.HTTP_200_OK)
+
+    async def apost(self, request):
+        top_educations = [format_last_accessed(item) async for item in self.get_queryset().aiterator()]
+        return Response(top_educations, status=status.HTTP_200_OK)
 
-        return Response(list(top_educations), status=status.HTTP_200_OK)
+    def get_queryset(self):
+        # answered from the hourly/daily rollups, not the interaction table
+        time_range = self.request.data.get("time_range", "all time")
+        return rollups.top_pages(rollups.EDUCATION, time_range)
 
 ### Function to return the top action pages based on view count
-class TopActionsView(generics.GenericAPIView):
+class TopActionsView(AsyncViewMixin, generics.GenericAPIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        time_range = request.data.get("time_range", "all time")
-        time_filter = time_range_filter(time_range)
-
-        #Filter based on time
-        queryset = ActionInteraction.objects.all()
-        if time_filter:
-            queryset = queryset.filter(timestamp__gte=time_filter)
-
-        #Sort by total views, then most recently accessed to break ties
-        top_actions = (
-            queryset
-            .values("actionId", "actionName")
-            .annotate(total_views=Count("id"), last_accessed=Max("timestamp"))
-            .order_by("-total_views", "-last_accessed")[:20]
-        )
-
-        #Convert to human readable string
-        for item in top_actions:
-            item["last_accessed"] = item["last_accessed"].strftime(
-                '%d %b %Y, %I:%M:%S %p')
+        top_actions = [format_last_accessed(item) for item in self.get_queryset()]
+        return Response(top_actions, status=status.HTTP_200_OK)
 
-        return Response(list(top_actions), status=status.HTTP_200_OK)
+    async def apost(self, request):
+        top_actions = [format_last_accessed(item) async for item in self.get_queryset().aiterator()]
+        return Response(top_actions, status=status.HTTP_200_OK)
+
+    def get_queryset(self):
+        # answered from the hourly/daily rollups, not the interaction table
+        time_range = self.request.data.get("time_range", "all time")
+        return rollups.top_pages(rollups.ACTION, time_range)
 
 ### Function to return the top sdgs related to education pages based on view count
 class TopEducationSDGsView(generics.GenericAPIView):
@@ -279,23 +239,11 @@ class TopEducationSDGsView(generics.GenericAPIView):
 
     def post(self, request):
         time_range = request.data.get("time_range", "all time")
-        time_filter = time_range_filter(time_range)
-
-        #Filter based on time
-        queryset = EducationInteraction.objects.all()
-        if time_filter:
-            queryset = queryset.filter(timestamp__gte=time_filter)
 
-        # Extracts and counts all SDG appearances from the queryset
-        all_sdgs = []
-        for entry in queryset:
-            if entry.related_sdgs:
-                all_sdgs.extend([sdg.strip()
-                                for sdg in entry.related_sdgs.split(',')])
-
-        counter = Counter(all_sdgs)
-        top_sdgs = counter.most_common(5)
-        return Response([{"sdg": sdg, "sdg_name": get_sdg_name(sdg), "total_views": count} for sdg, count in top_sdgs], status=status.HTTP_200_OK)
+        # Summed in SQL from the per-hour/day SDG counts kept as interactions are written
+        top_sdgs = rollups.top_sdgs(rollups.EDUCATION, time_range)
+        return Response([{"sdg": row["sdg"], "sdg_name": get_sdg_name(row["sdg"]), "total_views": row["total_views"]}
+                         for row in top_sdgs], status=status.HTTP_200_OK)
 
 
 ### Function to return the top sdgs related to action pages based on view count
@@ -304,23 +252,11 @@ class TopActionSDGsView(generics.GenericAPIView):
 
     def post(self, request):
         time_range = request.data.get("time_range", "all time")
-        time_filter = time_range_filter(time_range)
-
-        #Filter based on time
-        queryset = ActionInteraction.objects.all()
-        if time_filter:
-            queryset = queryset.filter(timestamp__gte=time_filter)
-
-        # Extracts and counts all SDG appearances from the queryset
-        all_sdgs = []
-        for entry in queryset:
-            if entry.related_sdgs:
-                all_sdgs.extend([sdg.strip()
-                                for sdg in entry.related_sdgs.split(',')])
-
-        counter = Counter(all_sdgs)
-        top_sdgs = counter.most_common(5)
-        return Response([{"sdg": sdg, "sdg_name": get_sdg_name(sdg), "total_views": count} for sdg, count in top_sdgs], status=status.HTTP_200_OK)
+
+        # Summed in SQL from the per-hour/day SDG counts kept as interactions are written
+        top_sdgs = rollups.top_sdgs(rollups.ACTION, time_range)
+        return Response([{"sdg": row["sdg"], "sdg_name": get_sdg_name(row["sdg"]), "total_views": row["total_views"]}
+                         for row in top_sdgs], status=status.HTTP_200_OK)
 
 
 ### Function to get all sdg plans as an admin
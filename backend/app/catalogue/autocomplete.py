@@ -0,0 +1,183 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from .live_index import LiveIndex
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+ACTION = 'action'
+EDUCATION = 'education'
+KEYWORD = 'keyword'
+KINDS = (ACTION, EDUCATION, KEYWORD)
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase text and reduce it to single-space separated words"""
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+class PrefixIndex:
+    """
+    Sorted array of labels answering prefix queries with bisect.
+
+    A label is stored once per word it contains (up to MAX_WORD_STARTS), keyed on
+    the normalized text from that word onwards plus a trailing space. Typing any
+    word of a title therefore finds it. A typed trailing space only matches whole
+    words.
+
+    Entries are `(key, word_position, kind, id, label)`. A lookup bisects to the
+    first key >= prefix and walks forward while keys still start with it.
+    """
+
+    MAX_WORD_STARTS = 8
+    # Upper bound on the entries walked per lookup, so one-letter prefixes stay cheap
+    MAX_SCAN = 400
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries: List[Tuple[str, int, str, object, str]] = []
+            self._keys_by_item: Dict[Tuple[str, object], List[Tuple]] = {}
+
+    def __len__(self):
+        return len(self._keys_by_item)
+
+    def replace_with(self, other: 'PrefixIndex'):
+        """Take over the contents of another index, e.g. one loaded off to the side"""
+        with self._lock:
+            self._entries = other._entries
+            self._keys_by_item = other._keys_by_item
+
+    @classmethod
+    def _entries_for(cls, kind, item_id, label):
+        words = normalize(label).split(' ')
+        if not words[0]:
+            return []
+        return [(' '.join(words[position:]) + ' ', position, kind, item_id, label)
+                for position in range(min(len(words), cls.MAX_WORD_STARTS))]
+
+    def add(self, kind: str, item_id, label: Optional[str]):
+        """Index a label, replacing any previous label of the same item"""
+        entries = self._entries_for(kind, item_id, label)
+        with self._lock:
+            self._remove(kind, item_id)
+            if not entries:
+                return
+            for entry in entries:
+                insort(self._entries, entry)
+            self._keys_by_item[(kind, item_id)] = entries
+
+    def extend(self, items):
+        """Index many new (kind, id, label) items at once with a single sort"""
+        with self._lock:
+            for kind, item_id, label in items:
+                entries = self._entries_for(kind, item_id, label)
+                if entries:
+                    self._entries.extend(entries)
+                    self._keys_by_item[(kind, item_id)] = entries
+            self._entries.sort()
+
+    def remove(self, kind: str, item_id):
+        with self._lock:
+            self._remove(kind, item_id)
+
+    def _remove(self, kind, item_id):
+        for entry in self._keys_by_item.pop((kind, item_id), ()):
+            position = bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def search(self, query: str, limit: int = 10, kinds=KINDS) -> List[dict]:
+        """
+        Return up to `limit` {id, label, kind} suggestions whose label has a word
+        sequence starting with `query`.
+
+        Labels that start with the query come before ones that only match from a
+        later word; duplicate keyword labels are returned once.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if query[-1].isspace():
+            # a finished word should not match longer words
+            prefix += ' '
+
+        with self._lock:
+            start = bisect_left(self._entries, (prefix,))
+            matches = []
+            for entry in self._entries[start:start + self.MAX_SCAN]:
+                if not entry[0].startswith(prefix):
+                    break
+                if entry[2] in kinds:
+                    matches.append(entry)
+
+        # the walk is in key order; rank whole-label matches first, then shorter labels
+        matches.sort(key=lambda entry: (entry[1] > 0, len(entry[4]), entry[0]))
+        seen = set()
+        results = []
+        for _, _, kind, item_id, label in matches:
+            identity = (kind, normalize(label)) if kind == KEYWORD else (kind, item_id)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            results.append({'id': item_id, 'label': label, 'kind': kind})
+            if len(results) == limit:
+                break
+        return results
+
+
+class CatalogueAutocomplete(LiveIndex, PrefixIndex):
+    """
+    Prefix index over action titles, education titles and SDG keywords.
+
+    Built lazily from the database on first use. The save/delete signals of the
+    indexed models update it in place in the process that made the change;
+    changes by other processes, seen through the versions of those models in
+    the shared catalogue cache, have it reloaded in the background (see
+    catalogue/live_index.py).
+    """
+
+    @staticmethod
+    def models():
+        from sdg_actions.models import ActionDb
+        from sdg_education.models import EducationDb
+        from sdg_targets.models import SDGKeyword
+
+        return [ActionDb, EducationDb, SDGKeyword]
+
+    def new_index(self):
+        return PrefixIndex()
+
+    def load(self, index):
+        index.extend(self.load_items())
+
+    def load_items(self):
+        from sdg_actions.models import ActionDb
+        from sdg_education.models import EducationDb
+        from sdg_targets.models import SDGKeyword
+
+        for pk, label in ActionDb.objects.values_list('id', 'actions').iterator(chunk_size=2000):
+            yield ACTION, pk, label
+        for pk, label in EducationDb.objects.values_list('id', 'title').iterator(chunk_size=2000):
+            yield EDUCATION, pk, label
+        for pk, label in SDGKeyword.objects.values_list('id', 'keyword').iterator(chunk_size=2000):
+            yield KEYWORD, pk, label
+
+    def index_item(self, kind, item_id, label):
+        self.apply_change('add', kind, item_id, label)
+
+    def remove_item(self, kind, item_id):
+        self.apply_change('remove', kind, item_id)
+
+    def search(self, query, limit=10, kinds=KINDS):
+        self.ensure_built()
+        return super().search(query, limit=limit, kinds=kinds)
+
+
+# Process-wide index used by the autocomplete view; each process keeps its own copy
+autocomplete_index = CatalogueAutocomplete()
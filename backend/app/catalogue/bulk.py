@@ -0,0 +1,66 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+MAX_BULK_IDS = 200
+
+
+def parse_ids(value, limit=MAX_BULK_IDS):
+    """Parse a comma-separated list of integer ids, dropping duplicates but keeping their order"""
+    try:
+        ids = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValidationError({'ids': 'Ids must be a comma-separated list of integers.'})
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > limit:
+        raise ValidationError({'ids': f'At most {limit} ids can be requested at once.'})
+    return ids
+
+
+def fetch_in_order(queryset, ids):
+    """
+    Load the records with the given ids in one query.
+
+    Returns the records in the order of `ids`, and the ids that were not found.
+    """
+    records = queryset.in_bulk(ids)
+    found = [records[pk] for pk in ids if pk in records]
+    missing = [pk for pk in ids if pk not in records]
+    return found, missing
+
+
+def in_batches(queryset, ids=None, batch_size=1000):
+    """Yield the records of `queryset` with the given ids (default: all of them) in lists of up to `batch_size`"""
+    if ids is not None:
+        ids = sorted(ids)
+        for start in range(0, len(ids), batch_size):
+            yield list(queryset.filter(pk__in=ids[start:start + batch_size]))
+        return
+    batch = []
+    for record in queryset.order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkRetrieveMixin:
+    """
+    Lets a retrieve view return several records with `?ids=1,2,3`.
+
+    The records are loaded with one `id__in` query and returned in the requested
+    order as `{"results": [...], "missing": [ids not found]}`. Requests without
+    `ids` are handled by the regular retrieve.
+    """
+    ids_query_param = 'ids'
+    max_bulk_ids = MAX_BULK_IDS
+
+    def retrieve(self, request, *args, **kwargs):
+        value = request.query_params.get(self.ids_query_param)
+        if value is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        found, missing = fetch_in_order(self.get_queryset(), parse_ids(value, self.max_bulk_ids))
+        serializer = self.get_serializer(found, many=True)
+        return Response({'results': serializer.data, 'missing': missing})
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+
+CACHE_ALIAS = 'catalogue'
+
+
+class ResponseCache:
+    """
+    Stores rendered response bodies for read-only catalogue endpoints.
+
+    Every cached model has a version kept in the same cache. Keys embed the
+    current versions of the models a view reads, so bumping a version (done by
+    the save/delete signals of those models) makes all older entries
+    unreachable; they simply expire. A bump writes a fresh random value rather
+    than incrementing, because the file backend's incr() is a get and a set that
+    loses one of two concurrent bumps.
+    """
+
+    # own bumps remembered per model; a structure that checks less often than this reloads instead
+    MAX_OWN_BUMPS = 1000
+
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+        self._own_lock = threading.Lock()
+        # model label -> {version read: version written} by this process's bumps (see ModelVersions)
+        self._own_bumps = defaultdict(dict)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _version_key(model):
+        return f'catalogue:version:{model._meta.label_lower}'
+
+    def versions(self, models):
+        keys = [self._version_key(model) for model in models]
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                self.cache.add(key, uuid.uuid4().hex, timeout=None)
+                found[key] = self.cache.get(key)
+        return [found[key] for key in keys]
+
+    def bump(self, model):
+        key = self._version_key(model)
+        previous = self.cache.get(key)
+        version = uuid.uuid4().hex
+        self.cache.set(key, version, timeout=None)
+        with self._own_lock:
+            bumps = self._own_bumps[model._meta.label_lower]
+            bumps[previous] = version
+            if len(bumps) > self.MAX_OWN_BUMPS:
+                del bumps[next(iter(bumps))]
+
+    def bumped_here(self, model, since, version):
+        """Whether the bumps of this process alone lead from version `since` to `version`"""
+        with self._own_lock:
+            bumps = self._own_bumps.get(model._meta.label_lower, {})
+            while since != version:
+                since = bumps.get(since)
+                if since is None:
+                    return False
+            return True
+
+    def key_for(self, request, models):
+        params = sorted((name, sorted(request.GET.getlist(name))) for name in request.GET)
+        raw = '|'.join([
+            request.build_absolute_uri(request.path),
+            urlencode(params, doseq=True),
+            request.META.get('HTTP_ACCEPT', ''),
+            ','.join(str(version) for version in self.versions(models)),
+        ])
+        return 'catalogue:response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, content, content_type, vary=None):
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+        self.cache.set(key, (content, content_type, etag, vary))
+        return etag
+
+    def clear(self):
+        self.cache.clear()
+
+
+response_cache = ResponseCache()
+
+
+class ModelVersions:
+    """
+    Lets an in-memory structure built from some models notice that another
+    process changed them, through the versions `response_cache` keeps for those models.
+
+    Versions reached from the recorded ones through bumps this process made
+    itself only reflect its own saves, which the structure applies in place, so
+    they do not count as a change. The shared cache is read at most every
+    `check_interval` seconds.
+    """
+
+    def __init__(self, get_models, check_interval=None):
+        # a callable, so the models can be imported lazily
+        self.get_models = get_models
+        self.check_interval = (getattr(settings, 'CATALOGUE_INDEX_CHECK_INTERVAL', 2.0)
+                               if check_interval is None else check_interval)
+        self.seen = None
+        self._checked_at = None
+
+    def current(self):
+        return response_cache.versions(self.get_models())
+
+    def record(self, versions):
+        """Note the versions a new build was made from, read before loading it"""
+        self.seen = versions
+        self._checked_at = time.monotonic()
+
+    def changed_elsewhere(self) -> bool:
+        """Whether another process changed the models since the recorded versions"""
+        if self.seen is None:
+            return True
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        models, versions = self.get_models(), self.current()
+        if all(response_cache.bumped_here(model, seen, version)
+               for model, seen, version in zip(models, self.seen, versions)):
+            self.seen = versions
+            return False
+        return True
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+class CachedResponseMixin:
+    """
+    Serves GET requests from `response_cache` when the same query was answered before.
+
+    `cache_models` lists the models the view reads; saving or deleting any of them
+    invalidates its cached responses. A hit returns the stored bytes without
+    running the query or the serializer. Responses carry an ETag, and a matching
+    If-None-Match gets a 304.
+    """
+    cache_models = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        if getattr(self, 'async_views', False):
+            return self.adispatch_cached(request, *args, **kwargs)
+
+        key, entry = self.cached_entry(request)
+        response = super().dispatch(request, *args, **kwargs) if entry is None else None
+        return self.cached_response(request, key, entry, response)
+
+    async def adispatch_cached(self, request, *args, **kwargs):
+        """
+        `dispatch` for async views (see catalogue.async_views). The cache backends
+        block on I/O, so it is read and written from a worker thread.
+        """
+        key, entry = await sync_to_async(self.cached_entry)(request)
+        response = await super().dispatch(request, *args, **kwargs) if entry is None else None
+        return await sync_to_async(self.cached_response)(request, key, entry, response)
+
+    def cached_entry(self, request):
+        """The cache key of the request, and what is stored under it (None on a miss)"""
+        key = response_cache.key_for(request, self.cache_models)
+        return key, response_cache.get(key)
+
+    def cached_response(self, request, key, entry, response):
+        """The cached `entry`, or the freshly computed `response` stored under `key`"""
+        if entry is None:
+            if response.status_code != 200:
+                return response
+            response.render()
+            etag = response_cache.set(key, response.content, response['Content-Type'], response.get('Vary'))
+            response['ETag'] = etag
+        else:
+            content, content_type, etag, vary = entry
+            response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            if vary:
+                # the same Vary as the response that was cached, so shared caches key hits and misses alike
+                response['Vary'] = vary
+
+        if etag_matches(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        return response
@@ -0,0 +1,144 @@
+from django.db.models import Count
+from rest_framework.response import Response
+from .async_views import evaluate
+
+
+def multiselect_values(value):
+    """
+    Split a MultiSelectField value into its individual choices.
+
+    Handles the stored comma-separated string as well as lists, including lists
+    whose items are themselves comma-separated.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        value = ','.join(str(item) for item in value)
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def sync_facet_rows(facet_model, record_field, records):
+    """
+    Bring the facet rows of `records` in line with their current values.
+
+    `record_field` is the foreign key from `facet_model` to the records. Rows
+    that are still right are left alone; only missing ones are inserted and
+    outdated ones deleted.
+    """
+    column = f'{record_field}_id'
+    wanted = {}
+    for record in records:
+        for row in facet_model.rows_for(record):
+            wanted[(getattr(row, column), row.facet, row.value)] = row
+    outdated = []
+    existing = facet_model.objects.filter(**{f'{column}__in': [record.pk for record in records]})
+    for pk, *key in existing.values_list('pk', column, 'facet', 'value'):
+        if wanted.pop(tuple(key), None) is None:
+            outdated.append(pk)
+    if outdated:
+        facet_model.objects.filter(pk__in=outdated).delete()
+    facet_model.objects.bulk_create(wanted.values())
+
+
+class FacetCountsMixin:
+    """
+    Adds per-facet counts to a filtered list view when called with `?facets=true`.
+
+    The counts come from a GROUP BY over the view's facet membership table
+    (ActionFacet / EducationFacet), restricted to the filtered ids. Counting is
+    disjunctive: a facet the request filters on is counted with its own filter
+    left out (one extra query per such facet), so `?sdgs=7` still reports how
+    many records each other SDG would add to the selection. Facets that are not
+    filtered on are counted together against the fully filtered records. The
+    response then becomes an object with the usual `results` (and pagination
+    keys, if paginated) plus a `facets` mapping of facet -> {value: count}.
+    """
+    facet_model = None
+    # name of the foreign key from the facet model to the listed model
+    facet_record_field = None
+    facets_query_param = 'facets'
+
+    def wants_facets(self):
+        value = self.request.query_params.get(self.facets_query_param, '')
+        return value.lower() in ('1', 'true', 'yes')
+
+    def facet_count_rows(self, queryset, facets):
+        return (
+            self.facet_model.objects
+            .filter(**{f'{self.facet_record_field}__in': queryset.order_by().values('pk')}, facet__in=facets)
+            .values('facet', 'value')
+            .annotate(count=Count('pk'))
+            .order_by()
+        )
+
+    def filtered_facets(self):
+        """facet -> query parameter of its filter, for the facets this request filters on"""
+        filtered = {}
+        for param, facet_filter in self.filterset_class.base_filters.items():
+            facet = self.facet_model.FIELD_FACETS.get(facet_filter.field_name)
+            if facet is not None and self.request.query_params.get(param):
+                filtered[facet] = param
+        return filtered
+
+    def facet_count_queries(self, base_queryset, queryset):
+        """Row queries that together count every facet, each filtered facet without its own filter"""
+        filtered = self.filtered_facets()
+        unfiltered = [facet for facet in self.facet_model.FIELD_FACETS.values() if facet not in filtered]
+        queries = [self.facet_count_rows(queryset, unfiltered)] if unfiltered else []
+        for facet, param in filtered.items():
+            data = self.request.query_params.copy()
+            data.pop(param)
+            others = self.filterset_class(data, queryset=base_queryset, request=self.request).qs
+            queries.append(self.facet_count_rows(others, [facet]))
+        return queries
+
+    def tally_facets(self, rows):
+        counts = {facet: {} for facet in self.facet_model.FIELD_FACETS.values()}
+        for row in rows:
+            counts[row['facet']][row['value']] = row['count']
+        return counts
+
+    def get_facet_counts(self, base_queryset, queryset):
+        queries = self.facet_count_queries(base_queryset, queryset)
+        return self.tally_facets(row for rows in queries for row in rows)
+
+    async def aget_facet_counts(self, base_queryset, queryset):
+        queries = self.facet_count_queries(base_queryset, queryset)
+        return self.tally_facets([row for rows in queries async for row in rows.aiterator()])
+
+    def list(self, request, *args, **kwargs):
+        if not self.wants_facets():
+            return super().list(request, *args, **kwargs)
+
+        base_queryset = self.get_queryset()
+        queryset = self.filter_queryset(base_queryset)
+        facets = self.get_facet_counts(base_queryset, queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+            response.data['facets'] = facets
+            return response
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response({'results': serializer.data, 'facets': facets})
+
+    async def alist(self, request, *args, **kwargs):
+        """`list` for views using AsyncListMixin"""
+        if not self.wants_facets():
+            return await super().alist(request, *args, **kwargs)
+
+        base_queryset = await self.aget_queryset()
+        queryset = self.filter_queryset(base_queryset)
+        facets = await self.aget_facet_counts(base_queryset, queryset)
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+            response.data['facets'] = facets
+            return response
+
+        serializer = self.get_serializer(await evaluate(queryset), many=True)
+        return Response({'results': serializer.data, 'facets': facets})
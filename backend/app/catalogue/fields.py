@@ -0,0 +1,75 @@
+from rest_framework.exceptions import ValidationError
+
+ALL_FIELDS = '__all__'
+
+
+def parse_field_list(value):
+    """Split a comma-separated query parameter into field names, ignoring blanks"""
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Drops every field not listed in the `sparse_fields` serializer context.
+
+    Views set the context through SparseFieldsetMixin; without it the
+    serializer returns all of its fields as usual.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('sparse_fields')
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients choose the fields in a response with `?fields=a,b` or `?omit=c,d`.
+
+    `summary_fields` is the default selection (all fields when unset); use
+    `?fields=__all__` to get every field from a view that defaults to a summary.
+    Unknown names are rejected with a 400. Querysets passed through
+    `only_selected_fields` load just the selected columns, so large text
+    columns that are not returned are never read from the database.
+    """
+    summary_fields = None
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def get_available_fields(self):
+        return list(self.get_serializer_class()().fields)
+
+    def get_selected_fields(self):
+        if hasattr(self, '_selected_fields'):
+            return self._selected_fields
+
+        available = self.get_available_fields()
+        requested = parse_field_list(self.request.query_params.get(self.fields_query_param, ''))
+        omitted = parse_field_list(self.request.query_params.get(self.omit_query_param, ''))
+
+        if requested == [ALL_FIELDS]:
+            requested = available
+        elif not requested:
+            requested = list(self.summary_fields or available)
+
+        unknown = [name for name in requested + omitted if name not in available]
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(unknown)}."})
+
+        # keep the serializer's field order whatever order they were asked in
+        self._selected_fields = tuple(
+            name for name in available if name in requested and name not in omitted)
+        return self._selected_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fields'] = self.get_selected_fields()
+        return context
+
+    def only_selected_fields(self, queryset):
+        model = queryset.model
+        columns = {field.name for field in model._meta.concrete_fields}
+        selected = [name for name in self.get_selected_fields() if name in columns]
+        return queryset.only(model._meta.pk.name, *selected)
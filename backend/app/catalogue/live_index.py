@@ -0,0 +1,113 @@
+import logging
+import threading
+
+from django.db import connections
+
+from .cache import ModelVersions
+
+logger = logging.getLogger(__name__)
+
+
+class LiveIndex:
+    """
+    Mixin for an in-memory structure loaded from some models, kept in step with
+    every process's changes without reloading it on the request path.
+
+    The first use loads it synchronously. After that, the save/delete signals of
+    the models apply this process's changes in place through `apply_change`, and
+    `ensure_built` asks `versions` (at most every few seconds) whether another
+    process changed them. If one did, a fresh copy is loaded on a background
+    thread and swapped in once ready; the current copy keeps answering until
+    then, and changes applied meanwhile are replayed onto the new one.
+
+    Subclasses provide `models()`, `new_index()` returning an empty structure,
+    `load(index)` filling one from the database, and `replace_with(index)`
+    taking over its contents. With `background = False` the reload runs in the
+    calling thread instead, which is how the tests drive it.
+    """
+
+    background = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.versions = ModelVersions(self.models)
+        self._built = False
+        # bumped by invalidate(), so a load started before it is thrown away
+        self._generation = 0
+        # held while a fresh copy loads, so only one load runs at a time
+        self._build_lock = threading.Lock()
+        # orders in-place changes against swapping in a fresh copy
+        self._changes_lock = threading.Lock()
+        # changes applied while a fresh copy loads, or None when none is loading
+        self._pending = None
+
+    @property
+    def is_built(self):
+        return self._built
+
+    def invalidate(self):
+        """Drop the contents so the next use reloads them from the database"""
+        with self._changes_lock:
+            self._generation += 1
+            self._built = False
+            self.replace_with(self.new_index())
+
+    def ensure_built(self):
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self._build()
+        elif self.versions.changed_elsewhere():
+            self._start_rebuild()
+
+    def apply_change(self, method, *args):
+        """Call `method` (e.g. 'add') of the live copy, and of any copy being loaded once it is ready"""
+        with self._changes_lock:
+            if self._built:
+                getattr(self, method)(*args)
+            if self._pending is not None:
+                self._pending.append((method, args))
+
+    def _start_rebuild(self):
+        if not self._build_lock.acquire(blocking=False):
+            # already loading
+            return
+        if not self.background:
+            try:
+                self._build()
+            finally:
+                self._build_lock.release()
+            return
+        threading.Thread(target=self._rebuild, name=f'{type(self).__name__}-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self._build()
+        except Exception:
+            logger.exception(f"Reloading {type(self).__name__} failed")
+        finally:
+            self._build_lock.release()
+            # the connection of this thread is not closed by any request
+            connections.close_all()
+
+    def _build(self):
+        """Load a fresh copy and swap it in; the caller holds `_build_lock`"""
+        with self._changes_lock:
+            generation = self._generation
+            self._pending = []
+        try:
+            snapshot = self.versions.current()
+            index = self.new_index()
+            self.load(index)
+            with self._changes_lock:
+                if generation != self._generation:
+                    return
+                # saves committed while loading may be missing from the rows read
+                for method, args in self._pending:
+                    getattr(index, method)(*args)
+                self.replace_with(index)
+                self.versions.record(snapshot)
+                self._built = True
+        finally:
+            with self._changes_lock:
+                self._pending = None
@@ -0,0 +1,333 @@
+import csv
+import os
+import re
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from catalogue.autocomplete import autocomplete_index
+from catalogue.cache import response_cache
+from sdg_actions.models import ActionDb, ActionFacet, INDU_CHOICES
+from sdg_actions.search_index import action_index
+from sdg_education.models import (EducationDb, EducationFacet, TYPE_CHOICES, DISP_CHOICES,
+                                  INDU_CHOICES as EDUCATION_INDU_CHOICES)
+from sdg_targets.classifier import classifier
+from sdg_targets.models import (SDG_TARGET_MODELS, SDGKeyword, References, Digital_Keywords,
+                                keywords_related_to_all_SDGs)
+
+DEFAULT_DATA_DIR = os.path.join(settings.BASE_DIR.parent, 'data')
+WORD_RE = re.compile(r'[a-z0-9]+')
+URL_RE = re.compile(r'(?:https?://|www\.)\S+')
+
+
+class RowError(ValueError):
+    """A row that cannot be loaded; it is reported and skipped"""
+
+
+def clean(value):
+    """Strip a cell, dropping stray replacement characters and full-width spaces"""
+    return (value or '').replace('�', '').replace('　', '').strip()
+
+
+def as_int(value, column):
+    value = clean(value)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise RowError(f'{column}: {value!r} is not a number')
+
+
+def as_sdgs(value):
+    return [item.strip() for item in clean(value).split(',') if item.strip().isdigit()]
+
+
+def as_choices(value, choices):
+    """
+    Split a comma-separated cell into MultiSelectField values.
+
+    Choice keys are written without commas ("Electricity gas water and waste
+    services") while the spreadsheets often keep them ("Electricity, gas, ..."),
+    so consecutive pieces are joined back together when they spell a choice.
+    Pieces that match no choice are kept as they are.
+    """
+    keys = {' '.join(WORD_RE.findall(key.lower())): key for key, _ in choices}
+    pieces = [piece.strip() for piece in clean(value).split(',') if piece.strip()]
+    values = []
+    start = 0
+    while start < len(pieces):
+        for end in range(len(pieces), start, -1):
+            key = keys.get(' '.join(WORD_RE.findall(' '.join(pieces[start:end]).lower())))
+            if key:
+                values.append(key)
+                start = end
+                break
+        else:
+            values.append(pieces[start])
+            start += 1
+    return list(dict.fromkeys(values))
+
+
+def in_file(row, fields, columns):
+    """
+    Drop the fields whose source columns are not in the file at all, so a
+    re-run with a narrower file leaves those columns of existing rows alone.
+    `columns` maps a field to the columns it is read from; other fields are kept.
+    """
+    return {name: value for name, value in fields.items()
+            if name not in columns or any(column in row for column in columns[name])}
+
+
+# field -> the spreadsheet columns it is read from
+ACTION_COLUMNS = {
+    'actions': ('Actions',),
+    'action_detail': ('Action detail',),
+    'level': ('Level',),
+    'individual_organization': ('Individual/Organization',),
+    'digital_actions': ('Digital actions',),
+    'sdgs': ('SDGs',),
+    'related_industry': ('Related Industry (org only)', 'related_industry_org'),
+    'sources': ('Sources',),
+    'links': ('Links',),
+    'additional_notes': ('Additional Notes',),
+}
+EDUCATION_COLUMNS = {
+    'title': ('Title',),
+    'description': ('Description',),
+    'aims': ('Aims',),
+    'learning_outcome': ('Learning outcome( Expecting outcome)',),
+    'type_label': ('Type label',),
+    'location': ('Location',),
+    'organization': ('Organization',),
+    'year': ('Year',),
+    'sdgs_related': ('SDGs related',),
+    'related_to_which_discipline': ('Related to which discipline',),
+    'useful_for_which_industries': ('Useful for which industries',),
+    'sources': ('Source',),
+    'links': ('Source',),
+}
+KEYWORD_COLUMNS = {
+    'reference1': ('reference1',),
+    'reference2': ('reference2',),
+    'note': ('note', 'Note'),
+    'target': ('target',),
+}
+
+
+def action_fields(row):
+    levels = [item for item in clean(row.get('Level')).split(',') if item.strip()]
+    industries = ','.join(filter(None, [row.get('Related Industry (org only)'), row.get('related_industry_org')]))
+    return in_file(row, {
+        'id': as_int(row.get('id'), 'id'),
+        'actions': clean(row.get('Actions'))[:255] or None,
+        'action_detail': clean(row.get('Action detail')) or None,
+        # the column is a single level; rows listing several keep the first
+        'level': as_int(levels[0], 'Level') if levels else None,
+        'individual_organization': as_int(row.get('Individual/Organization'), 'Individual/Organization'),
+        'digital_actions': as_int(row.get('Digital actions'), 'Digital actions'),
+        'sdgs': as_sdgs(row.get('SDGs')),
+        'related_industry': as_choices(industries, INDU_CHOICES),
+        'sources': clean(row.get('Sources')) or None,
+        'links': clean(row.get('Links')) or None,
+        'additional_notes': clean(row.get('Additional Notes')) or None,
+    }, ACTION_COLUMNS)
+
+
+def education_fields(row):
+    source = clean(row.get('Source'))
+    # the single Source column mixes citations and links; links also go to the Link column
+    links = URL_RE.findall(source)
+    has_citation = bool(URL_RE.sub('', source).strip())
+    return in_file(row, {
+        'id': as_int(row.get('id'), 'id'),
+        'title': clean(row.get('Title')) or None,
+        'description': clean(row.get('Description')) or None,
+        'aims': clean(row.get('Aims')) or None,
+        'learning_outcome': clean(row.get('Learning outcome( Expecting outcome)')) or None,
+        'type_label': as_choices(row.get('Type label'), TYPE_CHOICES),
+        'location': clean(row.get('Location')) or None,
+        'organization': clean(row.get('Organization')) or None,
+        'year': clean(row.get('Year'))[:50] or None,
+        'sdgs_related': as_sdgs(row.get('SDGs related')),
+        'related_to_which_discipline': as_choices(row.get('Related to which discipline'), DISP_CHOICES),
+        'useful_for_which_industries': as_choices(row.get('Useful for which industries'), EDUCATION_INDU_CHOICES),
+        'sources': source if has_citation else None,
+        'links': '\n'.join(links) or None,
+    }, EDUCATION_COLUMNS)
+
+
+def keyword_fields(row, sdggoal=None):
+    keyword = clean(row.get('keyword'))
+    # some sheets repeat the header or use separator rows part way down
+    if not WORD_RE.search(keyword.lower()) or keyword.lower() == 'keyword':
+        raise RowError(f'keyword: {keyword!r} is not a keyword')
+    fields = {
+        'id': as_int(row.get('id'), 'id'),
+        'keyword': keyword[:200],
+        'reference1': clean(row.get('reference1'))[:300],
+        'reference2': clean(row.get('reference2'))[:300],
+        'note': clean(row.get('note') or row.get('Note'))[:200],
+    }
+    if sdggoal is not None:
+        # the sdggoal column is unreliable in several sheets; the file decides the goal
+        fields['sdggoal'] = sdggoal
+        fields['target'] = clean(row.get('target'))[:200]
+    return in_file(row, fields, KEYWORD_COLUMNS)
+
+
+def reference_fields(row):
+    return {'id': as_int(row.get('id'), 'id'), 'source': clean(row.get('reference'))[:300]}
+
+
+def keyword_loader(sdggoal):
+    return lambda row: keyword_fields(row, sdggoal)
+
+
+# dataset name -> (default file in the data directory, model, row -> model fields)
+DATASETS = {
+    'actions': ('action_db_202301051247.csv', ActionDb, action_fields),
+    'education': ('educationDb.csv', EducationDb, education_fields),
+    **{f'sdg{sdg}': (f'sdg{sdg}.csv', model, keyword_loader(str(sdg)))
+       for sdg, model in SDG_TARGET_MODELS.items()},
+    'all_sdgs': ('sdgtargets.all_targets.csv', keywords_related_to_all_SDGs, keyword_fields),
+    'digital': ('sdgtargets.Digital_sustainability_target.csv', Digital_Keywords, keyword_fields),
+    'references': ('reference.csv', References, reference_fields),
+}
+
+
+def read_rows(path):
+    """Yield (line number, row dict) from a CSV or Excel file without loading it whole"""
+    if path.endswith(('.xlsx', '.xlsm')):
+        try:
+            import openpyxl
+        except ImportError:
+            raise CommandError(f'Reading {path} needs openpyxl; install it or export the sheet as CSV.')
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [clean(str(cell or '')) for cell in next(rows, ())]
+            for number, values in enumerate(rows, start=2):
+                yield number, {name: '' if value is None else str(value) for name, value in zip(header, values)}
+        finally:
+            workbook.close()
+        return
+
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [clean(name) for name in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row
+
+
+class Command(BaseCommand):
+    help = ("Load the catalogue spreadsheets in backend/data into ActionDb, EducationDb, the SDG "
+            "keyword tables and References. Rows are upserted by id in batches, so the command "
+            "can be re-run safely; rows that cannot be read are reported and skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', metavar='dataset',
+                            help=f"Datasets to load (default: all): {', '.join(DATASETS)}.")
+        parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                            help='Directory holding the default files (default: backend/data).')
+        parser.add_argument('--file', action='append', default=[], metavar='DATASET=PATH',
+                            help='Read a dataset from another CSV/XLSX file. Can be repeated.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per transaction (default: 1000).')
+        parser.add_argument('--rejects', metavar='PATH',
+                            help='Write skipped rows and the reason to this CSV file.')
+
+    def handle(self, *args, **options):
+        names = options['datasets'] or list(DATASETS)
+        unknown = [name for name in names if name not in DATASETS]
+        if unknown:
+            raise CommandError(f"Unknown dataset(s): {', '.join(unknown)}")
+
+        paths = {name: os.path.join(options['data_dir'], DATASETS[name][0]) for name in names}
+        for override in options['file']:
+            name, _, path = override.partition('=')
+            if name not in DATASETS or not path:
+                raise CommandError(f'--file expects DATASET=PATH, got {override!r}')
+            paths[name] = path
+            if name not in names:
+                names.append(name)
+
+        self.batch_size = max(1, options['batch_size'])
+        rejects_file = open(options['rejects'], 'w', encoding='utf-8', newline='') if options['rejects'] else None
+        self.rejects = csv.writer(rejects_file) if rejects_file else None
+        if self.rejects:
+            self.rejects.writerow(['dataset', 'line', 'error'])
+
+        started = time.perf_counter()
+        # model -> ids of the rows upserted
+        self.written_ids = defaultdict(set)
+        try:
+            for name in names:
+                if not os.path.exists(paths[name]):
+                    self.stderr.write(f'{name}: {paths[name]} not found, skipped')
+                    continue
+                self.load(name, paths[name])
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        self.refresh_derived(self.written_ids)
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def load(self, name, path):
+        _, model, to_fields = DATASETS[name]
+        written = rejected = 0
+        batch = []
+        # only what the file provides is written over existing rows
+        update_fields = set()
+        for line, row in read_rows(path):
+            try:
+                fields = to_fields(row)
+                if fields['id'] is None:
+                    raise RowError('id: missing')
+            except RowError as error:
+                rejected += 1
+                if self.rejects:
+                    self.rejects.writerow([name, line, str(error)])
+                continue
+            batch.append(model(**fields))
+            update_fields.update(fields)
+            if len(batch) >= self.batch_size:
+                written += self.write(model, batch, update_fields)
+                batch = []
+                self.stdout.write(f'{name}: {written} rows written...')
+        written += self.write(model, batch, update_fields)
+        self.stdout.write(f'{name}: {written} rows written, {rejected} rejected')
+
+    def write(self, model, objects, fields):
+        if not objects:
+            return 0
+        update_fields = [field.name for field in model._meta.concrete_fields
+                         if not field.primary_key and field.name in fields]
+        # MySQL upserts on any unique key and does not take the conflict target
+        unique_fields = [model._meta.pk.name] if connection.features.supports_update_conflicts_with_target else None
+        with transaction.atomic():
+            model.objects.bulk_create(objects, update_conflicts=True, update_fields=update_fields,
+                                      unique_fields=unique_fields)
+        self.written_ids[model].update(obj.pk for obj in objects)
+        return len(objects)
+
+    def refresh_derived(self, written_ids):
+        """bulk_create skips save signals, so refresh what they would have kept up to date for the rows written"""
+        if ActionDb in written_ids:
+            ActionFacet.rebuild(written_ids[ActionDb], batch_size=self.batch_size)
+            response_cache.bump(ActionDb)
+        if EducationDb in written_ids:
+            EducationFacet.rebuild(written_ids[EducationDb], batch_size=self.batch_size)
+            response_cache.bump(EducationDb)
+        keyword_ids = {model: ids for model, ids in written_ids.items() if model in SDGKeyword.source_models()}
+        if keyword_ids:
+            SDGKeyword.rebuild(keyword_ids, batch_size=self.batch_size)
+            response_cache.bump(SDGKeyword)
+        # in-memory indexes of this process; web workers rebuild theirs on seeing the bumped versions
+        action_index.invalidate()
+        autocomplete_index.invalidate()
+        classifier.invalidate()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from itertools import count
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_ENDPOINTS = [
+    'GET /api/sdg-actions/search/?q=energy',
+    'GET /api/sdg-actions/filter-search/?sdgs=7',
+    'GET /api/sdg-education/search/?q=climate',
+    'GET /api/sdg-education/filter-search/?page=1',
+    'POST /api/admin/analytics/actions/top/',
+    'POST /api/admin/analytics/educations/top/',
+]
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def add(self, status, latency):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.append(latency)
+
+    def percentile(self, share):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+def parse_endpoint(endpoint):
+    method, _, path = endpoint.strip().partition(' ')
+    if not path:
+        method, path = 'GET', method
+    return method.upper(), path
+
+
+async def request(host, port, method, path, body, slow_read, chunk_size):
+    """One HTTP/1.1 request on its own connection; the response is read `chunk_size` bytes at a time"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        payload = body.encode() if method == 'POST' else b''
+        head = (f'{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n'
+                f'Accept: application/json\r\n')
+        if method == 'POST':
+            head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+        writer.write(head.encode() + b'\r\n' + payload)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                break
+            if slow_read:
+                # a slow client holds its connection open for longer
+                await asyncio.sleep(slow_read)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_load(base_url, endpoints, concurrency, total, body, slow_read, chunk_size, bust_cache):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    sequence = count()
+    result = Result()
+
+    async def client():
+        while (number := next(sequence)) < total:
+            method, path = endpoints[number % len(endpoints)]
+            if bust_cache and method == 'GET':
+                # distinct query strings keep the catalogue response cache from answering
+                path += ('&' if '?' in path else '?') + f'_load={number}'
+            started = time.perf_counter()
+            try:
+                status = await request(host, port, method, path, body, slow_read, chunk_size)
+            except OSError:
+                result.errors += 1
+                continue
+            result.add(status, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return result, time.perf_counter() - started
+
+
+def wait_for_port(host, port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'The server on port {port} exited with status {process.returncode}')
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'The server on port {port} did not start within {timeout}s')
+
+
+class Command(BaseCommand):
+    help = ("Load-test the catalogue and analytics endpoints with many concurrent (optionally slow) "
+            "clients. By default it starts daphne twice, with ASYNC_VIEWS off and on, and compares "
+            "throughput and latency; --url tests a server that is already running instead.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server; no servers are started.')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', metavar='"[METHOD] PATH"',
+                            help='Endpoint to request, round-robin. Can be repeated (default: the '
+                                 'search, filter-search and top analytics endpoints).')
+        parser.add_argument('--body', default=json.dumps({'time_range': 'all time'}),
+                            help='JSON body of POST requests.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Concurrent clients (default: 200).')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run (default: 2000).')
+        parser.add_argument('--slow-read', type=float, default=0.0, metavar='SECONDS',
+                            help='Pause after every chunk a client reads (default: 0).')
+        parser.add_argument('--chunk-size', type=int, default=1024, help='Bytes read per chunk (default: 1024).')
+        parser.add_argument('--use-cache', action='store_true',
+                            help='Let the response cache answer repeated GETs (off by default).')
+        parser.add_argument('--port', type=int, default=8765, help='First port for started servers.')
+        parser.add_argument('--threads', type=int,
+                            help='ASGI_THREADS of started servers, the thread pool sync views run in.')
+
+    def handle(self, *args, **options):
+        endpoints = [parse_endpoint(endpoint) for endpoint in options['endpoints'] or DEFAULT_ENDPOINTS]
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+
+        if options['url']:
+            self.report(options['url'], self.load(options['url'], endpoints, options))
+            return
+
+        results = []
+        for offset, mode in enumerate(['sync', 'async']):
+            port = options['port'] + offset
+            env = dict(os.environ, ASYNC_VIEWS='1' if mode == 'async' else '0')
+            if options['threads']:
+                env['ASGI_THREADS'] = str(options['threads'])
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), '_config.asgi:application'],
+                cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port('127.0.0.1', port, server)
+                measured = self.load(f'http://127.0.0.1:{port}', endpoints, options)
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+            self.report(mode, measured)
+            results.append(measured)
+
+        (sync_result, sync_elapsed), (async_result, async_elapsed) = results
+        if sync_result.latencies and async_result.latencies:
+            speedup = (len(async_result.latencies) / async_elapsed) / (len(sync_result.latencies) / sync_elapsed)
+            self.stdout.write(self.style.SUCCESS(f'async/sync throughput: {speedup:.2f}x'))
+
+    def load(self, base_url, endpoints, options):
+        return asyncio.run(run_load(
+            base_url, endpoints, options['concurrency'], options['requests'], options['body'],
+            options['slow_read'], options['chunk_size'], not options['use_cache']))
+
+    def report(self, label, measured):
+        result, elapsed = measured
+        done = len(result.latencies)
+        statuses = ', '.join(f'{status}: {number}' for status, number in sorted(result.statuses.items()))
+        self.stdout.write(
+            f'{label}: {done} requests in {elapsed:.1f}s ({done / elapsed:.0f} req/s), '
+            f'p50 {result.percentile(0.5) * 1000:.0f} ms, p95 {result.percentile(0.95) * 1000:.0f} ms, '
+            f'mean {statistics.fmean(result.latencies) * 1000 if done else 0:.0f} ms, '
+            f'{result.errors} connection errors [{statuses}]')
@@ -0,0 +1,90 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size_query_param = 'per_page'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset with the count and the page loaded through the async ORM"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [item async for item in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination keyed on `id`.
+
+    Each page is fetched with `WHERE id > <last id> ORDER BY id LIMIT n`, so page N
+    costs the same as page 1. No COUNT(*) is run unless the client asks for one
+    with `?with_count=true`.
+    """
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'per_page'
+    max_page_size = 200
+    count_query_param = 'with_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
+
+
+class FilterSearchPagination(StandardResultsSetPagination):
+    """
+    Page-number pagination by default, switching to keyset pagination when the
+    request has `?pagination=cursor` or carries a `cursor` from a previous page.
+    """
+    mode_query_param = 'pagination'
+
+    def uses_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.uses_keyset(request) else None
+        if self.keyset:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.uses_keyset(request) else None
+        if self.keyset:
+            # one indexed query, but DRF's cursor logic is synchronous
+            return await sync_to_async(self.keyset.paginate_queryset)(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,274 @@
+import asyncio
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+from admin_portal.interaction_log import InteractionLog
+from admin_portal.models import ActionInteraction
+from sdg_actions.models import ActionDb, ActionFacet
+from sdg_education.models import EducationDb
+from sdg_targets.models import SDG13_Target, SDG7_Target, SDGKeyword
+from .autocomplete import PrefixIndex, autocomplete_index
+from .cache import ModelVersions, response_cache
+
+
+class PrefixIndexTestCase(APITestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.extend([
+            ('action', 1, "Plant native trees"),
+            ('action', 2, "Share climate posts"),
+            ('education', 1, "Climate change and you"),
+        ])
+
+    def test_matches_start_of_any_word(self):
+        results = self.index.search('clim')
+        # whole-label matches rank before later-word matches
+        self.assertEqual([(r['kind'], r['id']) for r in results], [('education', 1), ('action', 2)])
+        self.assertEqual(results[0]['label'], "Climate change and you")
+        self.assertEqual(self.index.search('native t')[0]['id'], 1)
+
+    def test_finished_word_does_not_match_longer_words(self):
+        self.assertEqual(self.index.search('tree '), [])
+        self.assertEqual(len(self.index.search('trees ')), 1)
+
+    def test_add_replaces_and_remove_drops(self):
+        self.index.add('action', 1, "Plant fruit trees")
+        self.assertEqual(self.index.search('native'), [])
+        self.assertEqual(self.index.search('fruit')[0]['id'], 1)
+
+        self.index.remove('action', 1)
+        self.assertEqual(self.index.search('trees'), [])
+        self.assertEqual(len(self.index), 2)
+
+
+class ModelVersionsTestCase(APITestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.versions = ModelVersions(lambda: [ActionDb], check_interval=0)
+        self.versions.record(self.versions.current())
+
+    def test_own_bumps_are_not_changes(self):
+        response_cache.bump(ActionDb)
+        response_cache.bump(ActionDb)
+        self.assertFalse(self.versions.changed_elsewhere())
+
+    def test_bump_of_another_process_between_own_bumps_is_a_change(self):
+        response_cache.bump(ActionDb)
+        response_cache.cache.set(response_cache._version_key(ActionDb), 'another-process')
+        response_cache.bump(ActionDb)
+        self.assertTrue(self.versions.changed_elsewhere())
+
+
+class AutocompleteAPITestCase(APITestCase):
+    def setUp(self):
+        autocomplete_index.invalidate()
+        ActionDb.objects.create(id=1, actions="Save energy at home")
+        EducationDb.objects.create(id=1, title="Solar energy engineering")
+        SDG7_Target.objects.create(id=1, keyword="energy efficiency")
+        SDG13_Target.objects.create(id=1, keyword="Energy efficiency")
+        self.url = reverse('catalogue-autocomplete')
+
+    def test_suggestions_from_all_sources(self):
+        resp = self.client.get(self.url, {'q': 'ener'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # the keyword is listed by both SDG 7 and SDG 13 but suggested once
+        self.assertEqual(resp.data, [
+            {'id': SDGKeyword.objects.get(source='sdg7_target').pk, 'label': "energy efficiency",
+             'kind': 'keyword'},
+            {'id': 1, 'label': "Save energy at home", 'kind': 'action'},
+            {'id': 1, 'label': "Solar energy engineering", 'kind': 'education'},
+        ])
+
+        resp = self.client.get(self.url, {'q': 'ener', 'kind': 'action,education', 'limit': 1})
+        self.assertEqual(resp.data, [{'id': 1, 'label': "Save energy at home", 'kind': 'action'}])
+
+    def test_lookups_do_not_query_database(self):
+        self.client.get(self.url, {'q': 'sol'})
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, {'q': 'sola'})
+        self.assertEqual(resp.data[0]['label'], "Solar energy engineering")
+
+    def test_index_follows_saves_and_deletes(self):
+        self.client.get(self.url, {'q': 'sol'})
+        with self.captureOnCommitCallbacks(execute=True):
+            EducationDb.objects.create(id=2, title="Wind farm design")
+            SDG7_Target.objects.create(id=2, keyword="wind power")
+        resp = self.client.get(self.url, {'q': 'wind'})
+        self.assertEqual([r['label'] for r in resp.data], ["wind power", "Wind farm design"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ActionDb.objects.get(id=1).delete()
+        resp = self.client.get(self.url, {'q': 'save'})
+        self.assertEqual(resp.data, [])
+
+    def test_index_rebuilds_when_another_process_changes_keywords(self):
+        self.client.get(self.url, {'q': 'sol'})
+        # load_catalogue rebuilds SDGKeyword without signals and bumps its version
+        SDGKeyword.objects.filter(keyword="energy efficiency").update(keyword="wind power")
+        response_cache.cache.set(response_cache._version_key(SDGKeyword), 'another-process')
+
+        with mock.patch.object(autocomplete_index.versions, 'check_interval', 0), \
+                mock.patch.object(autocomplete_index, 'background', False):
+            resp = self.client.get(self.url, {'q': 'wind'})
+        self.assertEqual([r['label'] for r in resp.data], ["wind power"])
+
+    def test_own_saves_do_not_reload_the_index(self):
+        self.client.get(self.url, {'q': 'sol'})
+        with mock.patch.object(autocomplete_index.versions, 'check_interval', 0), \
+                mock.patch.object(autocomplete_index, 'load', wraps=autocomplete_index.load) as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                EducationDb.objects.create(id=2, title="Wind farm design")
+            resp = self.client.get(self.url, {'q': 'wind'})
+        self.assertEqual([r['label'] for r in resp.data], ["Wind farm design"])
+        load.assert_not_called()
+
+    def test_unknown_kind_is_rejected(self):
+        resp = self.client.get(self.url, {'q': 'ener', 'kind': 'plans'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LoadCatalogueTestCase(APITestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.write('action_db_202301051247.csv',
+                   ['id', 'Actions', 'Level', 'Digital actions', 'SDGs', 'Individual/Organization',
+                    'Related Industry (org only)'],
+                   [['1', 'Plant native trees ', '5,6', '0\u3000', ' 13, 15', '1', ''],
+                    ['2', 'Audit office energy', '6', '1', '7', '2',
+                     'Electricity, gas, water and waste services, Manufacturing'],
+                    ['x', 'Broken row', '', '', '', '', '']])
+        self.write('sdg7.csv', ['id', 'keyword', 'sdggoal', 'target', 'reference1', 'reference2', 'note'],
+                   [['1', 'renewable energy', '3', '7.2', '', '', ''],
+                    ['2', '=======', '', '', '', '', '']])
+
+    def write(self, name, header, rows):
+        with open(os.path.join(self.tmp.name, name), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('load_catalogue', 'actions', 'sdg7', '--data-dir', self.tmp.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_loads_and_cleans_rows(self):
+        rejects = os.path.join(self.tmp.name, 'rejects.csv')
+        out = self.load('--rejects', rejects, '--batch-size', '1')
+
+        self.assertIn('actions: 2 rows written, 1 rejected', out)
+        self.assertIn('sdg7: 1 rows written, 1 rejected', out)
+        with open(rejects) as f:
+            self.assertEqual([row[:2] for row in csv.reader(f)][1:], [['actions', '4'], ['sdg7', '3']])
+
+        first, second = ActionDb.objects.order_by('id')
+        self.assertEqual((first.actions, first.level, first.digital_actions), ('Plant native trees', 5, 0))
+        self.assertEqual(list(first.sdgs), ['13', '15'])
+        self.assertEqual(list(second.related_industry),
+                         ['Electricity gas water and waste services', 'Manufacturing'])
+        # the goal comes from the file, not the sdggoal column
+        self.assertEqual(SDGKeyword.objects.get().sdggoal, '7')
+
+    def test_rerun_updates_in_place_and_refreshes_derived_tables(self):
+        self.load()
+        self.write('sdg7.csv', ['id', 'keyword', 'sdggoal', 'target'], [['1', 'solar power', '7', '7.2']])
+        self.write('action_db_202301051247.csv', ['id', 'Actions', 'SDGs'], [['1', 'Plant fruit trees', '15']])
+        # entered by admins, or read from columns this file does not have
+        ActionDb.objects.filter(id=1).update(award=1, award_description='Gold', location='Australia')
+        autocomplete_index.ensure_built()
+        self.load()
+
+        self.assertEqual(ActionDb.objects.count(), 2)
+        action = ActionDb.objects.get(id=1)
+        self.assertEqual(action.actions, 'Plant fruit trees')
+        # columns missing from the second file keep their values
+        self.assertEqual((action.award, action.award_description, action.location), (1, 'Gold', 'Australia'))
+        self.assertEqual((action.level, action.digital_actions), (5, 0))
+        self.assertEqual(list(ActionFacet.objects.filter(action_id=1, facet='sdg').values_list('value', flat=True)),
+                         ['15'])
+        self.assertEqual(list(SDGKeyword.objects.values_list('keyword', flat=True)), ['solar power'])
+        self.assertEqual(autocomplete_index.search('solar')[0]['label'], 'solar power')
+
+    def test_rerun_only_rewrites_changed_derived_rows(self):
+        self.load()
+        keyword = SDGKeyword.objects.get()
+        facets = dict(ActionFacet.objects.values_list('value', 'pk').filter(facet='sdg'))
+        self.write('action_db_202301051247.csv', ['id', 'SDGs'], [['1', '13']])
+        self.load()
+
+        # the rows still right keep their ids; only the dropped SDG is gone
+        self.assertEqual(SDGKeyword.objects.get().pk, keyword.pk)
+        self.assertEqual(dict(ActionFacet.objects.values_list('value', 'pk').filter(facet='sdg')),
+                         {'13': facets['13'], '7': facets['7']})
+
+    def test_unknown_dataset_is_an_error(self):
+        with self.assertRaises(CommandError):
+            call_command('load_catalogue', 'plans', stdout=StringIO())
+
+
+class AsyncViewsTestCase(APITestCase):
+    def setUp(self):
+        response_cache.clear()
+        for i in range(1, 13):
+            action = ActionDb.objects.create(id=i, actions=f"Save energy {i}", sdgs=['7'] if i % 2 else ['13'])
+            ActionInteraction.objects.create(actionId=action, actionName=action.actions, related_sdgs='7')
+        EducationDb.objects.create(id=1, title="Solar energy engineering")
+
+    def sync_response(self, url, params=None, method='get'):
+        """The same request answered by the sync implementation of the view"""
+        view = resolve(url).func.view_class
+        sync_view = type(view.__name__, (view,), {'async_views': False}).as_view()
+        request = getattr(APIRequestFactory(), method)(url, params, format='json' if method == 'post' else None)
+        response = sync_view(request)
+        response.render()
+        return response
+
+    def test_views_are_served_async(self):
+        for name in ['action-search', 'action-filter-search', 'education-search', 'education-filter-search',
+                     'topEducations', 'topActions', 'logEducationInteraction', 'logActionInteraction']:
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func), name)
+
+    def test_async_responses_match_sync(self):
+        requests = [
+            (reverse('action-search'), {'q': 'energy'}, 'get'),
+            (reverse('action-filter-search'), {'sdgs': '7', 'page': 2, 'page_size': 2}, 'get'),
+            (reverse('education-search'), {'q': 'solar'}, 'get'),
+            (reverse('education-filter-search'), {}, 'get'),
+            (reverse('topActions'), {'time_range': 'past day'}, 'post'),
+        ]
+        for url, params, method in requests:
+            response = getattr(self.client, method)(url, params, format='json' if method == 'post' else None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            response_cache.clear()
+            expected = self.sync_response(url, params, method)
+            self.assertEqual(response.json(), json.loads(expected.content), url)
+
+    def test_async_logging_records_interaction(self):
+        log = InteractionLog(spool_dir=tempfile.mkdtemp(), background=False)
+        record = log.record
+
+        def off_the_event_loop(*args):
+            # the spool file is written with blocking I/O
+            with self.assertRaises(RuntimeError):
+                asyncio.get_running_loop()
+            record(*args)
+
+        with mock.patch('admin_portal.views.interaction_log', log), \
+                mock.patch.object(log, 'record', side_effect=off_the_event_loop):
+            resp = self.client.post(reverse('logActionInteraction'), {'actionId': 3}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        log.flush()
+        os.rmdir(log.spool_dir)
+        self.assertEqual(ActionInteraction.objects.filter(actionId=3).count(), 2)
+
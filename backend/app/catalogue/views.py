@@ -0,0 +1,35 @@
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .autocomplete import autocomplete_index, KINDS
+from .fields import parse_field_list
+
+
+class AutocompleteView(APIView):
+    """
+    GET /api/catalogue/autocomplete/?q=<text>[&kind=action,education,keyword][&limit=<n>]
+
+    Returns up to `limit` (default 10, at most 50) suggestions as `{id, label, kind}` for
+    action titles, education titles and SDG keywords having a word that starts with the
+    text. Lookups are answered from the in-memory prefix index without touching the database.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    default_limit = 10
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        kinds = parse_field_list(request.query_params.get('kind', '')) or KINDS
+        unknown = [kind for kind in kinds if kind not in KINDS]
+        if unknown:
+            raise ValidationError({'kind': f"Unknown kind(s): {', '.join(unknown)}."})
+
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Limit must be an integer.'})
+        limit = max(1, min(limit, self.max_limit))
+
+        query = request.query_params.get('q', '')
+        return Response(autocomplete_index.search(query, limit=limit, kinds=tuple(kinds)))
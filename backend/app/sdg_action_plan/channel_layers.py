@@ -0,0 +1,250 @@
+"""
+A channel layer for several ASGI processes on one host, backed by a SQLite file.
+
+Every process sharing the file can send to any channel and group. Messages
+live in one table until their receiver takes them. Each process runs a
+single poller that moves the messages for its own process-specific channels
+into in-memory queues, so many consumers cost one query per poll. Group
+membership is a table too, so group_send from any process reaches consumers
+connected to every other one.
+
+The file is opened in WAL mode, so readers never block the single writer.
+Latency is bounded by `poll_interval` (20 ms by default). That is fine for
+form collaboration and needs no extra service; use channels_redis when the
+app spans several hosts.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    process TEXT NOT NULL,
+    expires REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id);
+CREATE INDEX IF NOT EXISTS messages_process ON messages (process, id);
+CREATE TABLE IF NOT EXISTS groups (
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (name, channel)
+);
+"""
+
+
+def channel_process(channel):
+    """The process part of a process-specific channel ("prefix.<process>!..."), '' for others"""
+    if '!' not in channel:
+        return ''
+    return channel[:channel.index('!')].rsplit('.', 1)[-1]
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=None, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.02, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path or os.path.join(tempfile.gettempdir(), 'channels.sqlite3'))
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.client_prefix = uuid.uuid4().hex[:12]
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._buffers = defaultdict(asyncio.Queue)  # specific channel -> (expires, message)
+        self._receiving = defaultdict(int)
+        self._poller = None
+        self._poller_loop = None
+        self._next_cleanup = 0
+
+    # Database access; every method below runs in a worker thread
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def _write(self, work):
+        conn = self._db()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def _insert(self, conn, channel, body):
+        conn.execute('INSERT INTO messages (channel, process, expires, body) VALUES (?, ?, ?, ?)',
+                     (channel, channel_process(channel), time.time() + self.expiry, body))
+
+    def _send(self, channel, body):
+        def work(conn):
+            queued = conn.execute('SELECT COUNT(*) FROM messages WHERE channel = ? AND expires >= ?',
+                                  (channel, time.time())).fetchone()[0]
+            if queued >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            self._insert(conn, channel, body)
+        self._write(work)
+
+    def _group_send(self, group, body):
+        def work(conn):
+            channels = [row[0] for row in conn.execute(
+                'SELECT channel FROM groups WHERE name = ? AND expires >= ?', (group, time.time()))]
+            if not channels:
+                return
+            marks = ','.join('?' * len(channels))
+            queued = dict(conn.execute(
+                f'SELECT channel, COUNT(*) FROM messages WHERE channel IN ({marks}) AND expires >= ? GROUP BY channel',
+                [*channels, time.time()]))
+            for channel in channels:
+                # like the other layers, a full member does not stop the rest of the group
+                if queued.get(channel, 0) < self.get_capacity(channel):
+                    self._insert(conn, channel, body)
+        self._write(work)
+
+    def _pop(self, channel):
+        def work(conn):
+            row = conn.execute('SELECT id, expires, body FROM messages WHERE channel = ? ORDER BY id LIMIT 1',
+                               (channel,)).fetchone()
+            if row:
+                conn.execute('DELETE FROM messages WHERE id = ?', (row[0],))
+            return row
+        return self._write(work)
+
+    def _take_local(self):
+        """Take every message waiting for this process's specific channels"""
+        def work(conn):
+            rows = conn.execute('SELECT id, channel, expires, body FROM messages WHERE process = ? ORDER BY id',
+                                (self.client_prefix,)).fetchall()
+            if rows:
+                conn.execute('DELETE FROM messages WHERE process = ? AND id <= ?', (self.client_prefix, rows[-1][0]))
+            now = time.time()
+            if now >= self._next_cleanup:
+                # messages and memberships left behind by processes that went away
+                conn.execute('DELETE FROM messages WHERE expires < ?', (now,))
+                conn.execute('DELETE FROM groups WHERE expires < ?', (now,))
+                self._next_cleanup = now + self.expiry
+            return rows
+
+        # a plain read does not lock out the other processes, so idle polls skip the write lock
+        waiting = self._db().execute('SELECT 1 FROM messages WHERE process = ? LIMIT 1', (self.client_prefix,))
+        if waiting.fetchone() is None and time.time() < self._next_cleanup:
+            return []
+        return self._write(work)
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+        await asyncio.to_thread(self._send, channel, json.dumps(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if '!' not in channel:
+            while True:
+                row = await asyncio.to_thread(self._pop, channel)
+                if row is None:
+                    await asyncio.sleep(self.poll_interval)
+                elif row[1] >= time.time():
+                    return json.loads(row[2])
+
+        self._ensure_poller()
+        self._receiving[channel] += 1
+        try:
+            while True:
+                expires, message = await self._buffers[channel].get()
+                if expires >= time.time():
+                    return message
+        finally:
+            self._receiving[channel] -= 1
+            if not self._receiving[channel]:
+                del self._receiving[channel]
+                if self._buffers[channel].empty():
+                    del self._buffers[channel]
+
+    async def new_channel(self, prefix='specific'):
+        return f'{prefix}.{self.client_prefix}!{uuid.uuid4().hex}'
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._poller is not None and self._poller_loop is loop and not self._poller.done():
+            return
+        if self._poller_loop is not loop:
+            # queues belong to the loop that created them
+            self._buffers.clear()
+        self._poller_loop = loop
+        self._poller = loop.create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            rows = await asyncio.to_thread(self._take_local)
+            now = time.time()
+            for _, channel, expires, body in rows:
+                if expires < now:
+                    continue
+                if channel not in self._receiving and self._buffers[channel].qsize() >= self.get_capacity(channel):
+                    # nobody is reading this channel (its consumer disconnected); drop the oldest
+                    self._buffers[channel].get_nowait()
+                self._buffers[channel].put_nowait((expires, json.loads(body)))
+            if not rows:
+                await asyncio.sleep(self.poll_interval)
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await asyncio.to_thread(self._write, lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO groups (name, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry)))
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await asyncio.to_thread(self._write, lambda conn: conn.execute(
+            'DELETE FROM groups WHERE name = ? AND channel = ?', (group, channel)))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_group_name(group)
+        await asyncio.to_thread(self._group_send, group, json.dumps(message))
+
+    # Flush extension
+
+    async def flush(self):
+        def work(conn):
+            conn.execute('DELETE FROM messages')
+            conn.execute('DELETE FROM groups')
+        await asyncio.to_thread(self._write, work)
+        self._buffers.clear()
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
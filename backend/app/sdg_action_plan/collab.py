@@ -0,0 +1,788 @@
+"""
+Operation-based collaborative editing of action plans.
+
+Clients edit a plan by sending patches: a field path ("description",
+"plan_content.steps.input1", ...), the new value and the document version the
+client last saw. Patches are applied to an in-memory copy of the plan shared by
+the whole room, each one bumping the version. A patch whose base version is
+behind is rebased when nobody else changed an overlapping path in the meantime
+and rejected otherwise, so the client can reapply its edit on the current value
+instead of silently overwriting someone else's.
+
+The database only sees batched writes: a room's document is flushed at most
+once per `flush_interval` while edits keep coming, or as soon as the room has
+been idle for `idle_flush`, writing just the changed columns in one UPDATE.
+Saves made outside the room (the REST API) are merged into its document as
+new versions, so a later flush never writes back a stale copy.
+
+A plan's room lives in one process at a time, whichever holds its lease;
+consumers connected to other processes reach it through the channel layer
+(see CollabRooms). The consumer in real_time_sync.py drives all of this
+through `collab_rooms`.
+"""
+import asyncio
+import copy
+import logging
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from functools import partial
+from typing import Awaitable, Callable, Dict, Optional
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('impact_project_name', 'name_of_designers', 'description')
+PLAN_CONTENT = 'plan_content'
+EDITABLE_FIELDS = TEXT_FIELDS + (PLAN_CONTENT,)
+DOCS_FIELDS = ('google_doc_id', 'google_doc_url', 'google_doc_created')
+MAX_PATH_DEPTH = 6
+
+
+class PatchError(ValueError):
+    """A patch that can never be applied (unknown field, bad path or value)"""
+
+
+class Conflict(Exception):
+    """A patch overlapping an edit its author has not seen yet"""
+
+    def __init__(self, path, version, value):
+        super().__init__(f'{path} was changed concurrently')
+        self.path = path
+        self.version = version
+        self.value = value
+
+
+def split_path(path) -> tuple:
+    parts = tuple(str(path or '').split('.'))
+    if not all(parts) or parts[0] not in EDITABLE_FIELDS or len(parts) > MAX_PATH_DEPTH:
+        raise PatchError(f'Cannot edit {path!r}')
+    if parts[0] in TEXT_FIELDS and len(parts) > 1:
+        raise PatchError(f'{parts[0]} has no nested fields')
+    return parts
+
+
+def overlaps(a: tuple, b: tuple) -> bool:
+    """Whether one path is the other or contains it"""
+    size = min(len(a), len(b))
+    return a[:size] == b[:size]
+
+
+class Operation:
+    """An applied patch, kept in the log to detect conflicts"""
+
+    __slots__ = ('version', 'parts', 'author')
+
+    def __init__(self, version, parts, author):
+        self.version = version
+        self.parts = parts
+        self.author = author
+
+
+class CollabDocument:
+    """
+    The editable fields of one action plan, shared by everyone in its room.
+
+    `apply()` is called from the event loop and `flush()` from a thread, so both
+    go through a lock; neither holds it while talking to the database.
+    """
+
+    flush_interval = 0.5
+    idle_flush = 0.2
+    log_size = 500
+
+    def __init__(self, plan_id, fields: dict, clock: Callable[[], float] = time.monotonic):
+        self.plan_id = plan_id
+        self.fields = {name: copy.deepcopy(fields.get(name)) for name in EDITABLE_FIELDS}
+        if not isinstance(self.fields[PLAN_CONTENT], dict):
+            self.fields[PLAN_CONTENT] = {}
+        # columns as the database has them: loaded, flushed or saved elsewhere
+        self._persisted = {name: copy.deepcopy(fields.get(name)) for name in EDITABLE_FIELDS}
+        self.version = 0
+        self.clock = clock
+        self._log = deque(maxlen=self.log_size)
+        self._lock = threading.Lock()
+        # column -> version of its latest unflushed change
+        self._dirty: Dict[str, int] = {}
+        # columns a flush is writing right now
+        self._flushing = set()
+        self._dirty_since = None
+        self._last_edit = None
+
+    @classmethod
+    def load(cls, plan_id, **kwargs) -> Optional['CollabDocument']:
+        from .models import SDGActionPlan
+
+        fields = SDGActionPlan.objects.filter(pk=plan_id).values(*EDITABLE_FIELDS).first()
+        return None if fields is None else cls(plan_id, fields, **kwargs)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+    def get(self, path):
+        parts = split_path(path)
+        with self._lock:
+            return copy.deepcopy(self._get(parts))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'version': self.version, **copy.deepcopy(self.fields)}
+
+    def apply(self, path, value, base_version=None, author=None) -> int:
+        """
+        Apply a patch and return the new version.
+
+        Without `base_version` the patch applies on top of whatever is current.
+        Raises Conflict when someone other than `author` changed an overlapping
+        path after `base_version`, or when the log no longer reaches back that far.
+        """
+        parts = split_path(path)
+        with self._lock:
+            if base_version is not None:
+                self._check_conflicts(parts, int(base_version), author)
+            self._set(parts, copy.deepcopy(value))
+            self.version += 1
+            self._log.append(Operation(self.version, parts, author))
+            now = self.clock()
+            if not self._dirty:
+                self._dirty_since = now
+            self._dirty[parts[0]] = self.version
+            self._last_edit = now
+            return self.version
+
+    def merge_saved(self, fields: dict) -> list:
+        """
+        Take in columns saved to the database outside the room.
+
+        A column whose saved value differs from what the database last had
+        according to the room was edited elsewhere: it replaces the room's copy
+        as a new version, so clients that have not seen it get a Conflict.
+        Saves that only wrote the stored value back are ignored, leaving the
+        room's unflushed edits in place. Returns the (column, value, version)
+        of every change taken in.
+        """
+        changes = []
+        with self._lock:
+            for column, value in fields.items():
+                if column not in EDITABLE_FIELDS or value == self._persisted[column]:
+                    continue
+                self._persisted[column] = copy.deepcopy(value)
+                if column == PLAN_CONTENT and not isinstance(value, dict):
+                    value = {}
+                self._set((column,), copy.deepcopy(value))
+                self.version += 1
+                self._log.append(Operation(self.version, (column,), None))
+                if column in self._flushing:
+                    # the flush in flight may write the older copy over it; write it again after
+                    if not self._dirty:
+                        self._dirty_since = self._last_edit = self.clock()
+                    self._dirty[column] = self.version
+                else:
+                    self._dirty.pop(column, None)
+                changes.append((column, copy.deepcopy(self.fields[column]), self.version))
+        return changes
+
+    def _check_conflicts(self, parts, base_version, author):
+        if base_version >= self.version:
+            return
+        if not self._log or self._log[0].version > base_version + 1:
+            # edits the client has not seen were dropped from the log
+            raise Conflict('.'.join(parts), self.version, copy.deepcopy(self._get(parts)))
+        for op in reversed(self._log):
+            if op.version <= base_version:
+                break
+            # a client's own patches never conflict with each other; anonymous ones always might
+            if overlaps(op.parts, parts) and (author is None or op.author != author):
+                raise Conflict('.'.join(parts), self.version, copy.deepcopy(self._get(parts)))
+
+    def _get(self, parts):
+        value = self.fields
+        for part in parts:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    def _set(self, parts, value):
+        if len(parts) == 1:
+            if parts[0] in TEXT_FIELDS:
+                value = '' if value is None else str(value)
+            elif not isinstance(value, dict):
+                raise PatchError(f'{PLAN_CONTENT} must be an object')
+            self.fields[parts[0]] = value
+            return
+        target = self.fields
+        for part in parts[:-1]:
+            child = target.get(part)
+            if child is None:
+                child = target[part] = {}
+            elif not isinstance(child, dict):
+                raise PatchError(f"{'.'.join(parts)} is inside a value that is not an object")
+            target = child
+        target[parts[-1]] = value
+
+    def should_flush(self, now=None) -> bool:
+        if not self._dirty:
+            return False
+        now = self.clock() if now is None else now
+        return now - self._dirty_since >= self.flush_interval or now - self._last_edit >= self.idle_flush
+
+    def flush(self) -> bool:
+        """Write the changed columns in one UPDATE; returns whether anything was written"""
+        from .models import SDGActionPlan
+
+        with self._lock:
+            if not self._dirty:
+                return False
+            written = dict(self._dirty)
+            values = {column: copy.deepcopy(self.fields[column]) for column in written}
+            self._flushing.update(written)
+        try:
+            # update() rather than save(): only the edited columns are written, never stale copies of the others
+            SDGActionPlan.objects.filter(pk=self.plan_id).update(updated_at=timezone.now(), **values)
+        finally:
+            with self._lock:
+                self._flushing.difference_update(written)
+        with self._lock:
+            for column, version in written.items():
+                self._persisted[column] = values[column]
+                if self._dirty.get(column) == version:
+                    del self._dirty[column]
+            if self._dirty:
+                self._dirty_since = self.clock()
+        return True
+
+
+def flush_document(document: CollabDocument, on_flush: Optional[Callable] = None) -> bool:
+    """Flush from a worker thread, with the connection handling a thread outside a request needs"""
+    close_old_connections()
+    try:
+        flushed = document.flush()
+    finally:
+        close_old_connections()
+    if flushed and on_flush:
+        on_flush(document)
+    return flushed
+
+
+class Flusher:
+    """Background task flushing a document while its room is open, and once more when it closes"""
+
+    def __init__(self, document: CollabDocument, on_flush: Optional[Callable] = None, tick=None):
+        self.document = document
+        self.on_flush = on_flush
+        self.tick = min(document.flush_interval, document.idle_flush) / 2 if tick is None else tick
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        flush = sync_to_async(flush_document)
+        while True:
+            await asyncio.sleep(self.tick)
+            if self.document.should_flush():
+                try:
+                    await flush(self.document, self.on_flush)
+                except Exception as e:
+                    # the changes stay dirty and are retried on the next tick
+                    logger.warning(f"Flushing action plan {self.document.plan_id} failed: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await sync_to_async(flush_document)(self.document, self.on_flush)
+
+
+class PresenceBroadcaster:
+    """
+    Merges a room's presence updates into frames sent at most `rate` times a second.
+
+    Only the latest cursor of each user and the latest typing state of each
+    user and field are kept, so however chatty the clients are a room sends one
+    frame per tick, holding one entry per user at most. The task sleeps while
+    nothing is pending.
+    """
+
+    rate = 20
+
+    def __init__(self, rate=None):
+        self.interval = 1 / (rate or self.rate)
+        self._send = None
+        self._cursors: Dict[object, dict] = {}
+        self._typing: Dict[tuple, dict] = {}
+        self._users = None
+        self._pending = asyncio.Event()
+        self._task = None
+
+    def bind(self, send: Callable[[dict], Awaitable]):
+        """Start sending frames through the coroutine function `send`; later calls are ignored"""
+        if self._task is None:
+            self._send = send
+            self._task = asyncio.ensure_future(self._run())
+
+    def cursor(self, user_id, field, position):
+        self._cursors[user_id] = {'user_id': user_id, 'field': field, 'position': position}
+        self._pending.set()
+
+    def typing(self, user_id, field, is_typing):
+        self._typing[user_id, field] = {'user_id': user_id, 'field': field, 'is_typing': bool(is_typing)}
+        self._pending.set()
+
+    def users_changed(self, users: list):
+        self._users = users
+        self._pending.set()
+
+    def frame(self) -> Optional[dict]:
+        """Take everything pending as one frame"""
+        self._pending.clear()
+        if not (self._cursors or self._typing or self._users is not None):
+            return None
+        frame = {
+            'cursors': list(self._cursors.values()),
+            'typing': list(self._typing.values()),
+            'users': self._users,
+        }
+        self._cursors, self._typing, self._users = {}, {}, None
+        return frame
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            frame = self.frame()
+            if frame is not None:
+                try:
+                    await self._send(frame)
+                except Exception as e:
+                    logger.warning(f"Sending a presence frame failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class RoomUnavailable(Exception):
+    """The process serving a room did not answer"""
+
+
+class RoomState:
+    """
+    A plan's room in the process that serves it: the plan's editable fields
+    (as a CollabDocument), its Google Docs linkage, who is connected from any
+    process and the broadcaster of their presence. It is loaded
+    with one query when the room opens and dropped after the last user
+    leaves, so handling a message never has to read the plan again.
+    """
+
+    def __init__(self, plan_id, fields: dict, on_flush: Optional[Callable] = None, channel=None):
+        self.plan_id = plan_id
+        # where the rooms of other processes send their requests
+        self.channel = channel
+        self.document = CollabDocument(plan_id, fields)
+        self.docs = {name: fields.get(name) for name in DOCS_FIELDS}
+        # channel name -> {'user_id', 'username'}
+        self.users: Dict[str, dict] = {}
+        self.flusher = Flusher(self.document, on_flush)
+        self.presence = PresenceBroadcaster()
+        self.tasks = []
+
+    @classmethod
+    def load(cls, plan_id, on_flush: Optional[Callable] = None, channel=None) -> Optional['RoomState']:
+        from .models import SDGActionPlan
+
+        fields = SDGActionPlan.objects.filter(pk=plan_id).values(*EDITABLE_FIELDS, *DOCS_FIELDS).first()
+        return None if fields is None else cls(plan_id, fields, on_flush, channel)
+
+    @property
+    def owner(self):
+        return self.channel
+
+    @property
+    def has_google_doc(self):
+        return bool(self.docs['google_doc_id'] and self.docs['google_doc_created'])
+
+    def merge_saved(self, fields: dict) -> list:
+        """Take in a save made outside the room; returns the document changes to broadcast"""
+        self.docs.update((name, fields[name]) for name in DOCS_FIELDS if name in fields)
+        return self.document.merge_saved(fields)
+
+    def active_users(self) -> list:
+        """Connected users, once each however many connections they have open"""
+        return list({user['user_id']: user for user in self.users.values()}.values())
+
+    def add_user(self, channel_name, user: dict):
+        self.users[channel_name] = user
+        self.presence.users_changed(self.active_users())
+
+    def remove_user(self, channel_name):
+        self.users.pop(channel_name, None)
+        if self.users:
+            self.presence.users_changed(self.active_users())
+
+    def welcome(self) -> dict:
+        """What a joining consumer starts from: the current fields with their version, the Docs link and the users"""
+        snapshot = self.document.snapshot()
+        return {'version': snapshot.pop('version'), 'form_data': snapshot,
+                'google_doc_url': self.docs['google_doc_url'], 'users': self.active_users()}
+
+
+class RemoteRoom:
+    """
+    A plan's room as seen from a process that does not serve it. Requests go to
+    the owner's channel and are answered on this room's own channel; presence
+    updates are merged here first and forwarded a frame at a time.
+    """
+
+    def __init__(self, plan_id, owner, channel, channel_layer, timeout):
+        self.plan_id = plan_id
+        self.owner = owner
+        self.channel = channel
+        self.channel_layer = channel_layer
+        self.timeout = timeout
+        self.presence = PresenceBroadcaster()
+        self.tasks = []
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+
+    async def request(self, message: dict):
+        """Send the owner a request and return its answer; asyncio.TimeoutError if none comes"""
+        request_id = next(self._ids)
+        reply = self._replies[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.channel_layer.send(self.owner, {**message, 'reply_to': self.channel, 'request_id': request_id})
+            return await asyncio.wait_for(reply, self.timeout)
+        finally:
+            self._replies.pop(request_id, None)
+
+    async def tell(self, message: dict):
+        """Send the owner a message that needs no answer"""
+        try:
+            await self.channel_layer.send(self.owner, message)
+        except Exception as e:
+            logger.warning(f"Sending {message['type']} to the room of plan {self.plan_id} failed: {e}")
+
+    def answer(self, message: dict):
+        reply = self._replies.get(message['request_id'])
+        if reply is not None and not reply.done():
+            reply.set_result(message['result'])
+
+
+class CollabRooms:
+    """
+    The rooms this process takes part in, by plan id.
+
+    Each plan's room is served by one process at a time, the one holding its
+    CollabLease, so every editor shares one document and one version sequence
+    whichever process their websocket landed on. A process with consumers in a
+    room it does not serve keeps a RemoteRoom forwarding their joins, patches
+    and presence to the owner's channel; the owner broadcasts to the room's
+    group either way.
+
+    The owner renews its lease every `lease_ttl / 3` seconds and releases it
+    after the last user leaves and its edits are flushed. An owner that dies
+    leaves the lease to expire: requests to it time out meanwhile, and then the
+    next process to notice loads the plan and serves the room, losing only the
+    edits the old owner had not flushed.
+    """
+
+    lease_ttl = 10
+    request_timeout = 5
+
+    def __init__(self, on_flush: Optional[Callable] = None, channel_layer=None):
+        self.on_flush = on_flush
+        self._channel_layer = channel_layer
+        self._rooms: Dict[int, object] = {}
+        # plan id -> this process's consumers in the room, channel name -> {'user_id', 'username'}
+        self._local: Dict[int, Dict[str, dict]] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def channel_layer(self):
+        return self._channel_layer or get_channel_layer()
+
+    def __contains__(self, plan_id):
+        return plan_id in self._rooms
+
+    def get(self, plan_id) -> Optional[RoomState]:
+        """The plan's room if this process serves it"""
+        room = self._rooms.get(plan_id)
+        return room if isinstance(room, RoomState) else None
+
+    def saved(self, plan_id, fields: dict):
+        """
+        Merge a save made outside the plan's room into the room, wherever it is
+        served, and tell its clients. Called from the saving thread after the commit.
+        """
+        from .models import CollabLease
+
+        room = self.get(plan_id)
+        if room is not None:
+            changes = room.merge_saved(fields)
+            if changes:
+                async_to_sync(self._broadcast_saved)(plan_id, changes)
+            return
+        owner = CollabLease.owner(plan_id)
+        if owner is not None:
+            async_to_sync(self.channel_layer.send)(owner, {'type': 'collab.saved', 'fields': fields})
+
+    async def join(self, plan_id, channel_name, user) -> Optional[dict]:
+        """
+        Add a consumer to the plan's room, opening the room if this process has
+        none; returns the room's `welcome()`, None if the plan does not exist.
+        """
+        entry = {'user_id': user.id, 'username': user.username}
+        async with self._lock:
+            if plan_id not in self._rooms and await self._open(plan_id) is None:
+                return None
+            self._local.setdefault(plan_id, {})[channel_name] = entry
+        return await self._call(plan_id, {'type': 'collab.join', 'channel': channel_name, 'user': entry})
+
+    async def leave(self, plan_id, channel_name):
+        async with self._lock:
+            local = self._local.get(plan_id, {})
+            if local.pop(channel_name, None) is None:
+                return
+            if not local:
+                del self._local[plan_id]
+            room = self._rooms.get(plan_id)
+            if isinstance(room, RoomState):
+                room.remove_user(channel_name)
+                if room.users:
+                    return
+            elif room is not None:
+                await room.tell({'type': 'collab.leave', 'channel': channel_name})
+                if local:
+                    return
+            else:
+                return
+            await self._close(plan_id)
+
+    async def submit(self, plan_id, field, value, version, sender, user_id=None, timestamp=None) -> int:
+        """Apply a patch in the plan's room and broadcast it; raises PatchError or Conflict as `apply()` does"""
+        result = await self._call(plan_id, {'type': 'collab.patch', 'field': field, 'value': value, 'version': version,
+                                            'sender': sender, 'user_id': user_id, 'timestamp': timestamp})
+        if 'error' in result:
+            raise PatchError(result['error'])
+        if 'conflict' in result:
+            raise Conflict(**result['conflict'])
+        return result['version']
+
+    async def flush(self, plan_id) -> bool:
+        """Write the room's pending edits now; returns whether the plan has a Google Doc"""
+        result = await self._call(plan_id, {'type': 'collab.flush'})
+        return result['has_google_doc']
+
+    def cursor(self, plan_id, user_id, field, position):
+        room = self._rooms.get(plan_id)
+        if room is not None:
+            room.presence.cursor(user_id, field, position)
+
+    def typing(self, plan_id, user_id, field, is_typing):
+        room = self._rooms.get(plan_id)
+        if room is not None:
+            room.presence.typing(user_id, field, is_typing)
+
+    async def _open(self, plan_id):
+        """
+        Serve the plan's room, or follow the process that already does; the
+        caller holds the lock. None if the plan does not exist.
+        """
+        from .models import CollabLease
+
+        channel = await self.channel_layer.new_channel('collab')
+        owner = await database_sync_to_async(CollabLease.acquire)(plan_id, channel, timedelta(seconds=self.lease_ttl))
+        if owner is None:
+            return None
+        if owner == channel:
+            room = await database_sync_to_async(RoomState.load)(plan_id, self.on_flush, channel)
+            if room is None:
+                await database_sync_to_async(CollabLease.release)(plan_id, channel)
+                return None
+            room.flusher.start()
+            room.presence.bind(partial(self._send_presence, plan_id))
+        else:
+            room = RemoteRoom(plan_id, owner, channel, self.channel_layer, self.request_timeout)
+            room.presence.bind(lambda frame: room.tell({'type': 'collab.presence', 'frame': frame}))
+        room.tasks = [asyncio.ensure_future(self._serve(room)), asyncio.ensure_future(self._watch(room))]
+        self._rooms[plan_id] = room
+        return room
+
+    async def _close(self, plan_id):
+        """Stop a room; one this process serves is flushed before its lease is released"""
+        from .models import CollabLease
+
+        room = self._rooms.pop(plan_id)
+        for task in room.tasks:
+            task.cancel()
+        await asyncio.gather(*room.tasks, return_exceptions=True)
+        await room.presence.close()
+        if isinstance(room, RoomState):
+            # under the lock, so a room reopened right away loads the flushed plan
+            await room.flusher.close()
+            await database_sync_to_async(CollabLease.release)(plan_id, room.channel)
+
+    async def _close_idle(self, plan_id):
+        async with self._lock:
+            room = self._rooms.get(plan_id)
+            if isinstance(room, RoomState) and not room.users:
+                await self._close(plan_id)
+
+    async def _call(self, plan_id, message: dict):
+        """Send a request to the plan's room, following the room once if its owner does not answer"""
+        for retry in (True, False):
+            room = self._rooms.get(plan_id)
+            if room is None:
+                break
+            if isinstance(room, RoomState):
+                return await self._handle(room, message)
+            try:
+                return await room.request(message)
+            except asyncio.TimeoutError:
+                if retry:
+                    await self._recover(plan_id)
+        raise RoomUnavailable(f'The room of plan {plan_id} is not answering')
+
+    async def _recover(self, plan_id):
+        """Follow the plan's lease after its owner went away or changed, joining this process's consumers again"""
+        from .models import CollabLease
+
+        async with self._lock:
+            room = self._rooms.get(plan_id)
+            if room is None:
+                return
+            owner = await database_sync_to_async(CollabLease.owner)(plan_id)
+            if owner == room.owner:
+                return
+            logger.info(f"Room of plan {plan_id} moved from {room.owner} to {owner}")
+            await self._close(plan_id)
+            users = self._local.get(plan_id)
+            if not users:
+                return
+            room = await self._open(plan_id)
+            if room is None:
+                # the plan is gone; its consumers' requests now fail
+                del self._local[plan_id]
+                return
+            for channel_name, user in users.items():
+                message = {'type': 'collab.join', 'channel': channel_name, 'user': user}
+                try:
+                    await (self._handle(room, message) if isinstance(room, RoomState) else room.request(message))
+                except asyncio.TimeoutError:
+                    # the next check of the lease tries again
+                    logger.warning(f"Joining the room of plan {plan_id} again failed")
+                    return
+
+    async def _serve(self, room):
+        """Requests to a room this process serves, or answers to one it follows, as they arrive on its channel"""
+        while True:
+            message = await self.channel_layer.receive(room.channel)
+            if isinstance(room, RemoteRoom):
+                room.answer(message)
+                continue
+            try:
+                result = await self._handle(room, message)
+                if 'reply_to' in message:
+                    await self.channel_layer.send(message['reply_to'], {
+                        'type': 'collab.reply', 'request_id': message['request_id'], 'result': result})
+            except Exception:
+                logger.exception(f"Handling {message['type']} in the room of plan {room.plan_id} failed")
+
+    async def _watch(self, room):
+        """Renew the lease of a room this process serves, or check who serves one it follows"""
+        from .models import CollabLease
+
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if isinstance(room, RoomState):
+                    current = await database_sync_to_async(CollabLease.renew)(
+                        room.plan_id, room.channel, timedelta(seconds=self.lease_ttl))
+                else:
+                    current = await database_sync_to_async(CollabLease.owner)(room.plan_id) == room.owner
+            except Exception as e:
+                logger.warning(f"Checking the lease of plan {room.plan_id} failed: {e}")
+                continue
+            if not current:
+                # not awaited: _recover replaces the room, cancelling this task
+                asyncio.ensure_future(self._recover(room.plan_id))
+                return
+
+    async def _handle(self, room: RoomState, message: dict):
+        """Carry out a request to a room this process serves; remote callers get the result as it is"""
+        kind = message['type']
+        if kind == 'collab.join':
+            room.add_user(message['channel'], message['user'])
+            return room.welcome()
+        if kind == 'collab.leave':
+            room.remove_user(message['channel'])
+            if not room.users:
+                asyncio.ensure_future(self._close_idle(room.plan_id))
+        elif kind == 'collab.patch':
+            try:
+                version = room.document.apply(message['field'], message['value'], message['version'],
+                                              author=message['sender'])
+            except PatchError as e:
+                return {'error': str(e)}
+            except Conflict as conflict:
+                return {'conflict': {'path': conflict.path, 'version': conflict.version, 'value': conflict.value}}
+            await self.channel_layer.group_send(room_group(room.plan_id), {
+                'type': 'form_update_broadcast', 'field': message['field'], 'value': message['value'],
+                'version': version, 'user_id': message['user_id'], 'timestamp': message['timestamp'],
+                'sender': message['sender']})
+            return {'version': version}
+        elif kind == 'collab.presence':
+            for cursor in message['frame']['cursors']:
+                room.presence.cursor(cursor['user_id'], cursor['field'], cursor['position'])
+            for typing in message['frame']['typing']:
+                room.presence.typing(typing['user_id'], typing['field'], typing['is_typing'])
+        elif kind == 'collab.saved':
+            await self._broadcast_saved(room.plan_id, room.merge_saved(message['fields']))
+        elif kind == 'collab.flush':
+            await sync_to_async(flush_document)(room.document)
+            return {'has_google_doc': room.has_google_doc}
+        return None
+
+    async def _send_presence(self, plan_id, frame):
+        await self.channel_layer.group_send(room_group(plan_id), {'type': 'presence_broadcast', **frame})
+
+    async def _broadcast_saved(self, plan_id, changes):
+        """Send the room's clients the fields a save outside the room changed, like any other update"""
+        for field, value, version in changes:
+            await self.channel_layer.group_send(room_group(plan_id), {
+                'type': 'form_update_broadcast', 'field': field, 'value': value, 'version': version,
+                'user_id': None, 'timestamp': None, 'sender': None})
+
+
+def room_group(plan_id) -> str:
+    """Channel layer group of the consumers editing a plan"""
+    return f'form_{plan_id}'
+
+
+def schedule_docs_sync(document: CollabDocument):
+    from .docs_sync import docs_sync_queue
+
+    docs_sync_queue.schedule(document.plan_id)
+
+
+# Rooms of this process; every flush queues a Google Docs sync of the plan
+collab_rooms = CollabRooms(on_flush=schedule_docs_sync)
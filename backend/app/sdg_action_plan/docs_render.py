@@ -0,0 +1,211 @@
+"""
+Section-aware rendering of action plans into Google Docs batchUpdate requests.
+
+A plan is rendered into an ordered list of sections, each a `[key, text]` pair
+whose text ends with a newline; the document body is the sections laid out one
+after another from index 1. Given the sections last written to a document,
+`diff_requests` emits requests that only touch the sections that changed, and
+within a changed section only the characters between the common prefix and
+suffix. Requests are ordered from the end of the document to the start, so
+every index can be computed against the previous content.
+"""
+from typing import List, Optional, Tuple
+
+Section = Tuple[str, str]
+
+HEADING = 'heading'
+FIELD = 'field'
+TEXT = 'text'
+
+OTHER_FIELDS = [
+    ("importance", "Impact Importance"),
+    ("example", "Existing Example"),
+    ("resources", "Resources and Partnerships"),
+    ("impact", "Impact Avenues"),
+    ("risk", "Risks and Inhibitors"),
+    ("mitigation", "Mitigation Strategies"),
+]
+
+
+def utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, the unit of Google Docs indexes"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def as_text(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
+def render_sections(content: dict) -> List[Section]:
+    """Render plan fields (see docs_sync.plan_document_content) into document sections"""
+    plan_content = content.get('plan_content')
+    if not isinstance(plan_content, dict):
+        plan_content = {}
+    sections = []
+
+    def heading(key, title):
+        sections.append((f'heading:{key}', f'{title}\n'))
+
+    def field(key, label, value):
+        sections.append((f'field:{key}', f'{label}: {as_text(value)}\n'))
+
+    sections.append(('text:title', f'SDG Action Plan: {content.get("impact_project_name") or "Untitled"}\n\n'))
+
+    heading('basic', "Basic Information")
+    field('impact_project_name', "Project Name", content.get('impact_project_name'))
+    field('name_of_designers', "Designers", content.get('name_of_designers'))
+    field('description', "Description", content.get('description'))
+
+    heading('plan', "Plan Content")
+    if plan_content.get('SDGs'):
+        field('SDGs', "Related SDGs", plan_content['SDGs'])
+    field('role', "Role and Affiliation", plan_content.get('role'))
+    field('challenge', "Main Challenge", plan_content.get('challenge'))
+
+    heading('steps', "Implementation Steps")
+    steps = plan_content.get('steps')
+    if isinstance(steps, dict):
+        for i in range(1, 7):
+            if steps.get(f'input{i}'):
+                field(f'steps.input{i}', f"Step {i}", steps[f'input{i}'])
+
+    impact_types = plan_content.get('impact_types')
+    if isinstance(impact_types, dict) and any(impact_types.values()):
+        heading('impact_types', "Impact Types")
+        for rank, impact_type in impact_types.items():
+            if impact_type:
+                field(f'impact_types.{rank}', f"Rank {str(rank)[-1:]}", impact_type)
+
+    for field_key, field_name in OTHER_FIELDS:
+        if plan_content.get(field_key):
+            field(field_key, field_name, plan_content[field_key])
+
+    return sections
+
+
+def style_requests(key: str, text: str, start: int) -> list:
+    """Paragraph and text styles for a section freshly inserted at `start`"""
+    kind = key.split(':', 1)[0]
+    end = start + utf16_len(text)
+    requests = [
+        {
+            'updateParagraphStyle': {
+                'range': {'startIndex': start, 'endIndex': end},
+                'paragraphStyle': {'namedStyleType': 'HEADING_1' if kind == HEADING else 'NORMAL_TEXT'},
+                'fields': 'namedStyleType',
+            }
+        },
+        {
+            'updateTextStyle': {
+                'range': {'startIndex': start, 'endIndex': end},
+                'textStyle': {'bold': False},
+                'fields': 'bold',
+            }
+        },
+    ]
+    if kind == FIELD:
+        # bold the "Label" of "Label: value"
+        label = text.split(':', 1)[0]
+        requests.append({
+            'updateTextStyle': {
+                'range': {'startIndex': start, 'endIndex': start + utf16_len(label)},
+                'textStyle': {'bold': True},
+                'fields': 'bold',
+            }
+        })
+    return requests
+
+
+def insert_requests(sections: List[Section], start: int) -> list:
+    """Insert whole sections at `start`, styled"""
+    text = ''.join(section_text for _, section_text in sections)
+    if not text:
+        return []
+    requests = [{'insertText': {'location': {'index': start}, 'text': text}}]
+    for key, section_text in sections:
+        requests.extend(style_requests(key, section_text, start))
+        start += utf16_len(section_text)
+    return requests
+
+
+def delete_request(start: int, end: int) -> dict:
+    return {'deleteContentRange': {'range': {'startIndex': start, 'endIndex': end}}}
+
+
+def edit_requests(old: str, new: str, start: int) -> list:
+    """Replace only the middle of `old` that differs from `new`, keeping prefix and suffix"""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    at = start + utf16_len(old[:prefix])
+    requests = []
+    removed = old[prefix:len(old) - suffix]
+    if removed:
+        requests.append(delete_request(at, at + utf16_len(removed)))
+    added = new[prefix:len(new) - suffix]
+    if added:
+        requests.append({'insertText': {'location': {'index': at}, 'text': added}})
+    return requests
+
+
+def full_requests(sections: List[Section], end_index: Optional[int] = None) -> list:
+    """Replace the whole body of a document whose last content index is `end_index`"""
+    requests = []
+    if end_index and end_index - 1 > 1:
+        # the final newline of a document cannot be deleted
+        requests.append(delete_request(1, end_index - 1))
+    return requests + insert_requests(sections, 1)
+
+
+def diff_requests(old_sections: List[Section], new_sections: List[Section]) -> list:
+    """
+    Requests turning a body holding `old_sections` into one holding `new_sections`.
+
+    Both lists follow the canonical order of `render_sections`, so they are
+    merged by key: sections only in the new list are inserted where they belong,
+    sections only in the old one are deleted and sections in both are edited in
+    place when their text differs.
+    """
+    old_sections = [tuple(section) for section in old_sections]
+    new_keys = {key for key, _ in new_sections}
+    old_text = dict(old_sections)
+
+    # start index of every old section, and where a section inserted before it goes
+    starts = {}
+    index = 1
+    for key, text in old_sections:
+        starts[key] = index
+        index += utf16_len(text)
+    end = index
+
+    # changes as (position, order, requests); applied from the end backwards
+    changes = []
+    for key, text in old_sections:
+        if key not in new_keys:
+            changes.append((starts[key], 1, [delete_request(starts[key], starts[key] + utf16_len(text))]))
+
+    pending_inserts = []
+    for key, text in new_sections:
+        if key in old_text:
+            if pending_inserts:
+                changes.append((starts[key], 0, insert_requests(pending_inserts, starts[key])))
+                pending_inserts = []
+            if old_text[key] != text:
+                changes.append((starts[key], 2, edit_requests(old_text[key], text, starts[key])))
+        else:
+            pending_inserts.append((key, text))
+    if pending_inserts:
+        changes.append((end, 0, insert_requests(pending_inserts, end)))
+
+    # at one position: edit the section, then drop it, then insert new sections in front of it
+    changes.sort(key=lambda change: (change[0], change[1]), reverse=True)
+    return [request for _, _, requests in changes for request in requests]
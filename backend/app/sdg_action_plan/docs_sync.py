@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def plan_document_content(plan) -> dict:
+    """The plan fields written to its Google Doc"""
+    return {
+        'impact_project_name': plan.impact_project_name,
+        'name_of_designers': plan.name_of_designers,
+        'description': plan.description,
+        'plan_content': plan.plan_content,
+    }
+
+
+def default_service_factory():
+    from .google_docs_service import GoogleDocsService
+    return GoogleDocsService()
+
+
+class SyncJob:
+    """A pending write of one plan to its Google Doc"""
+
+    __slots__ = ('plan_id', 'due', 'first_requested', 'attempts')
+
+    def __init__(self, plan_id, due, first_requested, attempts=0):
+        self.plan_id = plan_id
+        self.due = due
+        self.first_requested = first_requested
+        self.attempts = attempts
+
+
+class DocsSyncQueue:
+    """
+    Writes action plans to Google Docs from background threads.
+
+    `schedule(plan_id)` only records that a plan needs syncing. Edits arriving
+    while a plan is pending push its sync back by `debounce` seconds, but never
+    more than `max_delay` after the first pending edit, so a burst of edits
+    becomes one Docs write of the latest saved content. A plan is never synced by
+    two workers at once; an edit made during a write schedules another one.
+    Failed writes are retried with exponential backoff and dropped after
+    `max_attempts`. Successful writes record `last_sync_time` and the sync state
+    that lets the next write send only the sections that changed.
+
+    With `workers=0` no threads are started and `run_pending()` does the work,
+    which is how the tests drive it against a fake service.
+    """
+
+    def __init__(self, service_factory: Callable = default_service_factory, debounce=None, max_delay=None,
+                 backoff=None, max_attempts=None, workers=None, clock: Callable[[], float] = time.monotonic):
+        config = getattr(settings, 'GOOGLE_DOCS_SYNC', {})
+        self.service_factory = service_factory
+        self.debounce = config.get('DEBOUNCE', 2) if debounce is None else debounce
+        self.max_delay = config.get('MAX_DELAY', 15) if max_delay is None else max_delay
+        self.backoff = config.get('BACKOFF', 5) if backoff is None else backoff
+        self.max_attempts = config.get('MAX_ATTEMPTS', 5) if max_attempts is None else max_attempts
+        self.workers = config.get('WORKERS', 2) if workers is None else workers
+        self.clock = clock
+
+        self._cond = threading.Condition()
+        self._pending: Dict[int, SyncJob] = {}
+        self._running = set()
+        self._threads = []
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def schedule(self, plan_id, immediate=False):
+        """Ask for a plan to be synced; cheap and safe to call on every edit"""
+        with self._cond:
+            now = self.clock()
+            job = self._pending.get(plan_id)
+            if job is None:
+                job = self._pending[plan_id] = SyncJob(plan_id, now + self.debounce, now)
+            elif not job.attempts:
+                job.due = min(now + self.debounce, job.first_requested + self.max_delay)
+            if immediate:
+                job.due = now
+            self._cond.notify()
+        self._ensure_workers()
+
+    def schedule_on_commit(self, plan_id, immediate=False):
+        """Schedule once the current transaction commits, so the worker reads the saved plan"""
+        transaction.on_commit(lambda: self.schedule(plan_id, immediate=immediate))
+
+    def run_pending(self, now=None) -> int:
+        """Sync every plan that is due in the calling thread; returns how many were attempted"""
+        count = 0
+        while True:
+            with self._cond:
+                job = self._take_due(self.clock() if now is None else now)
+            if job is None:
+                return count
+            self._run(job)
+            count += 1
+
+    def stop(self, timeout=None):
+        """Stop the worker threads after their current job"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping = False
+
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._cond:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'docs-sync-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _take_due(self, now) -> Optional[SyncJob]:
+        for plan_id, job in self._pending.items():
+            if job.due <= now and plan_id not in self._running:
+                del self._pending[plan_id]
+                self._running.add(plan_id)
+                return job
+        return None
+
+    def _next_wait(self, now) -> Optional[float]:
+        dues = [job.due for plan_id, job in self._pending.items() if plan_id not in self._running]
+        return max(0.0, min(dues) - now) if dues else None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = self.clock()
+                    job = self._take_due(now)
+                    if job is not None:
+                        break
+                    self._cond.wait(self._next_wait(now))
+                else:
+                    return
+            try:
+                self._run(job)
+            finally:
+                close_old_connections()
+
+    def _run(self, job: SyncJob):
+        try:
+            synced = self.sync_plan(job.plan_id)
+        except Exception as e:
+            logger.warning(f"Google Docs sync of action plan {job.plan_id} failed: {e}")
+            synced = False
+
+        with self._cond:
+            self._running.discard(job.plan_id)
+            if not synced:
+                self._retry(job)
+            self._cond.notify_all()
+
+    def _retry(self, job: SyncJob):
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Giving up syncing action plan {job.plan_id} to Google Docs after {job.attempts} attempts")
+            return
+        due = self.clock() + self.backoff * 2 ** (job.attempts - 1)
+        newer = self._pending.get(job.plan_id)
+        if newer is not None:
+            # a newer edit is already queued; it carries the latest content, just respect the backoff
+            newer.due = max(newer.due, due)
+            newer.attempts = job.attempts
+        else:
+            job.due = due
+            self._pending[job.plan_id] = job
+
+    def sync_plan(self, plan_id) -> bool:
+        """Write the saved plan to its document; plans without a document count as synced"""
+        from .models import SDGActionPlan
+
+        plan = SDGActionPlan.objects.filter(pk=plan_id).first()
+        if plan is None or not (plan.google_doc_created and plan.google_doc_id):
+            return True
+        state = self.service_factory().sync_document(
+            plan.google_doc_id, plan_document_content(plan), plan.google_doc_sync_state)
+        if state is None:
+            return False
+        # update() rather than save(): only sync bookkeeping changes, nothing else needs to react
+        SDGActionPlan.objects.filter(pk=plan_id, google_doc_id=plan.google_doc_id).update(
+            last_sync_time=timezone.now(), google_doc_sync_state=state)
+        return True
+
+
+def plan_share_roles(plan_id) -> Dict[str, str]:
+    """Drive role (writer/reader) per email of everyone with access to the plan"""
+    from .models import PlanAccess
+
+    rows = PlanAccess.objects.filter(plan_id=plan_id).exclude(user__email='').values_list(
+        'user__email', 'can_edit', 'can_view')
+    return {email: 'writer' if can_edit else 'reader' for email, can_edit, can_view in rows if can_edit or can_view}
+
+
+class DocsShareQueue(DocsSyncQueue):
+    """
+    Reconciles the Drive permissions of plan documents with PlanAccess.
+
+    Same scheduling as DocsSyncQueue: membership or editor/viewer changes made
+    in quick succession are reconciled together, off the request path, and a
+    reconciliation sends only the permission changes, in one Drive batch. The
+    emails the app has shared the document with are kept on the plan, so only
+    those are revoked when someone loses access.
+    """
+
+    def sync_plan(self, plan_id) -> bool:
+        from .models import SDGActionPlan
+
+        plan = SDGActionPlan.objects.filter(pk=plan_id).only('id', 'google_doc_id', 'google_doc_shared_with').first()
+        if plan is None or not plan.google_doc_id:
+            return True
+        result = self.service_factory().reconcile_permissions(
+            plan.google_doc_id, plan_share_roles(plan_id), plan.google_doc_shared_with or [])
+        if result is None:
+            return False
+        SDGActionPlan.objects.filter(pk=plan_id, google_doc_id=plan.google_doc_id).update(
+            google_doc_shared_with=result['granted'])
+        # after a partial failure the retry only resends what is still missing
+        return not result['failed']
+
+
+# Process-wide queues used by the views, the models and the collaboration consumer
+docs_sync_queue = DocsSyncQueue()
+docs_share_queue = DocsShareQueue()
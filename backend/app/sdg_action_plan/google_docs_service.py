@@ -1,8 +1,12 @@
 import os
 import json
-from datetime import datetime
-from typing import Dict, Any, Optional
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Optional
+import httplib2
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
@@ -10,6 +14,9 @@ from googleapiclient.errors import HttpError
 from django.conf import settings
 from django.utils import timezone
 import pickle
+from .docs_render import diff_requests, full_requests, render_sections
+
+logger = logging.getLogger(__name__)
 
 
 class OAuthRequired(Exception):
@@ -18,57 +25,137 @@ class OAuthRequired(Exception):
         super().__init__("OAuth flow requires user interaction.")
 
 
+def build_client(api, version, credentials):
+    """Build an API client with its own keep-alive HTTP connection"""
+    http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=60))
+    return build(api, version, http=http, cache_discovery=False)
+
+
+class GoogleClientPool:
+    """
+    Process-wide Google credentials and built API clients.
+
+    The credentials are read from the token file once (again only when the file
+    is replaced, e.g. by the OAuth callback) and shared by every thread. They are
+    refreshed under a lock shortly before they expire, and written back to disk
+    only when a refresh actually changed them. Built clients are kept per thread,
+    since their HTTP connections are not thread-safe, and reused across requests.
+    """
+
+    # If modifying these scopes, delete the file token.pickle.
+    SCOPES = ['https://www.googleapis.com/auth/documents', 'https://www.googleapis.com/auth/drive']
+    REDIRECT_URI = 'http://localhost:8000/api/sdg-action-plan/auth/google/callback/'
+
+    def __init__(self, token_path='token.pickle', credentials_path='credentials.json',
+                 refresh_margin=timedelta(minutes=5), builder=build_client):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.refresh_margin = refresh_margin
+        self.builder = builder
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._token_mtime = None
+        # bumped whenever the credentials object is replaced, so threads rebuild their clients
+        self._generation = 0
+
+    def credentials(self):
+        """Valid credentials, refreshed if they are about to expire; raises OAuthRequired without any"""
+        with self._lock:
+            self._load()
+            creds = self._creds
+            if creds and creds.refresh_token and self._expiring(creds):
+                token = creds.token
+                creds.refresh(Request())
+                if creds.token != token:
+                    self._save(creds)
+            if not creds or not creds.valid:
+                raise OAuthRequired(self.authorization_url())
+            return creds
+
+    def client(self, api, version):
+        """A built client for this thread, e.g. client('docs', 'v1')"""
+        creds = self.credentials()
+        clients = getattr(self._local, 'clients', None)
+        if clients is None or self._local.generation != self._generation:
+            clients = self._local.clients = {}
+            self._local.generation = self._generation
+        if (api, version) not in clients:
+            clients[(api, version)] = self.builder(api, version, creds)
+        return clients[(api, version)]
+
+    def store(self, creds):
+        """Adopt newly authorized credentials and persist them"""
+        with self._lock:
+            self._save(creds)
+            self._creds = creds
+            self._generation += 1
+
+    def authorization_url(self):
+        with open(self.credentials_path, 'r') as f:
+            client_config = json.load(f)
+        flow = Flow.from_client_config(client_config, scopes=self.SCOPES, redirect_uri=self.REDIRECT_URI)
+        auth_url, _ = flow.authorization_url(access_type='offline', include_granted_scopes='true')
+        return auth_url
+
+    def _expiring(self, creds):
+        if creds.expiry is None:
+            return not creds.valid
+        return creds.expiry - datetime.utcnow() < self.refresh_margin
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.token_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._token_mtime:
+            return
+        with open(self.token_path, 'rb') as token:
+            self._creds = pickle.load(token)
+        self._token_mtime = mtime
+        self._generation += 1
+
+    def _save(self, creds):
+        # write then rename, so no reader ever sees a half-written token file
+        tmp_path = f'{self.token_path}.tmp'
+        with open(tmp_path, 'wb') as token:
+            pickle.dump(creds, token)
+        os.replace(tmp_path, self.token_path)
+        self._token_mtime = os.stat(self.token_path).st_mtime_ns
+
+
+# Process-wide pool used by every GoogleDocsService
+google_clients = GoogleClientPool()
+
+
 class GoogleDocsService:
     """Service class for Google Docs API integration"""
     
-    # If modifying these scopes, delete the file token.pickle.
-    SCOPES = ['https://www.googleapis.com/auth/documents', 'https://www.googleapis.com/auth/drive']
+    SCOPES = GoogleClientPool.SCOPES
+    # Drive accepts at most 100 calls per batch request
+    DRIVE_BATCH_LIMIT = 100
     
-    def __init__(self):
+    def __init__(self, service=None, pool=None):
+        self.pool = pool or google_clients
         self.creds = None
-        self.service = None
-        self._authenticate()
+        self.service = service
+        # a ready Docs service (e.g. a local stand-in) skips authentication
+        if service is None:
+            self._authenticate()
     
     def _authenticate(self):
-        """Authenticate with Google Docs API"""
+        """Get credentials and a Docs client from the shared pool"""
         try:
             # Check if credentials file exists
-            if not os.path.exists('credentials.json'):
+            if not os.path.exists(self.pool.credentials_path):
                 raise FileNotFoundError(
                     "Google API credentials file 'credentials.json' not found. "
                     "Please download your credentials from Google Cloud Console "
                     "and place them in the backend/app directory."
                 )
             
-            # The file token.pickle stores the user's access and refresh tokens
-            if os.path.exists('token.pickle'):
-                with open('token.pickle', 'rb') as token:
-                    self.creds = pickle.load(token)
-            
-            # If there are no (valid) credentials available, let the user log in.
-            if not self.creds or not self.creds.valid:
-                if self.creds and self.creds.expired and self.creds.refresh_token:
-                    self.creds.refresh(Request())
-                else:
-                    # 获取auth_url
-                    with open('credentials.json', 'r') as f:
-                        client_config = json.load(f)
-                    flow = Flow.from_client_config(
-                        client_config,
-                        scopes=self.SCOPES,
-                        redirect_uri='http://localhost:8000/api/sdg-action-plan/auth/google/callback/'
-                    )
-                    auth_url, _ = flow.authorization_url(
-                        access_type='offline',
-                        include_granted_scopes='true'
-                    )
-                    raise OAuthRequired(auth_url)
-                
-                # Save the credentials for the next run
-                with open('token.pickle', 'wb') as token:
-                    pickle.dump(self.creds, token)
-            
-            self.service = build('docs', 'v1', credentials=self.creds)
+            self.creds = self.pool.credentials()
+            self.service = self.pool.client('docs', 'v1')
             
         except OAuthRequired as e:
             raise
@@ -298,179 +385,48 @@ class GoogleDocsService:
             print(f'Unexpected error: {e}')
             return None
     
-    def _insert_formatted_content(self, document_id: str, content: Dict[str, Any]):
-        """Insert formatted content into the Google Docs document"""
-        requests = []
-        
-        # Document title
-        requests.append({
-            'insertText': {
-                'location': {
-                    'index': 1
-                },
-                'text': f'SDG Action Plan: {content.get("impact_project_name", "Untitled")}\n\n'
-            }
-        })
-        
-        current_index = len(f'SDG Action Plan: {content.get("impact_project_name", "Untitled")}\n\n') + 1
-        
-        # Basic information section
-        requests.extend(self._add_section_header(current_index, "Basic Information"))
-        current_index += len("Basic Information\n") + 1
-        
-        # Project details
-        requests.extend(self._add_field(current_index, "Project Name", content.get("impact_project_name", "")))
-        current_index += len(f"Project Name: {content.get('impact_project_name', '')}\n") + 1
-        
-        requests.extend(self._add_field(current_index, "Designers", content.get("name_of_designers", "")))
-        current_index += len(f"Designers: {content.get('name_of_designers', '')}\n") + 1
-        
-        requests.extend(self._add_field(current_index, "Description", content.get("description", "")))
-        current_index += len(f"Description: {content.get('description', '')}\n\n") + 1
-        
-        # Plan content section
-        plan_content = content.get("plan_content", {})
-        
-        requests.extend(self._add_section_header(current_index, "Plan Content"))
-        current_index += len("Plan Content\n") + 1
-        
-        # SDGs
-        sdgs = plan_content.get("SDGs", [])
-        if sdgs:
-            requests.extend(self._add_field(current_index, "Related SDGs", ", ".join(sdgs)))
-            current_index += len(f"Related SDGs: {', '.join(sdgs)}\n") + 1
-        
-        # Role
-        requests.extend(self._add_field(current_index, "Role and Affiliation", plan_content.get("role", "")))
-        current_index += len(f"Role and Affiliation: {plan_content.get('role', '')}\n") + 1
-        
-        # Challenge
-        requests.extend(self._add_field(current_index, "Main Challenge", plan_content.get("challenge", "")))
-        current_index += len(f"Main Challenge: {plan_content.get('challenge', '')}\n") + 1
-        
-        # Implementation Steps
-        requests.extend(self._add_section_header(current_index, "Implementation Steps"))
-        current_index += len("Implementation Steps\n") + 1
-        
-        steps = plan_content.get("steps", {})
-        for i in range(1, 7):
-            step_key = f"input{i}"
-            step_content = steps.get(step_key, "")
-            if step_content:
-                requests.extend(self._add_field(current_index, f"Step {i}", step_content))
-                current_index += len(f"Step {i}: {step_content}\n") + 1
-        
-        # Impact Types
-        impact_types = plan_content.get("impact_types", {})
-        if any(impact_types.values()):
-            requests.extend(self._add_section_header(current_index, "Impact Types"))
-            current_index += len("Impact Types\n") + 1
-            
-            for rank, impact_type in impact_types.items():
-                if impact_type:
-                    requests.extend(self._add_field(current_index, f"Rank {rank[-1]}", impact_type))
-                    current_index += len(f"Rank {rank[-1]}: {impact_type}\n") + 1
-        
-        # Other fields
-        other_fields = [
-            ("importance", "Impact Importance"),
-            ("example", "Existing Example"),
-            ("resources", "Resources and Partnerships"),
-            ("impact", "Impact Avenues"),
-            ("risk", "Risks and Inhibitors"),
-            ("mitigation", "Mitigation Strategies")
-        ]
-        
-        for field_key, field_name in other_fields:
-            field_value = plan_content.get(field_key, "")
-            if field_value:
-                requests.extend(self._add_field(current_index, field_name, field_value))
-                current_index += len(f"{field_name}: {field_value}\n") + 1
-        
-        # Execute the requests
-        if requests:
-            self.service.documents().batchUpdate(
-                documentId=document_id,
-                body={'requests': requests}
-            ).execute()
-    
-    def _add_section_header(self, index: int, title: str) -> list:
-        """Add a section header with formatting"""
-        return [
-            {
-                'insertText': {
-                    'location': {'index': index},
-                    'text': f'{title}\n'
-                }
-            },
-            {
-                'updateParagraphStyle': {
-                    'range': {
-                        'startIndex': index,
-                        'endIndex': index + len(title)
-                    },
-                    'paragraphStyle': {
-                        'namedStyleType': 'HEADING_1'
-                    },
-                    'fields': 'namedStyleType'
-                }
-            }
-        ]
-    
-    def _add_field(self, index: int, field_name: str, field_value: str) -> list:
-        """Add a field with label and value"""
-        return [
-            {
-                'insertText': {
-                    'location': {'index': index},
-                    'text': f'{field_name}: {field_value}\n'
-                }
-            },
-            {
-                'updateTextStyle': {
-                    'range': {
-                        'startIndex': index,
-                        'endIndex': index + len(field_name)
-                    },
-                    'textStyle': {
-                        'bold': True
-                    },
-                    'fields': 'bold'
-                }
-            }
-        ]
-    
-    def update_document(self, document_id: str, content: Dict[str, Any]) -> bool:
-        """Update existing Google Docs document with new content"""
+    def sync_document(self, document_id: str, content: Dict[str, Any],
+                      previous_state: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Bring a document in line with `content` and return its new sync state.
+
+        The state holds the sections written and the document revision they
+        produced. Given the previous state, only the changed sections are sent,
+        guarded by the revision so that a document edited elsewhere in the
+        meantime is rewritten in full instead. Returns None if the write failed.
+        """
+        sections = render_sections(content)
+        if previous_state and previous_state.get('sections') and previous_state.get('revision'):
+            requests = diff_requests(previous_state['sections'], sections)
+            if not requests:
+                return previous_state
+            try:
+                return self._write(document_id, requests, sections, previous_state['revision'])
+            except HttpError as error:
+                logger.warning(f'Incremental update of {document_id} failed, rewriting it: {error}')
+
         try:
-            # Clear existing content (except title)
             document = self.service.documents().get(documentId=document_id).execute()
-            content_length = document['body']['content'][-1]['endIndex'] - 1
-            
-            if content_length > 1:
-                self.service.documents().batchUpdate(
-                    documentId=document_id,
-                    body={
-                        'requests': [
-                            {
-                                'deleteContentRange': {
-                                    'range': {
-                                        'startIndex': 1,
-                                        'endIndex': content_length
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                ).execute()
-            
-            # Insert new content
-            self._insert_formatted_content(document_id, content)
-            return True
-            
+            end_index = document['body']['content'][-1]['endIndex']
+            return self._write(document_id, full_requests(sections, end_index), sections,
+                               document.get('revisionId'))
         except HttpError as error:
-            print(f'An error occurred: {error}')
-            return False
+            logger.warning(f'Writing {document_id} failed: {error}')
+            return None
+
+    def _write(self, document_id, requests, sections, revision):
+        body = {'requests': requests}
+        if revision:
+            body['writeControl'] = {'requiredRevisionId': revision}
+        reply = self.service.documents().batchUpdate(documentId=document_id, body=body).execute()
+        return {
+            'sections': [list(section) for section in sections],
+            'revision': reply.get('writeControl', {}).get('requiredRevisionId'),
+        }
+
+    def update_document(self, document_id: str, content: Dict[str, Any]) -> bool:
+        """Rewrite an existing Google Docs document with new content"""
+        return self.sync_document(document_id, content) is not None
     
     def get_document_url(self, document_id: str) -> str:
         """Get the shareable URL for a Google Docs document"""
@@ -479,7 +435,7 @@ class GoogleDocsService:
     def share_document(self, document_id: str, email: str, role: str = 'writer') -> bool:
         """Share the document with a specific user"""
         try:
-            drive_service = build('drive', 'v3', credentials=self.creds)
+            drive_service = self.pool.client('drive', 'v3')
             
             user_permission = {
                 'type': 'user',
@@ -496,5 +452,74 @@ class GoogleDocsService:
             return True
             
         except HttpError as error:
-            print(f'An error occurred: {error}')
-            return False 
\ No newline at end of file
+            logger.warning(f'Sharing {document_id} with {email} failed: {error}')
+            return False 
+
+    def reconcile_permissions(self, document_id: str, desired: Dict[str, str],
+                              granted: Iterable[str] = ()) -> Optional[Dict[str, list]]:
+        """
+        Make the document's user permissions match `desired` (email -> role).
+
+        Reads the current permissions with one request and sends only the
+        missing, changed and no longer wanted ones, as Drive batch requests.
+        Only permissions this app created, listed in `granted`, are ever
+        removed; people shared on the document by hand in Google Docs keep
+        their access. The document owner is never changed. Returns the emails
+        created, updated, removed and failed, plus the new `granted` list, or
+        None if the permissions could not be read.
+        """
+        drive = self.pool.client('drive', 'v3')
+        try:
+            existing = drive.permissions().list(
+                fileId=document_id, fields='permissions(id,type,role,emailAddress)').execute()
+        except HttpError as error:
+            logger.warning(f'Listing the permissions of {document_id} failed: {error}')
+            return None
+
+        desired = {email.lower(): role for email, role in desired.items() if email}
+        granted = {email.lower() for email in granted}
+        current = {}
+        for permission in existing.get('permissions', []):
+            if permission.get('type') == 'user' and permission.get('emailAddress'):
+                current[permission['emailAddress'].lower()] = permission
+
+        calls = []
+        for email, role in desired.items():
+            permission = current.get(email)
+            if permission is None:
+                calls.append(('created', email, drive.permissions().create(
+                    fileId=document_id, fields='id',
+                    body={'type': 'user', 'role': role, 'emailAddress': email})))
+            elif permission['role'] not in (role, 'owner'):
+                calls.append(('updated', email, drive.permissions().update(
+                    fileId=document_id, permissionId=permission['id'], fields='id', body={'role': role})))
+        for email, permission in current.items():
+            if email not in desired and email in granted and permission['role'] != 'owner':
+                calls.append(('removed', email, drive.permissions().delete(
+                    fileId=document_id, permissionId=permission['id'])))
+
+        result = {'created': [], 'updated': [], 'removed': [], 'failed': []}
+        outcome = {}
+
+        def record(request_id, response, exception):
+            outcome[request_id] = exception
+
+        for start in range(0, len(calls), self.DRIVE_BATCH_LIMIT):
+            batch = drive.new_batch_http_request(callback=record)
+            for number, (_, _, call) in enumerate(calls[start:start + self.DRIVE_BATCH_LIMIT], start):
+                batch.add(call, request_id=str(number))
+            batch.execute()
+
+        for number, (change, email, _) in enumerate(calls):
+            error = outcome.get(str(number))
+            if error is not None:
+                logger.warning(f'Failed to share {document_id} with {email}: {error}')
+                result['failed'].append(email)
+            else:
+                result[change].append(email)
+
+        # a permission deleted by hand in Google Docs is no longer ours to remove
+        granted = {email for email in granted if email in current or email in desired}
+        result['granted'] = sorted((granted | set(result['created'])) - set(result['removed']))
+        return result
+
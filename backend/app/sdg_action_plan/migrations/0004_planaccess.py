@@ -0,0 +1,70 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def access_flags(plan, user_id, role, is_editor, is_viewer):
+    is_creator = plan.user_id == user_id
+    can_edit = is_creator or is_editor or role == 'owner' or bool(
+        role and plan.allow_team_edit and (role == 'admin' or not plan.require_explicit_permissions))
+    can_view = is_creator or is_viewer or role == 'owner' or bool(role and plan.allow_team_view)
+    can_manage = is_creator or role in ('owner', 'admin')
+    is_owner = is_creator or role == 'owner'
+    return can_view, can_edit, can_manage, is_owner
+
+
+def populate_access(apps, schema_editor):
+    SDGActionPlan = apps.get_model('sdg_action_plan', 'SDGActionPlan')
+    PlanAccess = apps.get_model('sdg_action_plan', 'PlanAccess')
+    TeamMember = apps.get_model('teams', 'TeamMember')
+
+    roles = {}
+    for team_id, user_id, role in TeamMember.objects.filter(is_pending=False).values_list('team_id', 'user_id', 'role'):
+        roles.setdefault(team_id, {})[user_id] = role
+    editors = set(SDGActionPlan.editors.through.objects.values_list('sdgactionplan_id', 'user_id'))
+    viewers = set(SDGActionPlan.viewers.through.objects.values_list('sdgactionplan_id', 'user_id'))
+    listed = {}
+    for plan_id, user_id in editors | viewers:
+        listed.setdefault(plan_id, set()).add(user_id)
+
+    rows = []
+    for plan in SDGActionPlan.objects.iterator(chunk_size=1000):
+        team_roles = roles.get(plan.team_id, {})
+        for user_id in {plan.user_id, *team_roles, *listed.get(plan.id, ())}:
+            flags = access_flags(plan, user_id, team_roles.get(user_id),
+                                 (plan.id, user_id) in editors, (plan.id, user_id) in viewers)
+            if any(flags):
+                can_view, can_edit, can_manage, is_owner = flags
+                rows.append(PlanAccess(plan_id=plan.id, user_id=user_id, can_view=can_view, can_edit=can_edit,
+                                       can_manage=can_manage, is_owner=is_owner))
+    PlanAccess.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_action_plan', '0003_merge_20250715_2233'),
+        ('teams', '0003_emailinvitation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('can_view', models.BooleanField(default=False)),
+                ('can_edit', models.BooleanField(default=False)),
+                ('can_manage', models.BooleanField(default=False)),
+                ('is_owner', models.BooleanField(default=False)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='sdg_action_plan.sdgactionplan')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='action_plan_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'plan'), name='plan_access_user_plan_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_access, migrations.RunPython.noop),
+    ]
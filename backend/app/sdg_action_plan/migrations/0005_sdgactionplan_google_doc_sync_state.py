@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_action_plan', '0004_planaccess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sdgactionplan',
+            name='google_doc_sync_state',
+            field=models.JSONField(blank=True, help_text='Sections and revision last written to the Google Docs document', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_action_plan', '0005_sdgactionplan_google_doc_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sdgactionplan',
+            name='google_doc_shared_with',
+            field=models.JSONField(blank=True, help_text='Emails this app shared the Google Docs document with', null=True),
+        ),
+    ]
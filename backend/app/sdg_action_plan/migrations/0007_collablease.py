@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_action_plan', '0006_sdgactionplan_google_doc_shared_with'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollabLease',
+            fields=[
+                ('plan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='collab_lease', serialize=False, to='sdg_action_plan.sdgactionplan')),
+                ('channel', models.CharField(max_length=200)),
+                ('expires', models.DateTimeField()),
+            ],
+        ),
+    ]
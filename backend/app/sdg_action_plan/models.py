@@ -1,6 +1,14 @@
-from django.db import models
+import copy
+from typing import Optional
+
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-from teams.models import Team
+from django.utils import timezone
+from teams.models import Team, TeamMember
+from .collab import DOCS_FIELDS, EDITABLE_FIELDS, collab_rooms
+from .docs_sync import docs_share_queue
 
 
 class SDGActionPlan(models.Model):
@@ -51,5 +59,216 @@ class SDGActionPlan(models.Model):
                                            help_text='Whether Google Docs document has been created')
     last_sync_time = models.DateTimeField(blank=True, null=True,
                                         help_text='Last time content was synced to Google Docs')
+    google_doc_sync_state = models.JSONField(blank=True, null=True,
+                                             help_text='Sections and revision last written to the Google Docs document')
+    google_doc_shared_with = models.JSONField(blank=True, null=True,
+                                              help_text='Emails this app shared the Google Docs document with')
     def __str__(self):
         return f"Action Plan: {self.impact_project_name} by {self.user.username}"
+
+
+# Plan fields that affect who may view or edit it
+ACCESS_FIELDS = {'user', 'team', 'allow_team_edit', 'allow_team_view', 'require_explicit_permissions'}
+
+
+def plan_access_flags(plan, user_id, role=None, is_editor=False, is_viewer=False):
+    """
+    Effective (can_view, can_edit, can_manage, is_owner) of a user on a plan.
+
+    `role` is the user's role in the plan's team (None unless they have joined
+    it); `is_editor`/`is_viewer` say whether they are listed explicitly.
+    """
+    is_creator = plan.user_id == user_id
+    # Creator and explicitly listed editors/viewers always have that permission
+    can_edit = is_creator or is_editor or role == 'owner' or bool(
+        role and plan.allow_team_edit and (role == 'admin' or not plan.require_explicit_permissions))
+    can_view = is_creator or is_viewer or role == 'owner' or bool(role and plan.allow_team_view)
+    can_manage = is_creator or role in ('owner', 'admin')
+    is_owner = is_creator or role == 'owner'
+    return can_view, can_edit, can_manage, is_owner
+
+
+class PlanAccess(models.Model):
+    """
+    Materialized access rights of one user on one action plan.
+
+    A row exists for every user with at least one right on the plan, so access
+    checks and the list of plans a user can open are a lookup on (user, plan).
+    Rows are recomputed by `refresh` whenever a plan, its editors/viewers or a
+    membership of its team changes (see the signal handlers below).
+    """
+    plan = models.ForeignKey(SDGActionPlan, on_delete=models.CASCADE, related_name='access')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='action_plan_access')
+    can_view = models.BooleanField(default=False)
+    can_edit = models.BooleanField(default=False)
+    can_manage = models.BooleanField(default=False)
+    is_owner = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'plan'], name='plan_access_user_plan_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Access of user {self.user_id} to plan {self.plan_id}"
+
+    @classmethod
+    def refresh(cls, plan_ids, user_ids=None):
+        """Recompute the rows of the given plans, optionally only for some users"""
+        from teams.models import TeamMember
+
+        plan_ids = list(plan_ids)
+        if not plan_ids:
+            return
+        plans = list(SDGActionPlan.objects.filter(id__in=plan_ids).only(
+            'id', 'user_id', 'team_id', 'allow_team_edit', 'allow_team_view', 'require_explicit_permissions',
+            'google_doc_id'))
+
+        members = TeamMember.objects.filter(team_id__in={plan.team_id for plan in plans}, is_pending=False)
+        editors = SDGActionPlan.editors.through.objects.filter(sdgactionplan_id__in=plan_ids)
+        viewers = SDGActionPlan.viewers.through.objects.filter(sdgactionplan_id__in=plan_ids)
+        stale = cls.objects.filter(plan_id__in=plan_ids)
+        if user_ids is not None:
+            user_ids = set(user_ids)
+            members = members.filter(user_id__in=user_ids)
+            editors = editors.filter(user_id__in=user_ids)
+            viewers = viewers.filter(user_id__in=user_ids)
+            stale = stale.filter(user_id__in=user_ids)
+
+        roles = {}
+        for team_id, user_id, role in members.values_list('team_id', 'user_id', 'role'):
+            roles.setdefault(team_id, {})[user_id] = role
+        editor_pairs = set(editors.values_list('sdgactionplan_id', 'user_id'))
+        viewer_pairs = set(viewers.values_list('sdgactionplan_id', 'user_id'))
+
+        rows = []
+        for plan in plans:
+            team_roles = roles.get(plan.team_id, {})
+            candidates = {plan.user_id, *team_roles}
+            candidates.update(user for plan_id, user in editor_pairs | viewer_pairs if plan_id == plan.id)
+            if user_ids is not None:
+                candidates &= user_ids
+            for user_id in candidates:
+                flags = plan_access_flags(plan, user_id, team_roles.get(user_id),
+                                          (plan.id, user_id) in editor_pairs, (plan.id, user_id) in viewer_pairs)
+                if any(flags):
+                    can_view, can_edit, can_manage, is_owner = flags
+                    rows.append(cls(plan_id=plan.id, user_id=user_id, can_view=can_view, can_edit=can_edit,
+                                    can_manage=can_manage, is_owner=is_owner))
+
+        fields = ('plan_id', 'user_id', 'can_view', 'can_edit')
+        before = set(stale.values_list(*fields))
+        after = {tuple(getattr(row, field) for field in fields) for row in rows}
+        with transaction.atomic():
+            stale.delete()
+            cls.objects.bulk_create(rows)
+
+        # documents are shared with whoever can view or edit the plan
+        changed = {row[0] for row in before ^ after}
+        for plan in plans:
+            if plan.id in changed and plan.google_doc_id:
+                docs_share_queue.schedule_on_commit(plan.id)
+
+    @classmethod
+    def rebuild(cls, batch_size=500):
+        """Recompute the whole table, e.g. after changes that bypassed signals"""
+        cls.objects.all().delete()
+        plan_ids = list(SDGActionPlan.objects.values_list('id', flat=True))
+        for start in range(0, len(plan_ids), batch_size):
+            cls.refresh(plan_ids[start:start + batch_size])
+
+
+class CollabLease(models.Model):
+    """
+    The process serving a plan's real-time room, by the channel its room
+    listens on (see collab.py).
+
+    The owner renews `expires` while the room is open and deletes the row when
+    it closes; a row past `expires` belongs to a process that went away and may
+    be taken over.
+    """
+    plan = models.OneToOneField(SDGActionPlan, on_delete=models.CASCADE, primary_key=True,
+                                related_name='collab_lease')
+    channel = models.CharField(max_length=200)
+    expires = models.DateTimeField()
+
+    def __str__(self):
+        return f"Room of plan {self.plan_id} served by {self.channel}"
+
+    @classmethod
+    def acquire(cls, plan_id, channel, ttl) -> Optional[str]:
+        """
+        Take the plan's lease unless a live one is held elsewhere; returns the
+        channel of whoever holds it now, None if the plan does not exist.
+        """
+        if not SDGActionPlan.objects.filter(pk=plan_id).exists():
+            return None
+        now = timezone.now()
+        with transaction.atomic():
+            lease, created = cls.objects.select_for_update().get_or_create(
+                plan_id=plan_id, defaults={'channel': channel, 'expires': now + ttl})
+            if not created and lease.expires <= now:
+                lease.channel, lease.expires = channel, now + ttl
+                lease.save(update_fields=['channel', 'expires'])
+        return lease.channel
+
+    @classmethod
+    def renew(cls, plan_id, channel, ttl) -> bool:
+        """Extend a lease still held by `channel`; False once another process has taken it"""
+        return bool(cls.objects.filter(plan_id=plan_id, channel=channel).update(expires=timezone.now() + ttl))
+
+    @classmethod
+    def release(cls, plan_id, channel):
+        cls.objects.filter(plan_id=plan_id, channel=channel).delete()
+
+    @classmethod
+    def owner(cls, plan_id) -> Optional[str]:
+        """Channel of the room serving the plan, None if no live room does"""
+        return cls.objects.filter(plan_id=plan_id, expires__gt=timezone.now()).values_list(
+            'channel', flat=True).first()
+
+
+# Keep PlanAccess in step with plans, their editors/viewers and team memberships
+@receiver(post_save, sender=SDGActionPlan)
+def refresh_plan_access(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields and not ACCESS_FIELDS & set(update_fields)):
+        return
+    PlanAccess.refresh([instance.pk])
+
+
+@receiver(post_save, sender=SDGActionPlan)
+def refresh_room(sender, instance, raw=False, update_fields=None, **kwargs):
+    # an open real-time room keeps the plan in memory and would flush its stale copy over this save;
+    # the room may be served by another process, which collab_rooms.saved() looks up after the commit
+    if raw:
+        return
+    fields = {name: copy.deepcopy(getattr(instance, name)) for name in EDITABLE_FIELDS + DOCS_FIELDS
+              if update_fields is None or name in update_fields}
+    transaction.on_commit(lambda: collab_rooms.saved(instance.pk, fields))
+
+
+@receiver(m2m_changed, sender=SDGActionPlan.editors.through)
+@receiver(m2m_changed, sender=SDGActionPlan.viewers.through)
+def refresh_listed_access(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # editors/viewers of one plan changed
+        PlanAccess.refresh([instance.pk], user_ids=pk_set)
+    elif pk_set is not None:
+        # plans of one user changed through user.editable_action_plans / viewable_action_plans
+        PlanAccess.refresh(pk_set, user_ids=[instance.pk])
+    else:
+        PlanAccess.refresh(PlanAccess.objects.filter(user=instance).values_list('plan_id', flat=True),
+                           user_ids=[instance.pk])
+
+
+@receiver(post_save, sender=TeamMember)
+@receiver(post_delete, sender=TeamMember)
+def refresh_member_access(sender, instance, raw=False, origin=None, **kwargs):
+    # deleting a team or user also deletes the plans/rows concerned; recomputing
+    # here would recreate rows for plans that are about to go
+    if raw or isinstance(origin, (Team, User)):
+        return
+    plan_ids = SDGActionPlan.objects.filter(team_id=instance.team_id).values_list('id', flat=True)
+    PlanAccess.refresh(plan_ids, user_ids=[instance.user_id])
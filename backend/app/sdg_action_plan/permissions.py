@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from .models import PlanAccess
+
+NO_ACCESS = (False, False, False, False)
+
+
+class PlanPermissionResolver:
+    """
+    Answers edit/view/owner questions about action plans for one user.
+
+    Rights come from the PlanAccess table: every row of the user is loaded with
+    one indexed query the first time it is needed, so checking any number of
+    plans costs a single query. One resolver is shared by everything handling a
+    request (see `for_request`).
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._access = None
+
+    @classmethod
+    def for_request(cls, request):
+        resolver = getattr(request, '_plan_permissions', None)
+        if resolver is None or resolver.user != request.user:
+            resolver = cls(request.user)
+            request._plan_permissions = resolver
+        return resolver
+
+    @property
+    def is_authenticated(self):
+        return bool(self.user and self.user.is_authenticated)
+
+    @property
+    def access(self):
+        """plan id -> (can_view, can_edit, can_manage, is_owner)"""
+        if self._access is None:
+            rows = PlanAccess.objects.filter(user_id=self.user.id).values_list(
+                'plan_id', 'can_view', 'can_edit', 'can_manage', 'is_owner')
+            self._access = {plan_id: flags for plan_id, *flags in rows}
+        return self._access
+
+    def invalidate(self):
+        """Forget loaded rights, e.g. after changing the plan's permissions in this request"""
+        self._access = None
+
+    def _flags(self, plan):
+        if not self.is_authenticated:
+            return NO_ACCESS
+        return self.access.get(plan.pk, NO_ACCESS)
+
+    def can_view(self, plan):
+        return self._flags(plan)[0]
+
+    def can_edit(self, plan):
+        return self._flags(plan)[1]
+
+    def can_manage(self, plan):
+        """Whether the user may change the plan's permissions, editors and viewers"""
+        return self._flags(plan)[2]
+
+    def is_owner(self, plan):
+        """The plan's creator or the owner of its team"""
+        return self._flags(plan)[3]
+
+
+def with_plan_relations(queryset):
+    """Load what SDGActionPlanSerializer reads in a fixed number of queries"""
+    return queryset.select_related('user', 'team').prefetch_related(
+        Prefetch('editors', queryset=User.objects.only('id')),
+        Prefetch('viewers', queryset=User.objects.only('id')),
+    )
@@ -1,11 +1,10 @@
-import asyncio
 import json
-from typing import Dict, Set, Optional
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
+from .collab import Conflict, PatchError, RoomUnavailable, collab_rooms, room_group
+from .docs_sync import docs_sync_queue
 from .models import SDGActionPlan
-from .google_docs_service import GoogleDocsService
+from .permissions import PlanPermissionResolver
 
 
 class SDGFormConsumer(AsyncWebsocketConsumer):
@@ -15,40 +14,59 @@ class SDGFormConsumer(AsyncWebsocketConsumer):
         super().__init__(*args, **kwargs)
         self.room_name = None
         self.room_group_name = None
+        self.plan_id = None
         self.user = None
-        self.google_docs_service = None
+        self.joined = False
+        self.can_edit = False
     
     async def connect(self):
         """Handle WebSocket connection"""
         self.room_name = self.scope['url_route']['kwargs']['form_id']
-        self.room_group_name = f'form_{self.room_name}'
+        self.plan_id = int(self.room_name)
+        self.room_group_name = room_group(self.room_name)
         self.user = self.scope['user']
-        
-        # Join room group
+        can_view, self.can_edit = await self.plan_access()
+        if not can_view:
+            await self.close()
+            return
+
+        # Join room group first, so no update falls between the snapshot below and the first broadcast
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        
+        self.joined = True
+        # the room may be served by another process; collab_rooms forwards to it
+        try:
+            welcome = await collab_rooms.join(self.plan_id, self.channel_name, self.user)
+        except RoomUnavailable:
+            welcome = None
+        if welcome is None:
+            await self.close()
+            return
+
         await self.accept()
-        
-        # Initialize Google Docs service
-        self.google_docs_service = GoogleDocsService()
-        
-        # Send connection confirmation
+
+        # Send connection confirmation, with the room's current fields: the database may not have every edit yet
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
             'message': f'Connected to form {self.room_name}',
-            'user': self.user.username
+            'user': self.user.username,
+            **welcome
         }))
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
+        if not self.joined:
+            return
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        # the last consumer to leave flushes the room's pending edits
+        await collab_rooms.leave(self.plan_id, self.channel_name)
+        self.joined = False
     
     async def receive(self, text_data):
         """Handle incoming WebSocket messages"""
@@ -77,227 +95,86 @@ class SDGFormConsumer(AsyncWebsocketConsumer):
             }))
     
     async def handle_form_update(self, data):
-        """Handle form field updates"""
+        """Apply a field patch to the room's document; the room broadcasts it with its version"""
         field_name = data.get('field')
         field_value = data.get('value')
-        user_id = data.get('user_id')
-        
-        # Update form in database
-        success = await self.update_form_field(field_name, field_value)
-        
-        if success:
-            # Broadcast update to all users in the room
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'form_update_broadcast',
-                    'field': field_name,
-                    'value': field_value,
-                    'user_id': user_id,
-                    'timestamp': data.get('timestamp')
-                }
-            )
-            
-            # Sync with Google Docs if enabled
-            if await self.should_sync_to_google_docs():
-                await self.sync_to_google_docs()
-    
-    async def handle_google_docs_sync(self, data):
-        """Handle manual Google Docs sync request"""
+
+        if not self.can_edit:
+            await self.send_error('You do not have permission to edit this form')
+            return
+        # The document is written to the database, and then to Google Docs, in batches
         try:
-            success = await self.sync_to_google_docs()
-            
+            await collab_rooms.submit(self.plan_id, field_name, field_value, data.get('version'), self.channel_name,
+                                      user_id=data.get('user_id'), timestamp=data.get('timestamp'))
+        except PatchError as e:
+            await self.send_error(str(e))
+            return
+        except Conflict as conflict:
+            # the client reapplies its edit on top of the current value and version
             await self.send(text_data=json.dumps({
-                'type': 'google_docs_sync_response',
-                'success': success,
-                'message': 'Google Docs synced successfully' if success else 'Failed to sync with Google Docs'
+                'type': 'form_update_rejected',
+                'field': conflict.path,
+                'value': conflict.value,
+                'version': conflict.version,
+                'timestamp': data.get('timestamp')
             }))
-            
-        except Exception as e:
+
+    @database_sync_to_async
+    def plan_access(self):
+        """(can view, can edit) for the connected user, from the same rights as the REST API"""
+        if not self.user.is_authenticated:
+            return False, False
+        plan = SDGActionPlan(pk=self.plan_id)
+        resolver = PlanPermissionResolver(self.user)
+        return resolver.can_view(plan), resolver.can_edit(plan)
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+    
+    async def handle_google_docs_sync(self, data):
+        """Handle manual Google Docs sync request"""
+        # write pending edits first so the sync sees them
+        if not await collab_rooms.flush(self.plan_id):
             await self.send(text_data=json.dumps({
                 'type': 'google_docs_sync_response',
                 'success': False,
-                'message': f'Error syncing with Google Docs: {str(e)}'
+                'message': 'No Google Doc linked to this form'
             }))
+            return
+        docs_sync_queue.schedule(self.plan_id, immediate=True)
+        await self.send(text_data=json.dumps({
+            'type': 'google_docs_sync_response',
+            'success': True,
+            'message': 'Google Docs sync queued'
+        }))
     
     async def handle_user_typing(self, data):
-        """Handle user typing indicators"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_typing_broadcast',
-                'user_id': data.get('user_id'),
-                'field': data.get('field'),
-                'is_typing': data.get('is_typing')
-            }
-        )
+        """Handle user typing indicators; sent with the room's next presence frame"""
+        collab_rooms.typing(self.plan_id, self.user.id, data.get('field'), data.get('is_typing'))
     
     async def handle_cursor_position(self, data):
-        """Handle cursor position updates for collaborative editing"""
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'cursor_position_broadcast',
-                'user_id': data.get('user_id'),
-                'field': data.get('field'),
-                'position': data.get('position')
-            }
-        )
+        """Handle cursor position updates; only the latest one per user is sent"""
+        collab_rooms.cursor(self.plan_id, self.user.id, data.get('field'), data.get('position'))
     
     async def form_update_broadcast(self, event):
         """Broadcast form updates to all connected clients"""
         await self.send(text_data=json.dumps({
-            'type': 'form_update',
+            'type': 'form_update_ack' if event['sender'] == self.channel_name else 'form_update',
             'field': event['field'],
             'value': event['value'],
+            'version': event['version'],
             'user_id': event['user_id'],
             'timestamp': event['timestamp']
         }))
     
-    async def user_typing_broadcast(self, event):
-        """Broadcast user typing indicators"""
-        await self.send(text_data=json.dumps({
-            'type': 'user_typing',
-            'user_id': event['user_id'],
-            'field': event['field'],
-            'is_typing': event['is_typing']
-        }))
-    
-    async def cursor_position_broadcast(self, event):
-        """Broadcast cursor positions"""
+    async def presence_broadcast(self, event):
+        """Broadcast a frame of merged cursor, typing and membership updates"""
         await self.send(text_data=json.dumps({
-            'type': 'cursor_position',
-            'user_id': event['user_id'],
-            'field': event['field'],
-            'position': event['position']
+            'type': 'presence',
+            'cursors': event['cursors'],
+            'typing': event['typing'],
+            'users': event['users']
         }))
-    
-    @database_sync_to_async
-    def update_form_field(self, field_name: str, field_value: str) -> bool:
-        """Update form field in database"""
-        try:
-            form = SDGActionPlan.objects.get(id=self.room_name)
-            
-            if field_name in ['name_of_designers', 'impact_project_name', 'description']:
-                setattr(form, field_name, field_value)
-            elif field_name.startswith('plan_content.'):
-                # Handle nested plan_content fields
-                nested_field = field_name.replace('plan_content.', '')
-                if '.' in nested_field:
-                    # Handle deeply nested fields like plan_content.steps.input1
-                    parts = nested_field.split('.')
-                    current = form.plan_content
-                    for part in parts[:-1]:
-                        if part not in current:
-                            current[part] = {}
-                        current = current[part]
-                    current[parts[-1]] = field_value
-                else:
-                    form.plan_content[nested_field] = field_value
-            
-            form.save()
-            return True
-            
-        except SDGActionPlan.DoesNotExist:
-            return False
-        except Exception as e:
-            print(f"Error updating form field: {e}")
-            return False
-    
-    @database_sync_to_async
-    def should_sync_to_google_docs(self) -> bool:
-        """Check if form should be synced to Google Docs"""
-        try:
-            form = SDGActionPlan.objects.get(id=self.room_name)
-            return form.google_doc_created and form.google_doc_id
-        except SDGActionPlan.DoesNotExist:
-            return False
-    
-    async def sync_to_google_docs(self) -> bool:
-        """Sync form content to Google Docs"""
-        try:
-            form_data = await self.get_form_data()
-            if not form_data:
-                return False
-            
-            success = self.google_docs_service.update_document(
-                form_data['google_doc_id'],
-                {
-                    'impact_project_name': form_data['impact_project_name'],
-                    'name_of_designers': form_data['name_of_designers'],
-                    'description': form_data['description'],
-                    'plan_content': form_data['plan_content']
-                }
-            )
-            
-            if success:
-                await self.update_sync_timestamp()
-            
-            return success
-            
-        except Exception as e:
-            print(f"Error syncing to Google Docs: {e}")
-            return False
-    
-    @database_sync_to_async
-    def get_form_data(self) -> Optional[Dict]:
-        """Get form data for Google Docs sync"""
-        try:
-            form = SDGActionPlan.objects.get(id=self.room_name)
-            return {
-                'google_doc_id': form.google_doc_id,
-                'impact_project_name': form.impact_project_name,
-                'name_of_designers': form.name_of_designers,
-                'description': form.description,
-                'plan_content': form.plan_content
-            }
-        except SDGActionPlan.DoesNotExist:
-            return None
-    
-    @database_sync_to_async
-    def update_sync_timestamp(self):
-        """Update last sync timestamp"""
-        try:
-            form = SDGActionPlan.objects.get(id=self.room_name)
-            form.last_sync_time = timezone.now()
-            form.save()
-        except SDGActionPlan.DoesNotExist:
-            pass
-
-
-class CollaborationManager:
-    """Manager for handling real-time collaboration features"""
-    
-    def __init__(self):
-        self.active_users: Dict[str, Set[str]] = {}  # form_id -> set of user_ids
-        self.user_sessions: Dict[str, str] = {}  # user_id -> form_id
-    
-    def add_user_to_form(self, user_id: str, form_id: str):
-        """Add user to active form collaboration"""
-        if form_id not in self.active_users:
-            self.active_users[form_id] = set()
-        
-        self.active_users[form_id].add(user_id)
-        self.user_sessions[user_id] = form_id
-    
-    def remove_user_from_form(self, user_id: str, form_id: str):
-        """Remove user from active form collaboration"""
-        if form_id in self.active_users:
-            self.active_users[form_id].discard(user_id)
-            if not self.active_users[form_id]:
-                del self.active_users[form_id]
-        
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
-    
-    def get_active_users_for_form(self, form_id: str) -> Set[str]:
-        """Get all active users for a specific form"""
-        return self.active_users.get(form_id, set())
-    
-    def get_user_form(self, user_id: str) -> Optional[str]:
-        """Get the form ID that a user is currently editing"""
-        return self.user_sessions.get(user_id)
-
-
-# Global collaboration manager instance
-collaboration_manager = CollaborationManager()
\ No newline at end of file
@@ -0,0 +1,6 @@
+from django.urls import path
+from .real_time_sync import SDGFormConsumer
+
+websocket_urlpatterns = [
+    path('ws/sdg-action-plan/<int:form_id>/', SDGFormConsumer.as_asgi()),
+]
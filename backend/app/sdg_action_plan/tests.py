@@ -1,10 +1,41 @@
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+import httplib2
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
+from knox.models import AuthToken
+from googleapiclient.errors import HttpError
 from django.contrib.auth.models import User
-from .models import SDGActionPlan
+from .collab import (CollabDocument, CollabRooms, Conflict, PatchError, PresenceBroadcaster, RoomState,
+                     collab_rooms, room_group)
+from .channel_layers import SQLiteChannelLayer
+from .docs_render import render_sections, utf16_len
+from .docs_sync import DocsShareQueue, DocsSyncQueue, plan_share_roles
+from .google_docs_service import GoogleClientPool, GoogleDocsService, OAuthRequired
+from .models import CollabLease, PlanAccess, SDGActionPlan
+from .permissions import PlanPermissionResolver
+from .routing import websocket_urlpatterns
 # adjust import based on your project structure
 from teams.models import Team, TeamMember
+from users.middleware import KnoxTokenAuthMiddleware
 
 
 class SDGActionPlanAPITestCase(APITestCase):
@@ -112,6 +143,24 @@ class SDGActionPlanAPITestCase(APITestCase):
         self.assertFalse(SDGActionPlan.objects.filter(
             id=action_plan.id).exists())
 
+    def test_viewer_cannot_delete_action_plan(self):
+        """A user listed as a viewer from outside the team cannot delete the plan."""
+        action_plan = SDGActionPlan.objects.create(
+            user=self.user,
+            impact_project_name="Project Impact to Keep",
+            plan_content={},
+            team=self.team
+        )
+        viewer = User.objects.create_user(username="viewer", password="testpassword")
+        action_plan.viewers.add(viewer)
+        self.client.force_authenticate(user=viewer)
+        detail_url = reverse('action-plan-delete',
+                             kwargs={'id': action_plan.id})
+        response = self.client.delete(detail_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(SDGActionPlan.objects.filter(
+            id=action_plan.id).exists())
+
     def test_team_member_can_view_shared_action_plan(self):
         """Test that a user who is a member of the same team (but not the creator) can view shared action plans."""
         # Create a second user and add them to the same team
@@ -223,3 +272,1028 @@ class SDGActionPlanAPITestCase(APITestCase):
         response = self.client.put(detail_url, payload, format="json")
         # Since user4 is not allowed to update (object is not in their queryset), they should receive a 404 Not Found
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_query_count_does_not_grow_with_plans(self):
+        """Test that listing plans costs the same number of queries for 1 or many plans."""
+        other = User.objects.create_user(username="other", password="testpassword")
+        TeamMember.objects.create(user=other, team=self.team, role="owner", is_pending=False)
+
+        def create_plans(count):
+            for i in range(count):
+                plan = SDGActionPlan.objects.create(
+                    user=other, impact_project_name=f"Plan {i}", plan_content={}, team=self.team)
+                plan.editors.add(self.user, other)
+                plan.viewers.add(other)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.list_url, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries), response.data
+
+        create_plans(1)
+        one_plan, _ = count_queries()
+        create_plans(9)
+        ten_plans, data = count_queries()
+        self.assertEqual(ten_plans, one_plan)
+        self.assertEqual(len(data), 10)
+        self.assertTrue(all(plan['can_edit'] and plan['can_view'] and not plan['is_owner'] for plan in data))
+        self.assertEqual(sorted(data[0]['editors']), sorted([self.user.id, other.id]))
+
+
+class PlanPermissionResolverTestCase(APITestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(username="creator", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        self.plan = SDGActionPlan.objects.create(
+            user=self.creator, impact_project_name="Plan", plan_content={}, team=self.team,
+            require_explicit_permissions=True)
+
+    def resolver_for(self, role=None, is_pending=False):
+        user = User.objects.create_user(username=f"user-{User.objects.count()}", password="testpassword")
+        if role:
+            TeamMember.objects.create(user=user, team=self.team, role=role, is_pending=is_pending)
+        return PlanPermissionResolver(user)
+
+    def test_team_roles(self):
+        owner, admin, member = self.resolver_for('owner'), self.resolver_for('admin'), self.resolver_for('member')
+        self.assertEqual([r.can_edit(self.plan) for r in (owner, admin, member)], [True, True, False])
+        self.assertEqual([r.can_view(self.plan) for r in (owner, admin, member)], [True, True, True])
+        self.assertEqual([r.is_owner(self.plan) for r in (owner, admin, member)], [True, False, False])
+        self.assertEqual([r.can_manage(self.plan) for r in (owner, admin, member)], [True, True, False])
+
+        self.assertFalse(self.resolver_for('owner', is_pending=True).can_view(self.plan))
+        self.assertTrue(PlanPermissionResolver(self.creator).is_owner(self.plan))
+
+    def test_explicit_editors_and_viewers(self):
+        editor, viewer = self.resolver_for(), self.resolver_for()
+        self.plan.editors.add(editor.user)
+        self.plan.viewers.add(viewer.user)
+        self.assertEqual((editor.can_edit(self.plan), editor.can_view(self.plan)), (True, False))
+        self.assertEqual((viewer.can_edit(self.plan), viewer.can_view(self.plan)), (False, True))
+
+    def test_rights_are_loaded_once(self):
+        resolver = self.resolver_for('member')
+        plans = [self.plan] + [
+            SDGActionPlan.objects.create(user=self.creator, impact_project_name=f"Plan {i}",
+                                         plan_content={}, team=self.team)
+            for i in range(3)]
+        with self.assertNumQueries(1):
+            for plan in plans:
+                resolver.can_edit(plan)
+                resolver.can_view(plan)
+                resolver.is_owner(plan)
+
+
+class PlanAccessTestCase(APITestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(username="creator", password="testpassword")
+        self.user = User.objects.create_user(username="user", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        self.plan = SDGActionPlan.objects.create(
+            user=self.creator, impact_project_name="Plan", plan_content={}, team=self.team)
+
+    def rights(self, user=None):
+        row = PlanAccess.objects.filter(plan=self.plan, user=user or self.user).first()
+        return row and (row.can_view, row.can_edit, row.can_manage, row.is_owner)
+
+    def test_follows_membership_changes(self):
+        self.assertIsNone(self.rights())
+        membership = TeamMember.objects.create(user=self.user, team=self.team, role="member", is_pending=True)
+        self.assertIsNone(self.rights())
+
+        membership.is_pending = False
+        membership.save()
+        self.assertEqual(self.rights(), (True, True, False, False))
+
+        membership.role = "admin"
+        membership.save()
+        self.assertEqual(self.rights(), (True, True, True, False))
+
+        membership.delete()
+        self.assertIsNone(self.rights())
+        self.assertEqual(self.rights(self.creator), (True, True, True, True))
+
+    def test_follows_plan_flags_and_explicit_lists(self):
+        TeamMember.objects.create(user=self.user, team=self.team, role="member", is_pending=False)
+        self.plan.require_explicit_permissions = True
+        self.plan.allow_team_view = False
+        self.plan.save()
+        self.assertIsNone(self.rights())
+
+        self.plan.editors.add(self.user)
+        self.assertEqual(self.rights(), (False, True, False, False))
+        self.user.viewable_action_plans.add(self.plan)
+        self.assertEqual(self.rights(), (True, True, False, False))
+
+        self.plan.editors.clear()
+        self.user.viewable_action_plans.clear()
+        self.assertIsNone(self.rights())
+
+    def test_list_uses_access_table(self):
+        outsider = User.objects.create_user(username="outsider", password="testpassword")
+        self.plan.viewers.add(outsider)
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(reverse('action-plan-list'), format="json")
+        self.assertEqual([plan['id'] for plan in response.data], [self.plan.id])
+        self.assertEqual((response.data[0]['can_view'], response.data[0]['can_edit']), (True, False))
+
+    def test_rebuild_matches_signals(self):
+        TeamMember.objects.create(user=self.user, team=self.team, role="owner", is_pending=False)
+        before = sorted(PlanAccess.objects.values_list('plan_id', 'user_id', 'can_view', 'can_edit', 'is_owner'))
+        PlanAccess.rebuild()
+        after = sorted(PlanAccess.objects.values_list('plan_id', 'user_id', 'can_view', 'can_edit', 'is_owner'))
+        self.assertEqual(after, before)
+
+    def test_deleting_team_removes_rows(self):
+        TeamMember.objects.create(user=self.user, team=self.team, role="member", is_pending=False)
+        self.team.delete()
+        self.assertFalse(PlanAccess.objects.exists())
+
+
+class FakeDocsService:
+    """Local stand-in for GoogleDocsService recording the writes it receives"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.updates = []
+        self.written = threading.Event()
+
+    def __call__(self):
+        # used as the queue's service factory
+        return self
+
+    def sync_document(self, document_id, content, previous_state=None):
+        if self.failures:
+            self.failures -= 1
+            return None
+        self.updates.append((document_id, content))
+        self.written.set()
+        return {'sections': [], 'revision': f"r{len(self.updates)}"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DocsSyncQueueTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        self.plan = SDGActionPlan.objects.create(
+            user=self.user, impact_project_name="Plan", plan_content={}, team=self.team,
+            google_doc_id="doc-1", google_doc_created=True)
+        self.docs = FakeDocsService()
+        self.clock = FakeClock()
+        self.queue = DocsSyncQueue(service_factory=self.docs, debounce=2, max_delay=10, backoff=5,
+                                   max_attempts=3, workers=0, clock=self.clock)
+
+    def edit(self, at, description):
+        self.clock.now = at
+        SDGActionPlan.objects.filter(pk=self.plan.pk).update(description=description)
+        self.queue.schedule(self.plan.pk)
+
+    def test_burst_of_edits_is_one_write_of_the_latest_content(self):
+        for second in range(5):
+            self.edit(second, f"v{second}")
+        self.assertEqual(self.queue.run_pending(now=5.5), 0)
+        self.assertEqual(self.queue.run_pending(now=6), 1)
+
+        self.assertEqual(len(self.docs.updates), 1)
+        self.assertEqual(self.docs.updates[0][0], "doc-1")
+        self.assertEqual(self.docs.updates[0][1]['description'], "v4")
+        self.plan.refresh_from_db()
+        self.assertIsNotNone(self.plan.last_sync_time)
+        self.assertEqual(self.plan.google_doc_sync_state['revision'], "r1")
+
+    def test_continuous_edits_still_sync_within_max_delay(self):
+        for second in range(10):
+            self.edit(second, f"v{second}")
+        self.assertEqual(self.queue.run_pending(now=10), 1)
+        self.assertEqual(self.docs.updates[0][1]['description'], "v9")
+
+    def test_failed_writes_are_retried_with_backoff(self):
+        self.docs.failures = 1
+        self.edit(0, "v0")
+        self.clock.now = 2
+        self.queue.run_pending()
+        self.assertEqual((self.docs.updates, len(self.queue)), ([], 1))
+
+        self.clock.now = 6
+        self.assertEqual(self.queue.run_pending(), 0)
+        self.clock.now = 7
+        self.assertEqual(self.queue.run_pending(), 1)
+        self.assertEqual(len(self.docs.updates), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        self.docs.failures = 10
+        self.edit(0, "v0")
+        for now in (2, 7, 17):
+            self.clock.now = now
+            self.queue.run_pending()
+        self.assertEqual(len(self.queue), 0)
+        self.assertIsNone(SDGActionPlan.objects.get(pk=self.plan.pk).last_sync_time)
+
+    def test_update_endpoint_does_not_wait_on_google(self):
+        TeamMember.objects.create(user=self.user, team=self.team, role="member", is_pending=False)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('action-plan-update', kwargs={'id': self.plan.id})
+        with mock.patch('sdg_action_plan.views.docs_sync_queue', self.queue), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {"description": "changed"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((self.docs.updates, len(self.queue)), ([], 1))
+
+        self.queue.run_pending(now=self.clock.now + 2)
+        self.assertEqual(self.docs.updates[0][1]['description'], "changed")
+
+
+class DocsSyncWorkerTestCase(TransactionTestCase):
+    def test_worker_thread_syncs_in_background(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        plan = SDGActionPlan.objects.create(
+            user=user, impact_project_name="Plan", plan_content={}, team=Team.objects.create(name="Team"),
+            google_doc_id="doc-1", google_doc_created=True)
+        docs = FakeDocsService()
+        queue = DocsSyncQueue(service_factory=docs, debounce=0, workers=1)
+        self.addCleanup(queue.stop, 5)
+
+        queue.schedule(plan.pk)
+        self.assertTrue(docs.written.wait(5))
+        self.assertEqual(docs.updates[0][0], "doc-1")
+
+
+class FakeDocsAPI:
+    """
+    Local stand-in for the Docs v1 `documents()` resource.
+
+    Keeps each document body as plain text (index 1 is its first character, a
+    final newline always remains), applies insertText/deleteContentRange,
+    checks style ranges and honours writeControl revisions like the real API.
+    """
+
+    def __init__(self):
+        self.bodies = {}
+        self.revisions = {}
+        self.batches = []
+
+    def create(self, document_id):
+        self.bodies[document_id] = "\n"
+        self.revisions[document_id] = 0
+
+    def documents(self):
+        return self
+
+    def get(self, documentId):
+        body, revision = self.bodies[documentId], self.revisions[documentId]
+        return self.Call(lambda: {
+            'documentId': documentId,
+            'revisionId': f"rev{revision}",
+            'body': {'content': [{'endIndex': 1}, {'endIndex': utf16_len(body) + 1}]},
+        })
+
+    def batchUpdate(self, documentId, body):
+        return self.Call(lambda: self.apply(documentId, body))
+
+    def edit_elsewhere(self, document_id, text):
+        """Simulate someone typing into the document in Google Docs"""
+        self.bodies[document_id] = text + self.bodies[document_id]
+        self.revisions[document_id] += 1
+
+    def fail(self, message):
+        raise HttpError(httplib2.Response({'status': 400}), message.encode())
+
+    def apply(self, document_id, body):
+        required = body.get('writeControl', {}).get('requiredRevisionId')
+        if required and required != f"rev{self.revisions[document_id]}":
+            self.fail("The document was modified since the required revision")
+        self.batches.append(body['requests'])
+        # indexes count UTF-16 code units, so edit the UTF-16 encoding
+        text = self.bodies[document_id].encode('utf-16-le')
+        size = len(text) // 2
+        for request in body['requests']:
+            (kind, params), = request.items()
+            if kind == 'insertText':
+                index = params['location']['index']
+                if not 1 <= index <= size:
+                    self.fail(f"insert index {index} out of range")
+                text = text[:2 * (index - 1)] + params['text'].encode('utf-16-le') + text[2 * (index - 1):]
+            elif kind == 'deleteContentRange':
+                start, end = params['range']['startIndex'], params['range']['endIndex']
+                if not 1 <= start < end <= size:
+                    self.fail(f"delete range {start}-{end} out of range")
+                text = text[:2 * (start - 1)] + text[2 * (end - 1):]
+            else:
+                start, end = params['range']['startIndex'], params['range']['endIndex']
+                if not 1 <= start < end <= size + 1:
+                    self.fail(f"style range {start}-{end} out of range")
+            size = len(text) // 2
+        text = text.decode('utf-16-le')
+        self.bodies[document_id] = text
+        self.revisions[document_id] += 1
+        return {'documentId': document_id,
+                'writeControl': {'requiredRevisionId': f"rev{self.revisions[document_id]}"}}
+
+    class Call:
+        def __init__(self, run):
+            self.execute = run
+
+
+class IncrementalDocsSyncTestCase(APITestCase):
+    def setUp(self):
+        self.api = FakeDocsAPI()
+        self.api.create("doc-1")
+        self.service = GoogleDocsService(service=self.api)
+        self.content = {
+            'impact_project_name': "Clean Rivers",
+            'name_of_designers': "Ana, Ben",
+            'description': "Reduce plastic in rivers.",
+            'plan_content': {
+                'SDGs': ["6", "14"],
+                'role': "Student",
+                'challenge': "Litter",
+                'steps': {'input1': "Survey", 'input2': "Clean up"},
+                'impact_types': {'rank1': "Environmental", 'rank2': ""},
+                'risk': "Weather",
+            },
+        }
+
+    def sync(self, state=None):
+        state = self.service.sync_document("doc-1", self.content, state)
+        self.assertIsNotNone(state)
+        expected = ''.join(text for _, text in render_sections(self.content)) + "\n"
+        self.assertEqual(self.api.bodies["doc-1"], expected)
+        return state
+
+    def test_one_character_edit_sends_one_character(self):
+        state = self.sync()
+        self.content['plan_content']['steps']['input2'] = "Clean-up"
+        self.sync(state)
+
+        self.assertEqual(self.api.batches[-1], [
+            {'deleteContentRange': {'range': {'startIndex': mock.ANY, 'endIndex': mock.ANY}}},
+            {'insertText': {'location': {'index': mock.ANY}, 'text': "-"}},
+        ])
+
+    def test_payload_does_not_grow_with_document(self):
+        state = self.sync()
+        self.content['description'] = "Reduce plastic in rivers. " * 2000
+        state = self.sync(state)
+
+        self.content['plan_content']['role'] = "Teacher"
+        self.sync(state)
+        self.assertLess(len(json.dumps(self.api.batches[-1])), 300)
+
+    def test_sections_appear_and_disappear(self):
+        state = self.sync()
+        content = self.content['plan_content']
+        content['steps'] = {'input3': "Report", 'input2': "Clean up"}
+        content['impact_types'] = {}
+        content['SDGs'] = []
+        content['mitigation'] = "Reschedule"
+        content['example'] = "Riverkeepers — \U0001F30A"
+        state = self.sync(state)
+
+        self.content['description'] = "Emoji \U0001F30A before later sections"
+        self.content['plan_content']['risk'] = ""
+        self.sync(state)
+
+    def test_unchanged_content_sends_nothing(self):
+        state = self.sync()
+        self.assertEqual(self.sync(state), state)
+        self.assertEqual(len(self.api.batches), 1)
+
+    def test_edits_made_elsewhere_force_a_full_rewrite(self):
+        state = self.sync()
+        self.api.edit_elsewhere("doc-1", "Typed in Google Docs\n")
+        self.content['name_of_designers'] = "Ana, Ben, Cy"
+        self.sync(state)
+        self.assertEqual(self.api.batches[-1][0]['deleteContentRange']['range']['startIndex'], 1)
+
+
+class FakeCredentials:
+    """Picklable stand-in for google.oauth2 credentials"""
+
+    def __init__(self, expires_in=3600):
+        self.token = "token-0"
+        self.refresh_token = "refresh"
+        self.expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+        self.refreshes = 0
+
+    @property
+    def valid(self):
+        return self.expiry > datetime.utcnow()
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+class GoogleClientPoolTestCase(APITestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.token_path = os.path.join(tmp.name, 'token.pickle')
+        credentials_path = os.path.join(tmp.name, 'credentials.json')
+        with open(credentials_path, 'w') as f:
+            json.dump({'installed': {'client_id': 'id', 'client_secret': 'secret',
+                                     'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+                                     'token_uri': 'https://oauth2.googleapis.com/token'}}, f)
+        self.builds = []
+        self.pool = GoogleClientPool(token_path=self.token_path, credentials_path=credentials_path,
+                                     builder=lambda api, version, creds: self.builds.append(api) or object())
+
+    def write_token(self, creds):
+        with open(self.token_path, 'wb') as f:
+            pickle.dump(creds, f)
+
+    def test_services_share_built_clients_and_credentials(self):
+        self.write_token(FakeCredentials())
+        first = GoogleDocsService(pool=self.pool)
+        second = GoogleDocsService(pool=self.pool)
+        self.assertIs(first.service, second.service)
+        self.assertIs(first.creds, second.creds)
+        self.assertEqual(self.builds, ['docs'])
+
+    def test_expiring_token_is_refreshed_once_and_saved(self):
+        self.write_token(FakeCredentials(expires_in=60))
+        mtime = os.stat(self.token_path).st_mtime_ns
+        threads = [threading.Thread(target=self.pool.credentials) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        creds = self.pool.credentials()
+        self.assertEqual((creds.refreshes, creds.token), (1, "token-1"))
+        with open(self.token_path, 'rb') as f:
+            self.assertEqual(pickle.load(f).token, "token-1")
+        self.assertNotEqual(os.stat(self.token_path).st_mtime_ns, mtime)
+
+    def test_fresh_token_is_not_rewritten(self):
+        self.write_token(FakeCredentials())
+        mtime = os.stat(self.token_path).st_mtime_ns
+        for _ in range(3):
+            self.pool.credentials()
+        self.assertEqual(os.stat(self.token_path).st_mtime_ns, mtime)
+
+    def test_new_credentials_rebuild_clients(self):
+        self.write_token(FakeCredentials())
+        self.pool.client('docs', 'v1')
+        self.pool.store(FakeCredentials())
+        self.pool.client('docs', 'v1')
+        self.assertEqual(self.builds, ['docs', 'docs'])
+
+    def test_missing_token_requires_oauth(self):
+        with self.assertRaises(OAuthRequired) as raised:
+            self.pool.credentials()
+        self.assertIn('accounts.google.com', raised.exception.auth_url)
+
+
+class FakeDriveAPI:
+    """Local stand-in for the Drive v3 permissions resource and batch requests"""
+
+    def __init__(self, permissions=(), failing=()):
+        self.permissions_by_id = {str(i): dict(p, id=str(i)) for i, p in enumerate(permissions)}
+        self.failing = set(failing)
+        self.round_trips = 0
+        self.sent = []
+
+    def client(self, api, version):
+        # doubles as the GoogleClientPool handing out this client
+        return self
+
+    def permissions(self):
+        return self
+
+    def list(self, fileId, fields):
+        def run():
+            self.round_trips += 1
+            return {'permissions': list(self.permissions_by_id.values())}
+        return FakeDocsAPI.Call(run)
+
+    def create(self, fileId, body, fields):
+        def run():
+            if body['emailAddress'] in self.failing:
+                raise HttpError(httplib2.Response({'status': 400}), b"invalid sharing request")
+            self.permissions_by_id[f"new-{body['emailAddress']}"] = dict(body, id=f"new-{body['emailAddress']}")
+        return FakeDocsAPI.Call(run)
+
+    def update(self, fileId, permissionId, body, fields):
+        return FakeDocsAPI.Call(lambda: self.permissions_by_id[permissionId].update(body))
+
+    def delete(self, fileId, permissionId):
+        return FakeDocsAPI.Call(lambda: self.permissions_by_id.pop(permissionId))
+
+    def new_batch_http_request(self, callback):
+        drive = self
+
+        class Batch:
+            def __init__(self):
+                self.calls = []
+
+            def add(self, call, request_id):
+                self.calls.append((request_id, call))
+
+            def execute(self):
+                drive.round_trips += 1
+                drive.sent.append(len(self.calls))
+                for request_id, call in self.calls:
+                    try:
+                        callback(request_id, call.execute(), None)
+                    except HttpError as error:
+                        callback(request_id, None, error)
+        return Batch()
+
+    def shared_with(self):
+        return {p['emailAddress']: p['role'] for p in self.permissions_by_id.values()}
+
+
+class DocsSharingTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username="owner", email="owner@example.com", password="pw")
+        self.team = Team.objects.create(name="Team")
+        TeamMember.objects.create(user=self.owner, team=self.team, role="owner", is_pending=False)
+        self.plan = SDGActionPlan.objects.create(
+            user=self.owner, impact_project_name="Plan", plan_content={}, team=self.team, google_doc_id="doc-1")
+
+    def service(self, drive):
+        return GoogleDocsService(service=FakeDocsAPI(), pool=drive)
+
+    def test_team_of_six_is_one_batch(self):
+        for i in range(5):
+            member = User.objects.create_user(username=f"member{i}", email=f"m{i}@example.com", password="pw")
+            TeamMember.objects.create(user=member, team=self.team, role="member", is_pending=False)
+        drive = FakeDriveAPI(permissions=[{'type': 'user', 'role': 'owner', 'emailAddress': 'app@example.com'}])
+        queue = DocsShareQueue(service_factory=lambda: self.service(drive), debounce=0, workers=0)
+
+        queue.schedule(self.plan.pk)
+        queue.run_pending()
+        self.assertEqual((drive.round_trips, drive.sent), (2, [6]))
+        self.assertEqual(drive.shared_with()['m4@example.com'], 'writer')
+        self.assertEqual(drive.shared_with()['app@example.com'], 'owner')
+
+    def test_only_deltas_are_sent(self):
+        viewer = User.objects.create_user(username="viewer", email="viewer@example.com", password="pw")
+        self.plan.viewers.add(viewer)
+        drive = FakeDriveAPI(permissions=[
+            {'type': 'user', 'role': 'writer', 'emailAddress': 'Owner@example.com'},
+            {'type': 'user', 'role': 'writer', 'emailAddress': 'viewer@example.com'},
+            {'type': 'user', 'role': 'reader', 'emailAddress': 'former@example.com'},
+        ])
+        result = self.service(drive).reconcile_permissions(
+            "doc-1", plan_share_roles(self.plan.pk), granted=['former@example.com'])
+
+        self.assertEqual(result, {'created': [], 'updated': ['viewer@example.com'],
+                                  'removed': ['former@example.com'], 'failed': [], 'granted': []})
+        self.assertEqual(drive.sent, [2])
+        self.assertEqual(self.service(drive).reconcile_permissions("doc-1", plan_share_roles(self.plan.pk)),
+                         {'created': [], 'updated': [], 'removed': [], 'failed': [], 'granted': []})
+        self.assertEqual(drive.sent, [2])
+
+    def test_only_permissions_the_app_granted_are_removed(self):
+        member = User.objects.create_user(username="member", email="member@example.com", password="pw")
+        team_member = TeamMember.objects.create(user=member, team=self.team, role="member", is_pending=False)
+        drive = FakeDriveAPI(permissions=[
+            {'type': 'user', 'role': 'owner', 'emailAddress': 'app@example.com'},
+            {'type': 'user', 'role': 'reader', 'emailAddress': 'by-hand@example.com'},
+        ])
+        queue = DocsShareQueue(service_factory=lambda: self.service(drive), debounce=0, workers=0)
+
+        queue.schedule(self.plan.pk)
+        queue.run_pending()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.google_doc_shared_with, ['member@example.com', 'owner@example.com'])
+
+        team_member.delete()
+        queue.schedule(self.plan.pk)
+        queue.run_pending()
+        self.plan.refresh_from_db()
+        # the member the app shared with loses access; the person shared by hand in Google Docs keeps it
+        self.assertEqual(set(drive.shared_with()), {'app@example.com', 'by-hand@example.com', 'owner@example.com'})
+        self.assertEqual(self.plan.google_doc_shared_with, ['owner@example.com'])
+
+    def test_failed_shares_are_retried(self):
+        member = User.objects.create_user(username="member", email="bad@example.com", password="pw")
+        TeamMember.objects.create(user=member, team=self.team, role="member", is_pending=False)
+        drive = FakeDriveAPI(failing={'bad@example.com'})
+        queue = DocsShareQueue(service_factory=lambda: self.service(drive), debounce=0, backoff=0, workers=0)
+
+        queue.schedule(self.plan.pk)
+        queue.run_pending(now=0)
+        self.assertEqual(len(queue), 1)
+        drive.failing.clear()
+        queue.run_pending()
+        self.assertEqual(set(drive.shared_with()), {'owner@example.com', 'bad@example.com'})
+
+    def test_access_changes_schedule_a_reconciliation(self):
+        queue = DocsShareQueue(workers=0)
+        member = User.objects.create_user(username="member", email="member@example.com", password="pw")
+        with mock.patch('sdg_action_plan.models.docs_share_queue', queue), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.plan.description = "unrelated edit"
+            self.plan.save()
+        self.assertEqual(len(queue), 0)
+
+        with mock.patch('sdg_action_plan.models.docs_share_queue', queue), \
+                self.captureOnCommitCallbacks(execute=True):
+            TeamMember.objects.create(user=member, team=self.team, role="member", is_pending=False)
+        self.assertEqual(len(queue), 1)
+
+
+class CollabDocumentTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        self.plan = SDGActionPlan.objects.create(
+            user=self.user, impact_project_name="Plan", description="old",
+            plan_content={'steps': {'input1': "first"}}, team=self.team)
+        self.clock = FakeClock()
+        self.document = CollabDocument.load(self.plan.pk, clock=self.clock)
+
+    def test_patches_bump_the_version(self):
+        self.assertEqual(self.document.apply('description', "new", 0, author='a'), 1)
+        self.assertEqual(self.document.apply('plan_content.steps.input2', "second", 1, author='a'), 2)
+        self.assertEqual(self.document.snapshot()['plan_content'],
+                         {'steps': {'input1': "first", 'input2': "second"}})
+        with self.assertRaises(PatchError):
+            self.document.apply('user', 1)
+        with self.assertRaises(PatchError):
+            self.document.apply('description.text', "x")
+
+    def test_concurrent_patches_rebase_or_conflict(self):
+        self.document.apply('plan_content.steps.input1', "from a", 0, author='a')
+        # b has not seen a's edit: another field is rebased, the same one is rejected
+        self.assertEqual(self.document.apply('plan_content.challenge', "from b", 0, author='b'), 2)
+        with self.assertRaises(Conflict) as caught:
+            self.document.apply('plan_content.steps', {'input1': "from b"}, 0, author='b')
+        self.assertEqual((caught.exception.version, caught.exception.value), (2, {'input1': "from a"}))
+        # a's own unacknowledged patches do not conflict with each other
+        self.assertEqual(self.document.apply('plan_content.steps.input1', "from a again", 0, author='a'), 3)
+        # after catching up b's patch applies
+        self.assertEqual(self.document.apply('plan_content.steps.input1', "from b", 3, author='b'), 4)
+
+    def test_edits_are_flushed_in_batches(self):
+        for i in range(50):
+            self.document.apply('description', "x" * i, i, author='a')
+            self.clock.now += 0.01
+        self.assertTrue(self.document.should_flush())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.document.flush())
+            self.assertFalse(self.document.flush())
+        self.assertEqual(len(queries), 1)
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.description, "x" * 49)
+        # only the edited column was written
+        self.assertNotIn('plan_content', queries[0]['sql'])
+
+    def test_flush_waits_for_idle_or_interval(self):
+        self.document.apply('description', "a")
+        self.assertFalse(self.document.should_flush())
+        self.clock.now += CollabDocument.idle_flush
+        self.assertTrue(self.document.should_flush())
+
+        self.document.flush()
+        # steady typing never goes idle but is still flushed every interval
+        started = self.clock.now
+        while self.clock.now - started < CollabDocument.flush_interval:
+            self.assertFalse(self.document.should_flush())
+            self.document.apply('description', str(self.clock.now))
+            self.clock.now += 0.1
+        self.assertTrue(self.document.should_flush())
+
+    def test_room_follows_docs_linkage(self):
+        room = RoomState.load(self.plan.pk)
+        self.assertFalse(room.has_google_doc)
+        with mock.patch.object(collab_rooms, '_rooms', {self.plan.pk: room}), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.plan.google_doc_id = "doc-1"
+            self.plan.google_doc_created = True
+            self.plan.save()
+        self.assertTrue(room.has_google_doc)
+        # edits and reads go to the room, not the database
+        with self.assertNumQueries(0):
+            room.document.apply('description', "new")
+            self.assertEqual(room.document.snapshot()['description'], "new")
+
+
+    def test_rest_saves_reach_the_open_room(self):
+        room = RoomState.load(self.plan.pk)
+        room.document.apply('description', "typed in the room", 0, author='a')
+        broadcasts = []
+
+        async def broadcast(plan_id, changes):
+            broadcasts.extend(changes)
+
+        rooms = mock.patch.object(collab_rooms, '_rooms', {self.plan.pk: room})
+        on_saved = mock.patch.object(collab_rooms, '_broadcast_saved', broadcast)
+        self.client.force_authenticate(user=self.user)
+        with rooms, on_saved, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('action-plan-update', kwargs={'id': self.plan.pk}),
+                                         {'plan_content': {'steps': {'input1': "from the form"}}}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # the REST edit is a new version; the room's unflushed edit of another column is kept
+        self.assertEqual(broadcasts, [('plan_content', {'steps': {'input1': "from the form"}}, 2)])
+        self.assertEqual(room.document.snapshot(), {
+            'version': 2, 'impact_project_name': "Plan", 'name_of_designers': '',
+            'description': "typed in the room", 'plan_content': {'steps': {'input1': "from the form"}}})
+        with self.assertRaises(Conflict):
+            room.document.apply('plan_content.steps.input1', "stale", 1, author='a')
+
+        room.document.flush()
+        self.plan.refresh_from_db()
+        self.assertEqual((self.plan.description, self.plan.plan_content),
+                         ("typed in the room", {'steps': {'input1': "from the form"}}))
+
+
+class CollabRoomsTestCase(TransactionTestCase):
+    """
+    Rooms run their database work through database_sync_to_async, which closes
+    the connection afterwards, so these tests cannot share the test transaction.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        self.plan = SDGActionPlan.objects.create(
+            user=self.user, impact_project_name="Plan", description="old",
+            plan_content={'steps': {'input1': "first"}}, team=self.team)
+
+    def test_rooms_share_state_and_flush_on_close(self):
+        rooms = CollabRooms(channel_layer=InMemoryChannelLayer())
+        other = User.objects.create_user(username="other", password="pw")
+
+        async def session():
+            await rooms.join(self.plan.pk, 'channel-1', self.user)
+            await rooms.join(self.plan.pk, 'channel-2', other)
+            welcome = await rooms.join(self.plan.pk, 'channel-3', self.user)
+            self.assertEqual([user['username'] for user in welcome['users']], ["testuser", "other"])
+            rooms.get(self.plan.pk).document.apply('description', "edited")
+            await rooms.leave(self.plan.pk, 'channel-1')
+            await rooms.leave(self.plan.pk, 'channel-2')
+            self.assertIn(self.plan.pk, rooms)
+            await rooms.leave(self.plan.pk, 'channel-3')
+            self.assertNotIn(self.plan.pk, rooms)
+            self.assertIsNone(await rooms.join(0, 'channel-4', self.user))
+
+        async_to_sync(session)()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.description, "edited")
+        self.assertFalse(CollabLease.objects.exists())
+
+    def processes(self, **options):
+        """Two CollabRooms standing in for two ASGI processes sharing a channel layer file"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'channels.sqlite3')
+        rooms = [CollabRooms(channel_layer=SQLiteChannelLayer(path=path, poll_interval=0.005)) for _ in range(2)]
+        for process in rooms:
+            for name, value in options.items():
+                setattr(process, name, value)
+        return rooms
+
+    async def until(self, condition, timeout=2):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition():
+            self.assertLess(asyncio.get_running_loop().time(), deadline)
+            await asyncio.sleep(0.01)
+
+    def test_rooms_of_other_processes_forward_to_the_owner(self):
+        first, second = self.processes()
+        other = User.objects.create_user(username="other", password="pw")
+        pk = self.plan.pk
+
+        async def broadcast(listener, kind):
+            while True:
+                message = await asyncio.wait_for(first.channel_layer.receive(listener), 2)
+                if message['type'] == kind and message.get('cursors', True):
+                    return message
+
+        async def session():
+            listener = await first.channel_layer.new_channel()
+            await first.channel_layer.group_add(room_group(pk), listener)
+
+            await first.join(pk, 'channel-1', self.user)
+            welcome = await second.join(pk, 'channel-2', other)
+            # the first process serves the room; the second one only forwards to it
+            self.assertIsNotNone(first.get(pk))
+            self.assertIsNone(second.get(pk))
+            self.assertEqual([user['username'] for user in welcome['users']], ["testuser", "other"])
+
+            # one document and one version sequence for both processes
+            self.assertEqual(await second.submit(pk, 'description', "from second", 0, 'channel-2'), 1)
+            with self.assertRaises(Conflict):
+                await first.submit(pk, 'description', "from first", 0, 'channel-1')
+            with self.assertRaises(PatchError):
+                await second.submit(pk, 'user', 1, 1, 'channel-2')
+            update = await broadcast(listener, 'form_update_broadcast')
+            self.assertEqual((update['value'], update['version']), ("from second", 1))
+
+            # presence merged by the second process is broadcast by the owner
+            second.cursor(pk, other.id, 'description', 3)
+            frame = await broadcast(listener, 'presence_broadcast')
+            self.assertEqual(frame['cursors'], [{'user_id': other.id, 'field': 'description', 'position': 3}])
+
+            # a REST save handled by the second process reaches the room
+            await database_sync_to_async(second.saved)(pk, {'impact_project_name': "Renamed"})
+            document = first.get(pk).document
+            await self.until(lambda: document.snapshot()['impact_project_name'] == "Renamed")
+
+            await second.leave(pk, 'channel-2')
+            await first.leave(pk, 'channel-1')
+            await self.until(lambda: pk not in first)
+            self.assertNotIn(pk, second)
+            await first.channel_layer.close()
+            await second.channel_layer.close()
+
+        async_to_sync(session)()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.description, "from second")
+        self.assertFalse(CollabLease.objects.exists())
+
+    def test_room_moves_when_its_owner_goes_away(self):
+        first, second = self.processes(request_timeout=0.2)
+        pk = self.plan.pk
+
+        async def session():
+            await first.join(pk, 'channel-1', self.user)
+            await second.join(pk, 'channel-2', self.user)
+            await second.submit(pk, 'description', "never flushed", 0, 'channel-2')
+
+            # the owner dies without flushing or releasing its lease, which then expires
+            room = first.get(pk)
+            for task in room.tasks + [room.flusher._task]:
+                task.cancel()
+            await room.presence.close()
+            await database_sync_to_async(CollabLease.objects.update)(expires=timezone.now())
+
+            # the second process takes the room over from the database
+            self.assertEqual(await second.submit(pk, 'plan_content.challenge', "after", None, 'channel-2'), 1)
+            self.assertIsNotNone(second.get(pk))
+            self.assertEqual(second.get(pk).document.snapshot()['description'], "old")
+            await second.leave(pk, 'channel-2')
+            await first.channel_layer.close()
+            await second.channel_layer.close()
+
+        async_to_sync(session)()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.plan_content, {'steps': {'input1': "first"}, 'challenge': "after"})
+        self.assertFalse(CollabLease.objects.exists())
+
+
+class PresenceBroadcasterTestCase(APITestCase):
+    def test_updates_are_merged_into_one_frame(self):
+        presence = PresenceBroadcaster()
+        for position in range(100):
+            presence.cursor(1, 'description', position)
+        presence.cursor(2, 'plan_content.challenge', 3)
+        presence.typing(1, 'description', True)
+        presence.typing(1, 'description', False)
+
+        self.assertEqual(presence.frame(), {
+            'cursors': [{'user_id': 1, 'field': 'description', 'position': 99},
+                        {'user_id': 2, 'field': 'plan_content.challenge', 'position': 3}],
+            'typing': [{'user_id': 1, 'field': 'description', 'is_typing': False}],
+            'users': None,
+        })
+        self.assertIsNone(presence.frame())
+
+    def test_frames_are_sent_at_a_bounded_rate(self):
+        frames = []
+
+        async def send(frame):
+            frames.append(frame)
+
+        async def session():
+            presence = PresenceBroadcaster(rate=20)
+            presence.bind(send)
+            presence.users_changed([{'user_id': 1, 'username': "a"}])
+            for position in range(200):
+                presence.cursor(1, 'description', position)
+                await asyncio.sleep(0.001)
+            await asyncio.sleep(0.1)
+            await presence.close()
+
+        async_to_sync(session)()
+        # about 0.3s of events at 20 frames a second
+        self.assertLessEqual(len(frames), 8)
+        self.assertEqual(frames[0]['users'], [{'user_id': 1, 'username': "a"}])
+        self.assertEqual(frames[-1]['cursors'], [{'user_id': 1, 'field': 'description', 'position': 199}])
+        self.assertTrue(all(len(frame['cursors']) <= 1 for frame in frames))
+
+
+class SQLiteChannelLayerTestCase(APITestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'channels.sqlite3')
+
+    def layer(self, **kwargs):
+        return SQLiteChannelLayer(path=self.path, poll_interval=0.005, **kwargs)
+
+    def test_groups_reach_other_processes(self):
+        async def session():
+            first, second = self.layer(), self.layer()
+            channel = await first.new_channel()
+            other = await second.new_channel()
+            await first.group_add('form_1', channel)
+            await second.group_add('form_1', other)
+            await second.group_send('form_1', {'type': 'form.update', 'value': "é"})
+            received = await asyncio.wait_for(asyncio.gather(first.receive(channel), second.receive(other)), 2)
+
+            await first.group_discard('form_1', channel)
+            await second.group_send('form_1', {'type': 'form.update', 'value': 2})
+            await asyncio.wait_for(second.receive(other), 2)
+            await first.close()
+            await second.close()
+            return received
+
+        self.assertEqual(async_to_sync(session)(), [{'type': 'form.update', 'value': "é"}] * 2)
+
+    def test_capacity_and_expiry(self):
+        async def session():
+            layer = self.layer(capacity=2)
+            await layer.send('worker', {'n': 1})
+            await layer.send('worker', {'n': 2})
+            with self.assertRaises(ChannelFull):
+                await layer.send('worker', {'n': 3})
+            self.assertEqual(await layer.receive('worker'), {'n': 1})
+
+            layer.expiry = -1
+            await layer.send('worker', {'n': 4})
+            layer.expiry = 60
+            await layer.send('worker', {'n': 5})
+            # the expired message is skipped
+            self.assertEqual([await layer.receive('worker'), await layer.receive('worker')], [{'n': 2}, {'n': 5}])
+            await layer.flush()
+
+        async_to_sync(session)()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SDGFormConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.viewer = User.objects.create_user(username="viewer", password="testpassword")
+        self.team = Team.objects.create(name="Team")
+        TeamMember.objects.create(user=self.user, team=self.team, role="member", is_pending=False)
+        self.plan = SDGActionPlan.objects.create(
+            user=self.user, impact_project_name="Plan", plan_content={}, team=self.team)
+        self.plan.viewers.add(self.viewer)
+        self.application = KnoxTokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def connect(self, token=None, headers=None):
+        path = f'/ws/sdg-action-plan/{self.plan.pk}/' + (f'?token={token}' if token else '')
+        return WebsocketCommunicator(self.application, path, headers=headers or [])
+
+    async def receive(self, communicator):
+        """The next message other than a presence frame"""
+        while True:
+            message = await communicator.receive_json_from()
+            if message['type'] != 'presence':
+                return message
+
+    def test_collaboration_over_websockets(self):
+        _, token = AuthToken.objects.create(self.user)
+        _, viewer_token = AuthToken.objects.create(self.viewer)
+
+        async def session():
+            anonymous = self.connect()
+            connected, _ = await anonymous.connect()
+            self.assertFalse(connected)
+
+            editor = self.connect(headers=[(b'authorization', f'Token {token}'.encode())])
+            viewer = self.connect(viewer_token)
+            self.assertTrue((await editor.connect())[0])
+            self.assertTrue((await viewer.connect())[0])
+            welcome = await editor.receive_json_from()
+            self.assertEqual((welcome['type'], welcome['version']), ('connection_established', 0))
+            await self.receive(viewer)
+
+            await editor.send_json_to({'type': 'form_update', 'field': 'description', 'value': "new", 'version': 0})
+            self.assertEqual((await self.receive(editor))['type'], 'form_update_ack')
+            update = await self.receive(viewer)
+            self.assertEqual((update['type'], update['value'], update['version']), ('form_update', "new", 1))
+
+            await viewer.send_json_to({'type': 'form_update', 'field': 'description', 'value': "x", 'version': 1})
+            self.assertEqual((await self.receive(viewer))['type'], 'error')
+
+            # a late joiner gets the room's fields with their version, including edits not flushed yet
+            late = self.connect(viewer_token)
+            self.assertTrue((await late.connect())[0])
+            welcome = await self.receive(late)
+            self.assertEqual((welcome['version'], welcome['form_data']['description']), (1, "new"))
+
+            await late.disconnect()
+            await viewer.disconnect()
+            await editor.disconnect()
+
+        async_to_sync(session)()
+        self.plan.refresh_from_db()
+        self.assertEqual(self.plan.description, "new")
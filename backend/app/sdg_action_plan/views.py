@@ -4,8 +4,9 @@ from django.contrib.auth.models import User
 from teams.models import TeamMember
 from .models import SDGActionPlan
 from .serializers import SDGActionPlanSerializer
-from .google_docs_service import GoogleDocsService, OAuthRequired
-from django.db.models import Q
+from .permissions import PlanPermissionResolver, with_plan_relations
+from .google_docs_service import GoogleDocsService, OAuthRequired, google_clients
+from .docs_sync import docs_share_queue, docs_sync_queue, plan_document_content
 from rest_framework.permissions import BasePermission
 from django.utils import timezone
 from django.db import transaction
@@ -14,7 +15,6 @@ from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
-import pickle
 from google_auth_oauthlib.flow import Flow
 import os
 
@@ -24,107 +24,27 @@ class UserActionPlanQuerysetMixin:
         """
         Returns a queryset of SDGActionPlan objects that the current user can access
         """
-        user = self.request.user
-        team_ids = user.team_memberships.values_list('team__id', flat=True)
-        qs = SDGActionPlan.objects.filter(
-            Q(user=user) | Q(team__id__in=team_ids)).distinct()
-        return qs
+        # every user with any right on a plan has one PlanAccess row for it
+        return SDGActionPlan.objects.filter(access__user=self.request.user)
 
 
 # 权限类定义
 class IsTeamOwnerOrAdmin(BasePermission):
     """检查用户是否是团队所有者或管理员"""
     def has_object_permission(self, request, view, obj):
-        if not request.user.is_authenticated:
-            return False
-        
-        # 表单创建者总是可以管理权限
-        if obj.user == request.user:
-            return True
-        
-        team_member = TeamMember.objects.filter(
-            team=obj.team, 
-            user=request.user, 
-            is_pending=False
-        ).first()
-        
-        return team_member and team_member.role in ['owner', 'admin']
+        return PlanPermissionResolver.for_request(request).can_manage(obj)
 
 
 class CanEditActionPlan(BasePermission):
     """Check if user can edit action plan"""
     def has_object_permission(self, request, view, obj):
-        if not request.user.is_authenticated:
-            return False
-        
-        user = request.user
-        
-        # Creator always has edit permission
-        if obj.user == user:
-            return True
-            
-        # Check if user is explicitly specified as editor (highest priority)
-        if obj.editors.filter(id=user.id).exists():
-            return True
-            
-        # Check team permissions
-        team_member = TeamMember.objects.filter(
-            team=obj.team, 
-            user=user, 
-            is_pending=False
-        ).first()
-        
-        if team_member:
-            # Team owner always has edit permission
-            if team_member.role == 'owner':
-                return True
-                
-            # If team edit is allowed
-            if obj.allow_team_edit:
-                # Team admins can edit
-                if team_member.role == 'admin':
-                    return True
-                # If explicit permissions not required, regular members can edit
-                elif not obj.require_explicit_permissions:
-                    return True
-        
-        return False
+        return PlanPermissionResolver.for_request(request).can_edit(obj)
 
 
 class CanViewActionPlan(BasePermission):
     """Check if user can view action plan"""
     def has_object_permission(self, request, view, obj):
-        if not request.user.is_authenticated:
-            return False
-        
-        user = request.user
-        
-        # Creator always has view permission
-        if obj.user == user:
-            return True
-            
-        # Check if user is explicitly specified as viewer (highest priority)
-        if obj.viewers.filter(id=user.id).exists():
-            return True
-            
-        # Check team permissions
-        team_member = TeamMember.objects.filter(
-            team=obj.team, 
-            user=user, 
-            is_pending=False
-        ).first()
-        
-        if team_member:
-            # Team owner always has view permission
-            if team_member.role == 'owner':
-                return True
-                
-            # If team view is allowed
-            if obj.allow_team_view:
-                # Team members can view
-                return True
-        
-        return False
+        return PlanPermissionResolver.for_request(request).can_view(obj)
 
 
 # 视图类定义
@@ -134,7 +54,7 @@ class SDGActionPlanListView(UserActionPlanQuerysetMixin, generics.ListAPIView):
 
     # returns all plans of teams user is in
     def get_queryset(self):
-        return self.get_user_action_plans()
+        return with_plan_relations(self.get_user_action_plans())
 
 
 class SDGActionPlanCreateView(generics.CreateAPIView):
@@ -148,12 +68,7 @@ class SDGActionPlanCreateView(generics.CreateAPIView):
         if action_plan.impact_project_name:
             try:
                 google_docs_service = GoogleDocsService()
-                content = {
-                    'impact_project_name': action_plan.impact_project_name,
-                    'name_of_designers': action_plan.name_of_designers,
-                    'description': action_plan.description,
-                    'plan_content': action_plan.plan_content
-                }
+                content = plan_document_content(action_plan)
                 
                 document_id = google_docs_service.create_document(
                     action_plan.impact_project_name, content)
@@ -164,9 +79,11 @@ class SDGActionPlanCreateView(generics.CreateAPIView):
                     action_plan.google_doc_created = True
                     action_plan.last_sync_time = timezone.now()
                     action_plan.save()
+                    # the new document only has a title; write the plan into it
+                    docs_sync_queue.schedule_on_commit(action_plan.id, immediate=True)
                     
-                    # Share document with team members
-                    self._share_document_with_team(action_plan, google_docs_service)
+                    # Share document with everyone who can open the plan, in one background batch
+                    docs_share_queue.schedule_on_commit(action_plan.id, immediate=True)
                     
             except Exception as e:
                 print(f"Error creating Google Docs document: {e}")
@@ -178,7 +95,7 @@ class SDGActionPlanRetrieveView(UserActionPlanQuerysetMixin, generics.RetrieveAP
     lookup_field = 'id'
 
     def get_queryset(self):
-        return self.get_user_action_plans()
+        return with_plan_relations(self.get_user_action_plans())
 
 # anyone can update the plan on the team
 
@@ -197,37 +114,24 @@ class SDGActionPlanUpdateView(UserActionPlanQuerysetMixin, generics.UpdateAPIVie
             serializer = self.get_serializer(instance, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             updated_instance = serializer.save()
+            # the save may have changed the team permission flags
+            PlanPermissionResolver.for_request(request).invalidate()
             
-            # Sync with Google Docs if document exists
+            # Sync with Google Docs in the background once the edit is committed
             if updated_instance.google_doc_id and updated_instance.google_doc_created:
-                try:
-                    google_docs_service = GoogleDocsService()
-                    content = {
-                        'impact_project_name': updated_instance.impact_project_name,
-                        'name_of_designers': updated_instance.name_of_designers,
-                        'description': updated_instance.description,
-                        'plan_content': updated_instance.plan_content
-                    }
-                    
-                    success = google_docs_service.update_document(
-                        updated_instance.google_doc_id, content)
-                    
-                    if success:
-                        updated_instance.last_sync_time = timezone.now()
-                        updated_instance.save()
-                        
-                except Exception as e:
-                    print(f"Error updating Google Docs document: {e}")
+                docs_sync_queue.schedule_on_commit(updated_instance.id)
             
             return Response(serializer.data)
         
-class SDGActionPlanDeleteView(UserActionPlanQuerysetMixin, generics.DestroyAPIView):
+class SDGActionPlanDeleteView(generics.DestroyAPIView):
     serializer_class = SDGActionPlanSerializer
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = 'id'
 
     def get_queryset(self):
-        return self.get_user_action_plans()
+        # only the creator and the team's owners and admins may delete; anyone else gets a 404.
+        # One filter() so both conditions apply to the same PlanAccess row
+        return SDGActionPlan.objects.filter(access__user=self.request.user, access__can_manage=True)
 
 
 # 新增权限管理视图
@@ -440,7 +344,11 @@ class SDGActionPlanGoogleDocsView(APIView):
                 
                 # Update the action plan with Google Doc ID
                 action_plan.google_doc_id = doc_id
+                # nothing has been synced into the new document yet
+                action_plan.google_doc_sync_state = None
+                action_plan.google_doc_shared_with = None
                 action_plan.save()
+                docs_share_queue.schedule_on_commit(action_plan.id, immediate=True)
                 
                 return Response({
                     'success': True,
@@ -464,20 +372,6 @@ class SDGActionPlanGoogleDocsView(APIView):
                 'error': 'Unexpected error',
                 'message': str(e)
             }, status=500)
-    
-    def _share_document_with_team(self, action_plan, google_docs_service):
-        """Share Google Docs document with team members"""
-        try:
-            team_members = action_plan.team.members.all()
-            for member in team_members:
-                if member.email:
-                    google_docs_service.share_document(
-                        action_plan.google_doc_id, 
-                        member.email, 
-                        'writer'
-                    )
-        except Exception as e:
-            print(f"Error sharing document with team: {e}")
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -535,9 +429,8 @@ class GoogleOAuthCallbackView(APIView):
             flow.fetch_token(code=code)
             credentials = flow.credentials
             
-            # Save credentials
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(credentials, token)
+            # Save credentials and hand them to the shared client pool
+            google_clients.store(credentials)
             
             return HttpResponse(
                 """
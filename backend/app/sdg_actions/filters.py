@@ -1,7 +1,7 @@
 import django_filters
-from django.db.models import Q
 from .models import (
     ActionDb,
+    ActionFacet,
     LEVEL_CHOICES,
     YNB_CHOICES,
     DIGITAL_CHOICES,
@@ -12,18 +12,18 @@ from .models import (
 class ActionFilter(django_filters.FilterSet):
     SDG_CHOICES = [(str(i), f"SDG {i}") for i in range(1, 18)]
 
-    def filter_sdgs(self, qs, name, value):
-        q = Q()
-        for v in value:
-            # regex to match the correct sdg number in a comma-separated list
-            pattern = rf"(^|,)\s*{v}\s*(,|$)"
-            q |= Q(**{f"{name}__iregex": pattern})
-        return qs.filter(q)
+    def filter_facet(self, qs, name, value):
+        """
+        Matches any selected value of a multi-value column through the indexed ActionFacet table.
+        """
+        if not value:
+            return qs
+        return qs.filter(id__in=ActionFacet.matching(name, value))
 
     sdgs = django_filters.MultipleChoiceFilter(
         field_name='sdgs',
         choices=SDG_CHOICES,
-        method='filter_sdgs',
+        method='filter_facet',
         label="Related SDGs"
     )
 
@@ -60,6 +60,7 @@ class ActionFilter(django_filters.FilterSet):
     related_industry = django_filters.MultipleChoiceFilter(
         field_name='related_industry',
         choices=[(c[0], c[1]) for c in INDU_CHOICES],
+        method='filter_facet',
         label="Industry"
     )
 
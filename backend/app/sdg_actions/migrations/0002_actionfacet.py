@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELD_FACETS = {
+    'sdgs': 'sdg',
+    'related_industry': 'industry',
+    'level': 'level',
+    'digital_actions': 'digital',
+}
+
+
+def split_values(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        value = ','.join(str(item) for item in value)
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def populate_facets(apps, schema_editor):
+    ActionDb = apps.get_model('sdg_actions', 'ActionDb')
+    ActionFacet = apps.get_model('sdg_actions', 'ActionFacet')
+    rows = []
+    for action in ActionDb.objects.only('id', *FIELD_FACETS).iterator(chunk_size=1000):
+        for field, facet in FIELD_FACETS.items():
+            for value in dict.fromkeys(split_values(getattr(action, field))):
+                rows.append(ActionFacet(action_id=action.pk, facet=facet, value=value[:100]))
+        if len(rows) >= 1000:
+            ActionFacet.objects.bulk_create(rows)
+            rows = []
+    ActionFacet.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_actions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('action', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='sdg_actions.actiondb')),
+            ],
+            options={
+                'db_table': 'action_db_facet',
+                'indexes': [models.Index(fields=['facet', 'value', 'action'], name='action_facet_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
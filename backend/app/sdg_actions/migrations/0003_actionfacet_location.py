@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def populate_location_facets(apps, schema_editor):
+    ActionDb = apps.get_model('sdg_actions', 'ActionDb')
+    ActionFacet = apps.get_model('sdg_actions', 'ActionFacet')
+    rows = []
+    for action_id, location in ActionDb.objects.values_list('id', 'location').iterator(chunk_size=1000):
+        if location and location.strip():
+            rows.append(ActionFacet(action_id=action_id, facet='location', value=location.strip()[:100]))
+        if len(rows) >= 1000:
+            ActionFacet.objects.bulk_create(rows)
+            rows = []
+    ActionFacet.objects.bulk_create(rows)
+
+
+def remove_location_facets(apps, schema_editor):
+    ActionFacet = apps.get_model('sdg_actions', 'ActionFacet')
+    ActionFacet.objects.filter(facet='location').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_actions', '0002_actionfacet'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_location_facets, remove_location_facets),
+    ]
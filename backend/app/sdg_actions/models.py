@@ -1,6 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.core.validators import validate_comma_separated_integer_list
 from multiselectfield import MultiSelectField
+from .search_index import action_index
+from catalogue.autocomplete import autocomplete_index, ACTION
+from catalogue.cache import response_cache
+from catalogue.bulk import in_batches
+from catalogue.facets import multiselect_values, sync_facet_rows
 
 SDG_CHOICES = ((1, '1'),
                (2, '2'),
@@ -105,3 +112,113 @@ class ActionDb(models.Model):
 
     def __str__(self):
         return f'({self.actions})'
+
+
+class ActionFacet(models.Model):
+    """
+    One row per (action, facet, value) mirroring the multi-value columns of ActionDb.
+
+    The MultiSelectFields store comma-separated strings that can only be searched with
+    a regex scan; this table lets filters and counts use the (facet, value) index instead.
+    Rows are rewritten whenever an ActionDb row is saved.
+    """
+    SDG = 'sdg'
+    INDUSTRY = 'industry'
+    LEVEL = 'level'
+    DIGITAL = 'digital'
+    LOCATION = 'location'
+
+    # ActionDb field name -> facet key
+    FIELD_FACETS = {
+        'sdgs': SDG,
+        'related_industry': INDUSTRY,
+        'level': LEVEL,
+        'digital_actions': DIGITAL,
+        'location': LOCATION,
+    }
+
+    action = models.ForeignKey(
+        ActionDb, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        db_table = 'action_db_facet'
+        indexes = [
+            models.Index(fields=['facet', 'value', 'action'],
+                         name='action_facet_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.action_id} {self.facet}={self.value}'
+
+    @classmethod
+    def rows_for(cls, action):
+        rows = []
+        for field, facet in cls.FIELD_FACETS.items():
+            value = getattr(action, field)
+            if field == 'location':
+                # free text, not a comma-separated list
+                values = [value.strip()] if value and value.strip() else []
+            else:
+                values = multiselect_values(value)
+            for item in dict.fromkeys(values):
+                rows.append(cls(action_id=action.pk, facet=facet, value=item[:100]))
+        return rows
+
+    @classmethod
+    def sync(cls, action):
+        """Replace the facet rows of one action"""
+        cls.objects.filter(action_id=action.pk).delete()
+        cls.objects.bulk_create(cls.rows_for(action))
+
+    @classmethod
+    def rebuild(cls, ids=None, batch_size=1000):
+        """
+        Bring the rows of the given actions (default: all) in line with ActionDb,
+        e.g. after bulk loads that bypass signals. Runs in one transaction and only
+        writes rows that changed, so filters never see a record without its facets.
+        """
+        records = ActionDb.objects.only('id', *cls.FIELD_FACETS)
+        with transaction.atomic():
+            for batch in in_batches(records, ids, batch_size):
+                sync_facet_rows(cls, 'action', batch)
+
+    @classmethod
+    def matching(cls, field, values):
+        """Subquery of action ids having any of the given values for a field"""
+        return cls.objects.filter(
+            facet=cls.FIELD_FACETS[field], value__in=values).values('action_id')
+
+
+# Keep the in-memory search and autocomplete indexes in step with the table once changes are committed
+@receiver(post_save, sender=ActionDb)
+def index_action(sender, instance, **kwargs):
+    def update():
+        action_index.index_instance(instance)
+        autocomplete_index.index_item(ACTION, instance.pk, instance.actions)
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=ActionDb)
+def unindex_action(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def update():
+        action_index.remove_instance(pk)
+        autocomplete_index.remove_item(ACTION, pk)
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=ActionDb)
+def sync_action_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ActionFacet.sync(instance)
+
+
+# Drop cached catalogue responses: straight away for the writer's own follow-up reads, and
+# again on commit for anything cached by other requests while the transaction was open
+@receiver([post_save, post_delete], sender=ActionDb)
+def expire_action_responses(sender, **kwargs):
+    response_cache.bump(sender)
+    transaction.on_commit(lambda: response_cache.bump(sender))
@@ -0,0 +1,238 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from catalogue.live_index import LiveIndex
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words too common to be useful as required search terms
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'into', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with', 'your',
+})
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase alphanumeric tokens, dropping stopwords"""
+    if not text:
+        return []
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index with BM25 ranking.
+
+    Each document is a mapping of field name -> text. Field weights scale the
+    term frequency contributed by that field, so a match in a title can count
+    for more than a match in a long description. The last query term is
+    treated as a prefix so partially typed words still match.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # Upper bound on how many vocabulary terms a single prefix can expand to
+    MAX_PREFIX_EXPANSION = 64
+    # Shorter trailing tokens are matched exactly; one or two letters expand to most of the vocabulary
+    MIN_PREFIX_LENGTH = 3
+
+    def __init__(self, field_weights: Dict[str, float]):
+        self.field_weights = field_weights
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._postings: Dict[str, Dict[int, float]] = {}
+            self._doc_terms: Dict[int, Dict[str, float]] = {}
+            self._doc_len: Dict[int, float] = {}
+            self._total_len = 0.0
+            self._vocabulary: List[str] = []
+            self._vocabulary_dirty = False
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def replace_with(self, other: 'InvertedIndex'):
+        """Take over the contents of another index, e.g. one loaded off to the side"""
+        with self._lock:
+            self._postings = other._postings
+            self._doc_terms = other._doc_terms
+            self._doc_len = other._doc_len
+            self._total_len = other._total_len
+            self._vocabulary = other._vocabulary
+            self._vocabulary_dirty = other._vocabulary_dirty
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_terms
+
+    def add(self, doc_id: int, fields: Dict[str, Optional[str]]):
+        """Index a document, replacing any previous version with the same id"""
+        terms: Dict[str, float] = {}
+        for field, weight in self.field_weights.items():
+            for token in tokenize(fields.get(field)):
+                terms[token] = terms.get(token, 0.0) + weight
+
+        with self._lock:
+            self._remove(doc_id)
+            if not terms:
+                return
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._vocabulary_dirty = True
+                postings[doc_id] = tf
+            length = sum(terms.values())
+            self._doc_terms[doc_id] = terms
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        matches = []
+        for term in vocabulary[start:start + self.MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def _idf(self, postings) -> float:
+        n_docs = len(self._doc_terms)
+        df = len(postings)
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 10, prefix: bool = True) -> List[Tuple[int, float]]:
+        """
+        Return up to `limit` (doc_id, score) pairs, best first.
+
+        Every query term must match. When `prefix` is true and the query does
+        not end in whitespace, the last term also matches longer words that
+        start with it.
+        """
+        raw_tokens = TOKEN_RE.findall((query or '').lower())
+        if not raw_tokens:
+            return []
+        last_is_prefix = (prefix and not query[-1].isspace()
+                          and len(raw_tokens[-1]) >= self.MIN_PREFIX_LENGTH)
+        tokens = [t for t in raw_tokens[:-1] if t not in STOPWORDS]
+        last = raw_tokens[-1]
+        if last_is_prefix or last not in STOPWORDS:
+            tokens.append(last)
+        if not tokens:
+            return []
+
+        with self._lock:
+            # one group of (postings, idf) per query token; a prefix token expands to several terms
+            groups = []
+            for i, token in enumerate(tokens):
+                is_prefix = last_is_prefix and i == len(tokens) - 1
+                terms = self._expand_prefix(token) if is_prefix else [token]
+                group = [(self._postings[t], self._idf(self._postings[t]))
+                         for t in terms if t in self._postings]
+                if not group:
+                    return []
+                groups.append(group)
+
+            # intersect starting from the most selective token so we only score real candidates
+            groups.sort(key=lambda g: sum(len(postings) for postings, _ in g))
+            candidates = set()
+            for postings, _ in groups[0]:
+                candidates.update(postings)
+            for group in groups[1:]:
+                candidates = {doc_id for doc_id in candidates
+                              if any(doc_id in postings for postings, _ in group)}
+                if not candidates:
+                    return []
+
+            avg_len = self._total_len / len(self._doc_terms)
+            scored = []
+            for doc_id in candidates:
+                norm = self.K1 * (1 - self.B + self.B * self._doc_len[doc_id] / avg_len)
+                score = 0.0
+                for group in groups:
+                    # a prefix counts once, through its best matching term
+                    best = 0.0
+                    for postings, idf in group:
+                        tf = postings.get(doc_id)
+                        if tf is not None:
+                            best = max(best, idf * tf * (self.K1 + 1) / (tf + norm))
+                    score += best
+                scored.append((doc_id, score))
+
+        # ties are broken by id so results are stable between requests
+        return heapq.nlargest(limit, scored, key=lambda item: (item[1], -item[0]))
+
+
+class ActionSearchIndex(LiveIndex, InvertedIndex):
+    """
+    Inverted index over ActionDb, built lazily from the database on first use.
+
+    Saves in this process update it in place. Changes made by other processes,
+    seen through the ActionDb version in the shared catalogue cache, have it
+    reloaded in the background (see catalogue/live_index.py).
+    """
+
+    FIELD_WEIGHTS = {
+        'actions': 3.0,
+        'action_detail': 1.0,
+        'award_description': 1.0,
+        'sources': 0.5,
+    }
+
+    def __init__(self):
+        super().__init__(self.FIELD_WEIGHTS)
+
+    @staticmethod
+    def models():
+        from .models import ActionDb
+
+        return [ActionDb]
+
+    def new_index(self):
+        return InvertedIndex(self.FIELD_WEIGHTS)
+
+    def load(self, index):
+        from .models import ActionDb
+
+        rows = ActionDb.objects.values_list('id', *self.FIELD_WEIGHTS).iterator(chunk_size=2000)
+        for doc_id, *values in rows:
+            index.add(doc_id, dict(zip(self.FIELD_WEIGHTS, values)))
+
+    def index_instance(self, instance):
+        self.apply_change('add', instance.pk, {field: getattr(instance, field) for field in self.FIELD_WEIGHTS})
+
+    def remove_instance(self, pk):
+        self.apply_change('remove', pk)
+
+    def search(self, query, limit=10, prefix=True):
+        self.ensure_built()
+        return super().search(query, limit=limit, prefix=prefix)
+
+
+# Process-wide index used by the search view; each process keeps its own copy
+action_index = ActionSearchIndex()
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from catalogue.fields import SparseFieldsSerializerMixin
 from .models import ActionDb
 
 
-class ActionSerializer(serializers.ModelSerializer):
+class ActionSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ActionDb
         fields = '__all__'
@@ -1,5 +1,14 @@
+import os
+import tempfile
+from unittest import mock
 
-from .models import ActionDb
+from .models import ActionDb, ActionFacet
+from .search_index import action_index
+from .views import ACTION_SUMMARY_FIELDS
+from catalogue.cache import response_cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -10,6 +19,7 @@ MultiSelectField.flatchoices = property(lambda self: self.choices)
 
 class SdgActionSearchAPITestCase(APITestCase):
     def setUp(self):
+        response_cache.clear()
         ActionDb.objects.create(
             id=1,
             actions="Get rid of paper bank statements",
@@ -180,6 +190,91 @@ class SdgActionSearchAPITestCase(APITestCase):
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['sdgs'], 15)
 
+    def test_filter_by_multiple_sdgs(self):
+        resp = self.client.get(
+            self.list_url, {'sdgs': ['13', '15']}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(item['id'] for item in resp.data), [1, 2, 8])
+
+    def test_sdg_filter_follows_updates(self):
+        action = ActionDb.objects.get(id=3)
+        action.sdgs = ["10", "16"]
+        action.save()
+        self.assertEqual(
+            set(ActionFacet.objects.filter(action=action, facet=ActionFacet.SDG).values_list('value', flat=True)),
+            {"10", "16"})
+
+        resp = self.client.get(self.list_url, {'sdgs': ['16']}, format='json')
+        self.assertEqual([item['id'] for item in resp.data], [3])
+
+    def test_filter_by_industry(self):
+        action = ActionDb.objects.get(id=6)
+        action.related_industry = ["Construction", "Mining"]
+        action.save()
+
+        resp = self.client.get(
+            self.list_url, {'related_industry': ['Mining']}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in resp.data], [6])
+
+    def test_cursor_pagination_walks_all_pages(self):
+        seen = []
+        url, params = self.list_url, {'pagination': 'cursor', 'per_page': 3}
+        while url:
+            # keyset pages run a single query and no COUNT(*)
+            with self.assertNumQueries(1):
+                resp = self.client.get(url, params, format='json')
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', resp.data)
+            seen.extend(item['id'] for item in resp.data['results'])
+            url, params = resp.data['next'], None
+        self.assertEqual(seen, list(range(1, 9)))
+
+    def test_cursor_pagination_with_filters_and_count(self):
+        resp = self.client.get(
+            self.list_url,
+            {'pagination': 'cursor', 'per_page': 5, 'level': '1', 'with_count': 'true'},
+            format='json')
+        self.assertEqual(resp.data['count'], 7)
+        self.assertEqual([item['id'] for item in resp.data['results']], [1, 2, 3, 4, 5])
+
+        resp = self.client.get(resp.data['next'], format='json')
+        self.assertEqual([item['id'] for item in resp.data['results']], [7, 8])
+        self.assertIsNone(resp.data['next'])
+
+    def test_facet_counts(self):
+        # the unfiltered facets together, the level facet without its filter, and the page
+        with self.assertNumQueries(3):
+            resp = self.client.get(
+                self.list_url, {'level': '1', 'facets': 'true'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.data['results']), 7)
+        facets = resp.data['facets']
+        # the filtered facet still counts the values it would add
+        self.assertEqual(facets['level'], {'1': 7, '2': 1})
+        self.assertEqual(facets['sdg']['13'], 2)
+        self.assertEqual(facets['sdg']['18'], 2)
+        # id 6 has SDG 11 but is level 2
+        self.assertEqual(facets['sdg']['11'], 1)
+        self.assertEqual(facets['digital'], {'1': 7})
+
+    def test_facet_counts_leave_out_their_own_filter(self):
+        resp = self.client.get(
+            self.list_url, {'sdgs': ['11'], 'level': '1', 'facets': 'true'}, format='json')
+        facets = resp.data['facets']
+        # SDGs are counted over level 1 without the SDG filter, levels over SDG 11 without the level filter
+        self.assertEqual(facets['sdg']['13'], 2)
+        self.assertEqual(facets['sdg']['11'], 1)
+        self.assertEqual(facets['level'], {'1': 1, '2': 1})
+
+    def test_facet_counts_with_pagination(self):
+        resp = self.client.get(
+            self.list_url, {'page': 1, 'per_page': 3, 'facets': 'true'}, format='json')
+        self.assertEqual(resp.data['count'], 8)
+        self.assertEqual(len(resp.data['results']), 3)
+        self.assertEqual(resp.data['facets']['location'], {'Australia': 1})
+        self.assertEqual(resp.data['facets']['level'], {'1': 7, '2': 1})
+
     def test_filter_by_level(self):
         resp = self.client.get(
             self.list_url, {'level': '1'}, format='json')
@@ -208,3 +303,172 @@ class SdgActionSearchAPITestCase(APITestCase):
         ids1 = {i['id'] for i in page1['results']}
         ids2 = {i['id'] for i in page2['results']}
         self.assertTrue(ids1.isdisjoint(ids2))
+
+    def test_list_returns_summary_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.list_url, format='json')
+        self.assertEqual(set(resp.data[0]), set(ACTION_SUMMARY_FIELDS))
+        # the large text columns are not read at all
+        self.assertNotIn('Action detail', queries[0]['sql'])
+
+    def test_fields_and_omit(self):
+        resp = self.client.get(self.list_url, {'fields': 'actions,action_detail'}, format='json')
+        self.assertEqual(set(resp.data[0]), {'actions', 'action_detail'})
+
+        resp = self.client.get(self.list_url, {'fields': '__all__', 'omit': 'sources,links'}, format='json')
+        self.assertIn('additional_notes', resp.data[0])
+        self.assertNotIn('sources', resp.data[0])
+        self.assertNotIn('links', resp.data[0])
+
+    def test_unknown_field_is_rejected(self):
+        resp = self.client.get(self.list_url, {'fields': 'actions,secret'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_returns_full_record(self):
+        resp = self.client.get(reverse('action-retrieve'), {'q': 1}, format='json')
+        self.assertIn('action_detail', resp.data)
+        self.assertIn('additional_notes', resp.data)
+
+    def test_bulk_retrieve(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('action-retrieve'), {'ids': '3,1,404,3'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in resp.data['results']], [3, 1])
+        self.assertEqual(resp.data['missing'], [404])
+        self.assertIn('action_detail', resp.data['results'][0])
+
+        resp = self.client.get(reverse('action-retrieve'), {'ids': '1,two'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get(reverse('action-retrieve'), {'ids': ','.join(map(str, range(201)))})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_repeated_request_served_from_cache(self):
+        first = self.client.get(self.list_url, {'level': '1', 'facets': 'true'})
+        # parameter order does not matter
+        with self.assertNumQueries(0):
+            second = self.client.get(self.list_url, {'facets': 'true', 'level': '1'})
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Vary'], first['Vary'])
+
+    def test_save_expires_cached_responses(self):
+        self.client.get(self.list_url, {'level': '2'})
+        action = ActionDb.objects.get(id=1)
+        action.level = 2
+        action.save()
+        resp = self.client.get(self.list_url, {'level': '2'})
+        self.assertIn(1, [item['id'] for item in resp.json()])
+
+        ActionDb.objects.get(id=1).delete()
+        resp = self.client.get(self.list_url, {'level': '2'})
+        self.assertNotIn(1, [item['id'] for item in resp.json()])
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(self.list_url)['ETag']
+        resp = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(resp.content, b'')
+
+        resp = self.client.get(self.list_url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            file_cache = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'catalogue': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': cache_dir},
+            }
+            with override_settings(CACHES=file_cache):
+                first = self.client.get(reverse('action-retrieve'), {'q': 1})
+                with self.assertNumQueries(0):
+                    second = self.client.get(reverse('action-retrieve'), {'q': 1})
+                self.assertEqual(second.content, first.content)
+                self.assertTrue(os.listdir(cache_dir))
+
+
+class ActionSearchIndexTestCase(APITestCase):
+    def setUp(self):
+        response_cache.clear()
+        action_index.invalidate()
+        ActionDb.objects.create(
+            id=1,
+            actions="Plant native trees",
+            action_detail="Planting trees restores habitats and captures carbon.",
+            sdgs=["13", "15"],
+        )
+        ActionDb.objects.create(
+            id=2,
+            actions="Share climate posts",
+            action_detail="Share posts about climate change so people in your network see them. Trees are mentioned once.",
+            sdgs=["13"],
+        )
+        ActionDb.objects.create(
+            id=3,
+            actions="Report online bullies",
+            action_detail="Flag harassment in chat rooms.",
+            sources="The Lazy Person's Guide to Saving the World",
+            sdgs=["10"],
+        )
+        self.search_url = reverse('action-search')
+
+    def test_title_match_ranks_first(self):
+        resp = self.client.get(self.search_url, {'q': 'trees'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in resp.data], [1, 2])
+
+    def test_prefix_matches_partial_last_word(self):
+        resp = self.client.get(self.search_url, {'q': 'clim'})
+        self.assertEqual([row['id'] for row in resp.data], [2])
+
+        # a trailing space means the word is complete
+        resp = self.client.get(self.search_url, {'q': 'clim '})
+        self.assertEqual(resp.data, [])
+
+    def test_all_terms_must_match(self):
+        resp = self.client.get(self.search_url, {'q': 'trees climate'})
+        self.assertEqual([row['id'] for row in resp.data], [2])
+
+    def test_searches_sources(self):
+        resp = self.client.get(self.search_url, {'q': 'lazy guide'})
+        self.assertEqual([row['id'] for row in resp.data], [3])
+
+    def test_empty_query_returns_first_rows(self):
+        resp = self.client.get(self.search_url)
+        self.assertEqual(len(resp.data), 3)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.client.get(self.search_url, {'q': 'trees'})
+        self.assertTrue(action_index.is_built)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ActionDb.objects.create(id=4, actions="Compost kitchen scraps", sdgs=["12"])
+        resp = self.client.get(self.search_url, {'q': 'compost'})
+        self.assertEqual([row['id'] for row in resp.data], [4])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ActionDb.objects.get(id=1).delete()
+        resp = self.client.get(self.search_url, {'q': 'trees'})
+        self.assertEqual([row['id'] for row in resp.data], [2])
+
+    def test_index_rebuilds_when_another_process_changes_actions(self):
+        self.client.get(self.search_url, {'q': 'trees'})
+        # another worker edits an action: this process gets no signal, only the bumped version
+        ActionDb.objects.filter(id=3).update(actions="Plant a tree for every post")
+        response_cache.cache.set(response_cache._version_key(ActionDb), 'another-process')
+
+        with mock.patch.object(action_index.versions, 'check_interval', 0), \
+                mock.patch.object(action_index, 'background', False):
+            resp = self.client.get(self.search_url, {'q': 'every'})
+        self.assertEqual([row['id'] for row in resp.data], [3])
+
+    def test_own_saves_do_not_reload_the_index(self):
+        self.client.get(self.search_url, {'q': 'trees'})
+        with mock.patch.object(action_index.versions, 'check_interval', 0), \
+                mock.patch.object(action_index, 'load', wraps=action_index.load) as load:
+            with self.captureOnCommitCallbacks(execute=True):
+                ActionDb.objects.create(id=4, actions="Compost kitchen scraps", sdgs=["12"])
+            resp = self.client.get(self.search_url, {'q': 'compost'})
+        self.assertEqual([row['id'] for row in resp.data], [4])
+        load.assert_not_called()
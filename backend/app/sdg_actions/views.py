@@ -2,45 +2,85 @@ from rest_framework import generics, permissions
 from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from .models import ActionDb
+from .models import ActionDb, ActionFacet
+from .search_index import action_index
 from .serializers import ActionSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import ActionFilter
-from rest_framework.pagination import PageNumberPagination
+from catalogue.pagination import FilterSearchPagination
+from catalogue.facets import FacetCountsMixin
+from catalogue.bulk import BulkRetrieveMixin
+from catalogue.cache import CachedResponseMixin
+from catalogue.fields import SparseFieldsetMixin
+from catalogue.async_views import AsyncListMixin
+from asgiref.sync import sync_to_async
+
+# Compact representation returned by the list endpoints unless `fields` asks for more
+ACTION_SUMMARY_FIELDS = ('id', 'actions', 'sdgs', 'level', 'individual_organization',
+                         'digital_actions', 'award', 'related_industry', 'location')
 
 # API view to search for actions in general, returns 10
 
 
-class ActionSearchView(generics.ListAPIView):
+class ActionSearchView(CachedResponseMixin, SparseFieldsetMixin, AsyncListMixin, generics.ListAPIView):
     """
-    GET /api/sdg-actions/search/?q=<search_term>
+    GET /api/sdg-actions/search/?q=<search_term>[&fields=<a,b>|&omit=<a,b>]
 
-    Returns list of first 10 Action records where the `actions` field contains the search term (case-insensitive)
+    Returns the 10 most relevant Action records for the search term, ranked with BM25 over the
+    title, detail, award description and sources. The last word is matched as a prefix so the
+    endpoint can back a type-ahead box. Ranking happens in the in-memory index; the database is
+    only hit to load the returned rows by primary key. Results use the compact summary fields
+    unless `fields`/`omit` say otherwise.
     """
     serializer_class = ActionSerializer
+    cache_models = [ActionDb]
     permission_classes = [permissions.AllowAny]
     pagination_class = None  # Response becomes a list
+    summary_fields = ACTION_SUMMARY_FIELDS
+    max_results = 10
 
     def get_queryset(self):
+        queryset = self.only_selected_fields(ActionDb.objects.all())
         query = self.request.query_params.get('q', '')
-        queryset = ActionDb.objects.all()
-        if query:
-            queryset = queryset.filter(actions__icontains=query)
-        # Return first 10 results
-        return queryset[:10]
+        if not query.strip():
+            return queryset[:self.max_results]
+        return self.in_rank_order(queryset.in_bulk(self.ranked_ids(query)))
+
+    async def aget_queryset(self):
+        queryset = self.only_selected_fields(ActionDb.objects.all())
+        query = self.request.query_params.get('q', '')
+        if not query.strip():
+            return queryset[:self.max_results]
+        # loads the index from the database on first use, and every few seconds reads the
+        # ActionDb version from the shared cache to reload it in the background after other processes' saves
+        await sync_to_async(action_index.ensure_built)()
+        return self.in_rank_order(await queryset.ain_bulk(self.ranked_ids(query)))
+
+    def ranked_ids(self, query):
+        self._ranked_ids = [doc_id for doc_id, _ in action_index.search(query, limit=self.max_results)]
+        return self._ranked_ids
+
+    def in_rank_order(self, actions):
+        # keep the ranking order, skipping anything deleted since it was indexed
+        return [actions[doc_id] for doc_id in self._ranked_ids if doc_id in actions]
 
 # API view to search for a specific action by ID
 
 
-class ActionRetrieveView(generics.RetrieveAPIView):
+class ActionRetrieveView(CachedResponseMixin, SparseFieldsetMixin, BulkRetrieveMixin, generics.RetrieveAPIView):
     """
-    GET /api/sdg-actions/retrieve/?q=<action_id>
+    GET /api/sdg-actions/retrieve/?q=<action_id>[&fields=<a,b>|&omit=<a,b>]
+    GET /api/sdg-actions/retrieve/?ids=<id,id,...>[&fields=<a,b>|&omit=<a,b>]
 
-    Returns the action record with the given ID.
+    Returns the action record with the given ID, with every field by default. With `ids`,
+    returns up to 200 records in the requested order as `results`, plus the `missing` ids.
     """
     serializer_class = ActionSerializer
+    cache_models = [ActionDb]
     permission_classes = [permissions.AllowAny]
-    queryset = ActionDb.objects.all()
+
+    def get_queryset(self):
+        return self.only_selected_fields(ActionDb.objects.all())
 
     def get_object(self):
         action_id = self.request.query_params.get('q')
@@ -49,18 +89,32 @@ class ActionRetrieveView(generics.RetrieveAPIView):
         return get_object_or_404(self.get_queryset(), id=action_id)
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size_query_param = 'per_page'
-
 # API view to search for actions with filters
 
 
-class ActionFilterSearchView(generics.ListAPIView):
+class ActionFilterSearchView(CachedResponseMixin, SparseFieldsetMixin, FacetCountsMixin, AsyncListMixin,
+                             generics.ListAPIView):
+    """
+    GET /api/sdg-actions/filter-search/?<filters>[&page=<n>&per_page=<n>][&facets=true]
+    GET ...filter-search/?<filters>&pagination=cursor[&per_page=<n>][&with_count=true]
+
+    Returns the records matching the filters. Pagination is page-number based by default;
+    `pagination=cursor` switches to keyset pages ordered by id, followed through the
+    `next`/`previous` links. With `facets=true` the response also carries
+    per-facet value counts for the matching records. Records use the compact summary
+    fields unless `fields=<a,b>` (or `fields=__all__`) / `omit=<a,b>` say otherwise.
+    """
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
-    queryset = ActionDb.objects.all()
     serializer_class = ActionSerializer
+    cache_models = [ActionDb]
+    summary_fields = ACTION_SUMMARY_FIELDS
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = ActionFilter
-    pagination_class = StandardResultsSetPagination
+    pagination_class = FilterSearchPagination
+    facet_model = ActionFacet
+    facet_record_field = 'action'
+
+    def get_queryset(self):
+        return self.only_selected_fields(ActionDb.objects.all())
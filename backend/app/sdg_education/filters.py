@@ -3,6 +3,7 @@ import django_filters
 from django.db.models import Q
 from .models import (
     EducationDb,
+    EducationFacet,
     SDG_CHOICES,
     TYPE_CHOICES,
     DISP_CHOICES,
@@ -70,13 +71,12 @@ class EducationFilter(django_filters.FilterSet):
 
     def filter_comma_list(self, qs, name, values):
         """
-        Matches any selected value in a comma-separated MultiSelectField.
+        Matches any selected value in a comma-separated MultiSelectField, using the
+        indexed EducationFacet table rather than a regex over the column.
         """
-        q = Q()
-        for v in values:
-            pattern = rf"(^|,)\s*{v}\s*(,|$)"
-            q |= Q(**{f"{name}__iregex": pattern})
-        return qs.filter(q)
+        if not values:
+            return qs
+        return qs.filter(id__in=EducationFacet.matching(name, values))
 
     class Meta:
         model = EducationDb
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELD_FACETS = {
+    'sdgs_related': 'sdg',
+    'related_to_which_discipline': 'discipline',
+    'useful_for_which_industries': 'industry',
+    'type_label': 'type_label',
+    'location': 'location',
+}
+
+
+def split_values(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        value = ','.join(str(item) for item in value)
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def populate_facets(apps, schema_editor):
+    EducationDb = apps.get_model('sdg_education', 'EducationDb')
+    EducationFacet = apps.get_model('sdg_education', 'EducationFacet')
+    rows = []
+    for education in EducationDb.objects.only('id', *FIELD_FACETS).iterator(chunk_size=1000):
+        for field, facet in FIELD_FACETS.items():
+            value = getattr(education, field)
+            if field == 'location':
+                values = [value.strip()] if value and value.strip() else []
+            else:
+                values = split_values(value)
+            for item in dict.fromkeys(values):
+                rows.append(EducationFacet(education_id=education.pk, facet=facet, value=item[:100]))
+        if len(rows) >= 1000:
+            EducationFacet.objects.bulk_create(rows)
+            rows = []
+    EducationFacet.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_education', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EducationFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('education', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='sdg_education.educationdb')),
+            ],
+            options={
+                'db_table': 'education_db_facet',
+                'indexes': [models.Index(fields=['facet', 'value', 'education'], name='education_facet_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.core.validators import validate_comma_separated_integer_list
 from multiselectfield import MultiSelectField
+from catalogue.autocomplete import autocomplete_index, EDUCATION
+from catalogue.cache import response_cache
+from catalogue.bulk import in_batches
+from catalogue.facets import multiselect_values, sync_facet_rows
 
 SDG_CHOICES = ((1, '1'),
                (2, '2'),
@@ -166,3 +172,106 @@ class EducationDb(models.Model):
         db_table = 'education_db'
         verbose_name_plural = "Education Database"
         verbose_name = "Education item"
+
+
+class EducationFacet(models.Model):
+    """
+    One row per (education, facet, value) mirroring the multi-value columns of EducationDb.
+
+    Lets filters and counts use the (facet, value) index instead of a regex over the
+    comma-separated MultiSelectField columns. Rows are rewritten whenever an
+    EducationDb row is saved.
+    """
+    SDG = 'sdg'
+    DISCIPLINE = 'discipline'
+    INDUSTRY = 'industry'
+    TYPE_LABEL = 'type_label'
+    LOCATION = 'location'
+
+    # EducationDb field name -> facet key
+    FIELD_FACETS = {
+        'sdgs_related': SDG,
+        'related_to_which_discipline': DISCIPLINE,
+        'useful_for_which_industries': INDUSTRY,
+        'type_label': TYPE_LABEL,
+        'location': LOCATION,
+    }
+
+    education = models.ForeignKey(
+        EducationDb, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        db_table = 'education_db_facet'
+        indexes = [
+            models.Index(fields=['facet', 'value', 'education'],
+                         name='education_facet_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.education_id} {self.facet}={self.value}'
+
+    @classmethod
+    def rows_for(cls, education):
+        rows = []
+        for field, facet in cls.FIELD_FACETS.items():
+            value = getattr(education, field)
+            if field == 'location':
+                # a single choice, not a comma-separated list
+                values = [value.strip()] if value and value.strip() else []
+            else:
+                values = multiselect_values(value)
+            for item in dict.fromkeys(values):
+                rows.append(cls(education_id=education.pk, facet=facet, value=item[:100]))
+        return rows
+
+    @classmethod
+    def sync(cls, education):
+        """Replace the facet rows of one education record"""
+        cls.objects.filter(education_id=education.pk).delete()
+        cls.objects.bulk_create(cls.rows_for(education))
+
+    @classmethod
+    def rebuild(cls, ids=None, batch_size=1000):
+        """
+        Bring the rows of the given education records (default: all) in line with EducationDb,
+        e.g. after bulk loads that bypass signals. Runs in one transaction and only
+        writes rows that changed, so filters never see a record without its facets.
+        """
+        records = EducationDb.objects.only('id', *cls.FIELD_FACETS)
+        with transaction.atomic():
+            for batch in in_batches(records, ids, batch_size):
+                sync_facet_rows(cls, 'education', batch)
+
+    @classmethod
+    def matching(cls, field, values):
+        """Subquery of education ids having any of the given values for a field"""
+        return cls.objects.filter(
+            facet=cls.FIELD_FACETS[field], value__in=values).values('education_id')
+
+
+@receiver(post_save, sender=EducationDb)
+def sync_education_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EducationFacet.sync(instance)
+
+
+# Keep the autocomplete index in step with the table once changes are committed
+@receiver(post_save, sender=EducationDb)
+def index_education(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete_index.index_item(EDUCATION, instance.pk, instance.title))
+
+
+@receiver(post_delete, sender=EducationDb)
+def unindex_education(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_item(EDUCATION, pk))
+
+
+# Drop cached catalogue responses: straight away for the writer's own follow-up reads, and
+# again on commit for anything cached by other requests while the transaction was open
+@receiver([post_save, post_delete], sender=EducationDb)
+def expire_education_responses(sender, **kwargs):
+    response_cache.bump(sender)
+    transaction.on_commit(lambda: response_cache.bump(sender))
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from catalogue.fields import SparseFieldsSerializerMixin
 from .models import EducationDb
 
 
-class EducationSerializer(serializers.ModelSerializer):
+class EducationSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = EducationDb
         fields = '__all__'
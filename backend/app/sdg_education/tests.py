@@ -1,4 +1,6 @@
-from .models import EducationDb
+from .models import EducationDb, EducationFacet
+from .views import EDUCATION_SUMMARY_FIELDS
+from catalogue.cache import response_cache
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.urls import reverse
@@ -8,6 +10,7 @@ MultiSelectField.flatchoices = property(lambda self: self.choices)
 
 class EducationSearchAPITestCase(APITestCase):
     def setUp(self):
+        response_cache.clear()
         EducationDb.objects.create(
             id=1,
             title="Sir Rupert Myers Sustainability Award",
@@ -122,6 +125,50 @@ class EducationSearchAPITestCase(APITestCase):
         ])
         self.assertEqual(titles, expected)
 
+    def test_filter_by_discipline_and_industry(self):
+        resp = self.client.get(
+            self.list_url,
+            {'discipline': ['Environmental and Related Studies'],
+             'industries': ['Professional services']},
+            format='json'
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in resp.data], [3])
+
+    def test_facet_rows_follow_updates(self):
+        education = EducationDb.objects.get(id=1)
+        education.sdgs_related = ["4"]
+        education.save()
+        self.assertEqual(
+            list(EducationFacet.objects.filter(education=education, facet=EducationFacet.SDG)
+                 .values_list('value', flat=True)),
+            ["4"])
+
+        resp = self.client.get(self.list_url, {'sdgs': ['12']}, format='json')
+        self.assertNotIn(1, [item['id'] for item in resp.data])
+
+    def test_cursor_pagination(self):
+        resp = self.client.get(
+            self.list_url, {'pagination': 'cursor', 'per_page': 3}, format='json')
+        self.assertEqual([item['id'] for item in resp.data['results']], [1, 2, 3])
+        self.assertIsNone(resp.data['previous'])
+
+        resp = self.client.get(resp.data['next'], format='json')
+        self.assertEqual([item['id'] for item in resp.data['results']], [4])
+        self.assertIsNone(resp.data['next'])
+
+    def test_facet_counts(self):
+        resp = self.client.get(
+            self.list_url, {'sdgs': ['12'], 'facets': 'true'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(resp.data['results']), 3)
+        facets = resp.data['facets']
+        self.assertEqual(facets['sdg']['12'], 3)
+        self.assertEqual(facets['sdg']['4'], 1)
+        self.assertEqual(facets['location'], {'Australia': 2, 'United States': 1})
+        self.assertEqual(facets['type_label'], {'Event': 1, 'Initiative': 1, 'Undergraduate course': 1})
+        self.assertEqual(facets['discipline']['Environmental and Related Studies'], 2)
+
     def test_filter_by_location(self):
         resp = self.client.get(
             self.list_url,
@@ -156,3 +203,38 @@ class EducationSearchAPITestCase(APITestCase):
         ids1 = {item['id'] for item in page_data['results']}
         ids2 = {item['id'] for item in page2['results']}
         self.assertTrue(ids1.isdisjoint(ids2))
+
+    def test_list_returns_summary_fields(self):
+        resp = self.client.get(self.list_url, format='json')
+        self.assertEqual(set(resp.data[0]), set(EDUCATION_SUMMARY_FIELDS))
+
+        resp = self.client.get(reverse('education-search'), {'q': 'honey'}, format='json')
+        self.assertEqual(set(resp.data[0]), set(EDUCATION_SUMMARY_FIELDS))
+
+    def test_fields_and_omit(self):
+        resp = self.client.get(self.list_url, {'fields': 'id,aims'}, format='json')
+        self.assertEqual(resp.data[1], {'id': 2, 'aims': EducationDb.objects.get(id=2).aims})
+
+        resp = self.client.get(self.list_url, {'omit': 'year'}, format='json')
+        self.assertNotIn('year', resp.data[0])
+        self.assertIn('title', resp.data[0])
+
+        resp = self.client.get(self.list_url, {'omit': 'nope'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_retrieve(self):
+        resp = self.client.get(reverse('education-retrieve'), {'ids': '4,2,9', 'fields': 'id,title'})
+        self.assertEqual(resp.data['results'], [
+            {'id': 4, 'title': "Honey Bee Initiative"},
+            {'id': 2, 'title': "World’s top universities unite to tackle climate change"},
+        ])
+        self.assertEqual(resp.data['missing'], [9])
+
+    def test_cached_search_follows_edits(self):
+        search_url = reverse('education-search')
+        resp = self.client.get(search_url, {'q': 'honey'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(search_url, {'q': 'honey'}).content, resp.content)
+
+        EducationDb.objects.filter(id=4).first().delete()
+        self.assertEqual(self.client.get(search_url, {'q': 'honey'}).json(), [])
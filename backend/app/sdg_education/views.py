@@ -2,41 +2,58 @@
 from rest_framework import generics, permissions
 from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import NotFound
-from .models import EducationDb
+from .models import EducationDb, EducationFacet
 from .serializers import EducationSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import EducationFilter
-from rest_framework.pagination import PageNumberPagination
+from catalogue.pagination import FilterSearchPagination
+from catalogue.facets import FacetCountsMixin
+from catalogue.bulk import BulkRetrieveMixin
+from catalogue.cache import CachedResponseMixin
+from catalogue.fields import SparseFieldsetMixin
+from catalogue.async_views import AsyncListMixin
 
+# Compact representation returned by the list endpoints unless `fields` asks for more
+EDUCATION_SUMMARY_FIELDS = ('id', 'title', 'sdgs_related', 'type_label', 'organization',
+                            'location', 'year')
 
-class EducationSearchView(generics.ListAPIView):
+
+class EducationSearchView(CachedResponseMixin, SparseFieldsetMixin, AsyncListMixin, generics.ListAPIView):
     """
-    GET /api/education/search/?q=<search_term>
+    GET /api/education/search/?q=<search_term>[&fields=<a,b>|&omit=<a,b>]
 
-    Returns first 10 Education records where the `title` field contains the search term (case-insensitive)
+    Returns first 10 Education records where the `title` field contains the search term (case-insensitive),
+    using the compact summary fields unless `fields`/`omit` say otherwise.
     """
     serializer_class = EducationSerializer
+    cache_models = [EducationDb]
     permission_classes = [permissions.AllowAny]
     pagination_class = None  # Response becomes a list
+    summary_fields = EDUCATION_SUMMARY_FIELDS
 
     def get_queryset(self):
         query = self.request.query_params.get('q', '')
-        queryset = EducationDb.objects.all()
+        queryset = self.only_selected_fields(EducationDb.objects.all())
         if query:
             queryset = queryset.filter(title__icontains=query)
         # first 10 results
         return queryset[:10]
 
 
-class EducationRetrieveView(generics.RetrieveAPIView):
+class EducationRetrieveView(CachedResponseMixin, SparseFieldsetMixin, BulkRetrieveMixin, generics.RetrieveAPIView):
     """
-    GET /api/education/retrieve/?q=<education_id>
+    GET /api/education/retrieve/?q=<education_id>[&fields=<a,b>|&omit=<a,b>]
+    GET /api/education/retrieve/?ids=<id,id,...>[&fields=<a,b>|&omit=<a,b>]
 
-    Returns the education record with the given ID.
+    Returns the education record with the given ID, with every field by default. With `ids`,
+    returns up to 200 records in the requested order as `results`, plus the `missing` ids.
     """
     serializer_class = EducationSerializer
+    cache_models = [EducationDb]
     permission_classes = [permissions.AllowAny]
-    queryset = EducationDb.objects.all()
+
+    def get_queryset(self):
+        return self.only_selected_fields(EducationDb.objects.all())
 
     def get_object(self):
         education_id = self.request.query_params.get('q')
@@ -45,16 +62,30 @@ class EducationRetrieveView(generics.RetrieveAPIView):
         return get_object_or_404(self.get_queryset(), id=education_id)
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size_query_param = 'per_page'
 
+class EducationFilterSearchView(CachedResponseMixin, SparseFieldsetMixin, FacetCountsMixin, AsyncListMixin,
+                                generics.ListAPIView):
+    """
+    GET /api/sdg-education/filter-search/?<filters>[&page=<n>&per_page=<n>][&facets=true]
+    GET ...filter-search/?<filters>&pagination=cursor[&per_page=<n>][&with_count=true]
 
-class EducationFilterSearchView(generics.ListAPIView):
+    Returns the records matching the filters. Pagination is page-number based by default;
+    `pagination=cursor` switches to keyset pages ordered by id, followed through the
+    `next`/`previous` links. With `facets=true` the response also carries
+    per-facet value counts for the matching records. Records use the compact summary
+    fields unless `fields=<a,b>` (or `fields=__all__`) / `omit=<a,b>` say otherwise.
+    """
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
-    queryset = EducationDb.objects.all()
     serializer_class = EducationSerializer
+    cache_models = [EducationDb]
+    summary_fields = EDUCATION_SUMMARY_FIELDS
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = EducationFilter
-    pagination_class = StandardResultsSetPagination
+    pagination_class = FilterSearchPagination
+    facet_model = EducationFacet
+    facet_record_field = 'education'
+
+    def get_queryset(self):
+        return self.only_selected_fields(EducationDb.objects.all())
@@ -0,0 +1,187 @@
+import re
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalogue.live_index import LiveIndex
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# What a keyword match counts towards
+SDG = 'sdg'              # one goal, optionally a target within it
+ALL_SDGS = 'all'         # keywords related to every goal
+DIGITAL = 'digital'      # digital sustainability keywords
+
+# (kind, sdg number or None, target or '')
+Label = Tuple[str, Optional[int], str]
+
+
+def words(text: Optional[str]) -> List[str]:
+    return WORD_RE.findall((text or '').lower())
+
+
+class WordAutomaton:
+    """
+    Aho-Corasick automaton over words.
+
+    Patterns are word sequences, so a text is scanned in one pass over its words
+    and only whole words match ("art" does not match inside "start"). Each
+    pattern carries a list of labels; `scan` yields the labels of every
+    occurrence, overlapping ones included.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # labels of patterns ending exactly at a state
+        self._labels: List[List] = [[]]
+        # nearest state down the failure chain that ends a pattern
+        self._output_link: List[int] = [0]
+        self._patterns: List[str] = ['']
+        self._compiled = True
+
+    def __len__(self):
+        return sum(1 for labels in self._labels if labels)
+
+    def add(self, pattern_words: List[str], label):
+        if not pattern_words:
+            return
+        state = 0
+        for word in pattern_words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._labels.append([])
+                self._output_link.append(0)
+                self._patterns.append('')
+            state = next_state
+        self._labels[state].append(label)
+        self._patterns[state] = ' '.join(pattern_words)
+        self._compiled = False
+
+    def compile(self):
+        """Compute failure and output links breadth-first"""
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            self._output_link[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for word, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._output_link[child] = fail if self._labels[fail] else self._output_link[fail]
+                queue.append(child)
+        self._compiled = True
+
+    def scan(self, text_words: Iterable[str]):
+        """Yield (pattern, labels) for every pattern occurrence in the word sequence"""
+        if not self._compiled:
+            self.compile()
+        goto, fail, labels, output_link, patterns = (
+            self._goto, self._fail, self._labels, self._output_link, self._patterns)
+        state = 0
+        for word in text_words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            match = state if labels[state] else output_link[state]
+            while match:
+                yield patterns[match], labels[match]
+                match = output_link[match]
+
+
+class KeywordClassifier(LiveIndex):
+    """
+    Classifies free text against the SDGKeyword table.
+
+    All keywords are compiled into one WordAutomaton, built lazily on first use
+    and dropped by `invalidate()` when this process changes a keyword. Changes
+    by other processes, seen through the SDGKeyword version in the shared
+    catalogue cache, have it recompiled in the background (see
+    catalogue/live_index.py).
+    """
+
+    def __init__(self):
+        self._automaton = WordAutomaton()
+        super().__init__()
+
+    @staticmethod
+    def models():
+        from .models import SDGKeyword
+
+        return [SDGKeyword]
+
+    def new_index(self) -> WordAutomaton:
+        return WordAutomaton()
+
+    def replace_with(self, automaton: WordAutomaton):
+        self._automaton = automaton
+
+    def load_keywords(self) -> Iterable[Tuple[str, Label]]:
+        from .models import SDGKeyword
+
+        rows = SDGKeyword.objects.values_list('keyword', 'category', 'sdggoal', 'target')
+        for keyword, category, sdggoal, target in rows.iterator(chunk_size=2000):
+            if category == SDGKeyword.SDG:
+                if sdggoal.isdigit():
+                    yield keyword, (SDG, int(sdggoal), target)
+            else:
+                yield keyword, (category, None, '')
+
+    def load(self, automaton: WordAutomaton):
+        for keyword, label in self.load_keywords():
+            automaton.add(words(keyword), label)
+        automaton.compile()
+
+    def get_automaton(self) -> WordAutomaton:
+        self.ensure_built()
+        return self._automaton
+
+    def classify(self, text: Optional[str]) -> dict:
+        """
+        Return the SDGs and targets whose keywords occur in the text.
+
+        Every occurrence of a keyword counts one hit towards each goal/target it is
+        listed under. Goals and targets are ordered by hits, most first.
+        """
+        sdg_hits = Counter()
+        target_hits = Counter()
+        sdg_keywords: Dict[int, Dict[str, None]] = {}
+        other_hits = Counter()
+
+        for pattern, labels in self.get_automaton().scan(words(text)):
+            # the same keyword can be listed twice under one goal; count it once per occurrence
+            for kind, sdg, target in set(labels):
+                if kind != SDG:
+                    other_hits[kind] += 1
+                    continue
+                if target:
+                    target_hits[(sdg, target)] += 1
+            for sdg in {sdg for kind, sdg, _ in labels if kind == SDG}:
+                sdg_hits[sdg] += 1
+                sdg_keywords.setdefault(sdg, {})[pattern] = None
+
+        return {
+            'sdgs': [
+                {'sdg': sdg, 'hits': hits, 'keywords': list(sdg_keywords[sdg])}
+                for sdg, hits in sorted(sdg_hits.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'targets': [
+                {'sdg': sdg, 'target': target, 'hits': hits}
+                for (sdg, target), hits in sorted(target_hits.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'all_sdgs_hits': other_hits[ALL_SDGS],
+            'digital_hits': other_hits[DIGITAL],
+        }
+
+
+# Process-wide classifier shared by the API and the batch command
+classifier = KeywordClassifier()
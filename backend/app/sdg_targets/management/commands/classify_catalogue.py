@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalogue.facets import multiselect_values
+from sdg_actions.models import ActionDb
+from sdg_education.models import EducationDb
+from sdg_targets.classifier import classifier
+
+# Record type -> (model, text fields to classify, field holding the curated SDGs)
+SOURCES = {
+    'action': (ActionDb, ['actions', 'action_detail', 'award_description'], 'sdgs'),
+    'education': (EducationDb, ['title', 'description', 'aims', 'learning_outcome', 'descriptions'],
+                  'sdgs_related'),
+}
+
+
+class Command(BaseCommand):
+    help = ("Classify every action and education record against the SDG keyword tables, "
+            "optionally writing one JSON line per record, and report how often the top "
+            "keyword SDG agrees with the record's curated SDGs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=[*SOURCES, 'all'], default='all',
+                            help='Which records to classify (default: all).')
+        parser.add_argument('--output', help='Write per-record results as JSON lines to this file.')
+
+    def handle(self, *args, **options):
+        types = list(SOURCES) if options['type'] == 'all' else [options['type']]
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+        started = time.perf_counter()
+        classifier.invalidate()
+        try:
+            for kind in types:
+                self.classify_type(kind, output)
+        finally:
+            if output:
+                output.close()
+        self.stdout.write(f'Finished in {time.perf_counter() - started:.2f}s')
+
+    def classify_type(self, kind, output):
+        model, text_fields, sdg_field = SOURCES[kind]
+        total = matched = agreeing = 0
+        rows = model.objects.values_list('id', sdg_field, *text_fields).iterator(chunk_size=2000)
+        for pk, curated, *texts in rows:
+            result = classifier.classify('\n'.join(text for text in texts if text))
+            total += 1
+            if result['sdgs']:
+                matched += 1
+                if str(result['sdgs'][0]['sdg']) in multiselect_values(curated):
+                    agreeing += 1
+            if output:
+                output.write(json.dumps({'type': kind, 'id': pk, **result}) + '\n')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind}: classified {total} records, {matched} matched a keyword, '
+            f'top SDG agrees with the curated SDGs for {agreeing}'))
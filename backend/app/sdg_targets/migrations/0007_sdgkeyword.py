@@ -0,0 +1,71 @@
+# Generated by Django 5.1.7 on 2026-10-18 06:29
+
+import re
+
+from django.db import migrations, models
+
+SDG_TABLES = {f'sdg{sdg}_target': str(sdg) for sdg in range(1, 18)}
+
+
+def normalize_keyword(keyword):
+    return ' '.join(re.findall(r'[a-z0-9]+', (keyword or '').lower()))
+
+
+def copy_keywords(apps, schema_editor):
+    SDGKeyword = apps.get_model('sdg_targets', 'SDGKeyword')
+    sources = {name: ('sdg', sdg) for name, sdg in SDG_TABLES.items()}
+    sources['keyword'] = ('sdg', None)
+    sources['keywords_related_to_all_sdgs'] = ('all', '')
+    sources['digital_keywords'] = ('digital', '')
+
+    for model_name, (category, sdggoal) in sources.items():
+        model = apps.get_model('sdg_targets', model_name)
+        rows = [
+            SDGKeyword(
+                keyword=row.keyword,
+                normalized=normalize_keyword(row.keyword)[:200],
+                category=category,
+                sdggoal=row.sdggoal if sdggoal is None else sdggoal,
+                target=getattr(row, 'target', ''),
+                reference1=row.reference1,
+                reference2=row.reference2,
+                note=row.note,
+                source=model_name,
+                source_id=row.pk,
+            )
+            for row in model.objects.iterator(chunk_size=1000)
+        ]
+        SDGKeyword.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sdg_targets', '0006_alter_keyword_target'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SDGKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(max_length=200)),
+                ('normalized', models.CharField(max_length=200)),
+                ('category', models.CharField(choices=[('sdg', 'SDG keyword'), ('all', 'Related to all SDGs'), ('digital', 'Digital sustainability')], default='sdg', max_length=10)),
+                ('sdggoal', models.CharField(blank=True, default='', max_length=300)),
+                ('target', models.CharField(blank=True, default='', max_length=200)),
+                ('reference1', models.CharField(default='', max_length=300)),
+                ('reference2', models.CharField(default='', max_length=300)),
+                ('note', models.CharField(default='', max_length=200)),
+                ('source', models.CharField(max_length=40)),
+                ('source_id', models.IntegerField()),
+            ],
+            options={
+                'verbose_name_plural': '21. All keywords',
+                'db_table': 'sdg_keyword',
+                'indexes': [models.Index(fields=['keyword'], name='sdg_keyword_keyword_idx'), models.Index(fields=['normalized'], name='sdg_keyword_normalized_idx'), models.Index(fields=['sdggoal', 'target'], name='sdg_keyword_target_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'source_id'), name='sdg_keyword_source_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_keywords, migrations.RunPython.noop),
+    ]
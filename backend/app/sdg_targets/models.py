@@ -1,6 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.urls import reverse
 from django.utils.html import mark_safe
+from django.dispatch import receiver
+import re
+from catalogue.autocomplete import autocomplete_index, KEYWORD
+from catalogue.bulk import in_batches
+from catalogue.cache import response_cache
+from .classifier import classifier
 
 # iterable
 SDGTarget_CHOICES =(
@@ -830,4 +837,183 @@ class References(models.Model):
     source = models.CharField(default="", max_length=300, editable = True)
     
     class Meta:
-        verbose_name_plural = '20. Sources'
\ No newline at end of file
+        verbose_name_plural = '20. Sources'
+
+
+# Keyword table of each goal, by goal number
+SDG_TARGET_MODELS = {
+    1: SDG1_Target, 2: SDG2_Target, 3: SDG3_Target, 4: SDG4_Target, 5: SDG5_Target,
+    6: SDG6_Target, 7: SDG7_Target, 8: SDG8_Target, 9: SDG9_Target, 10: SDG10_Target,
+    11: SDG11_Target, 12: SDG12_Target, 13: SDG13_Target, 14: SDG14_Target,
+    15: SDG15_Target, 16: SDG16_Target, 17: SDG17_Target,
+}
+
+
+def normalize_keyword(keyword):
+    """Lowercase a keyword and reduce it to single-space separated words"""
+    return ' '.join(re.findall(r'[a-z0-9]+', (keyword or '').lower()))
+
+
+class SDGKeyword(models.Model):
+    """
+    Every keyword of the legacy keyword tables in one indexed table.
+
+    The per-goal SDGn_Target tables, Keyword, keywords_related_to_all_SDGs and
+    Digital_Keywords stay the place admins edit keywords; their save/delete
+    signals mirror each row here, identified by (source, source_id). Lookups by
+    keyword, by normalized keyword and by goal/target are single indexed queries.
+    """
+    SDG = 'sdg'
+    ALL_SDGS = 'all'
+    DIGITAL = 'digital'
+    CATEGORY_CHOICES = (
+        (SDG, 'SDG keyword'),
+        (ALL_SDGS, 'Related to all SDGs'),
+        (DIGITAL, 'Digital sustainability'),
+    )
+
+    keyword = models.CharField(max_length=200)
+    normalized = models.CharField(max_length=200)
+    category = models.CharField(max_length=10, choices=CATEGORY_CHOICES, default=SDG)
+    sdggoal = models.CharField(default="", max_length=300, blank=True)
+    target = models.CharField(default="", max_length=200, blank=True)
+    reference1 = models.CharField(default="", max_length=300)
+    reference2 = models.CharField(default="", max_length=300)
+    note = models.CharField(default="", max_length=200)
+    # model name and primary key of the legacy row this mirrors
+    source = models.CharField(max_length=40)
+    source_id = models.IntegerField()
+
+    class Meta:
+        db_table = 'sdg_keyword'
+        verbose_name_plural = '21. All keywords'
+        indexes = [
+            models.Index(fields=['keyword'], name='sdg_keyword_keyword_idx'),
+            models.Index(fields=['normalized'], name='sdg_keyword_normalized_idx'),
+            models.Index(fields=['sdggoal', 'target'], name='sdg_keyword_target_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'source_id'], name='sdg_keyword_source_uniq'),
+        ]
+
+    def __str__(self):
+        return self.keyword
+
+    @staticmethod
+    def source_models():
+        """Legacy model -> (category, goal) for the rows it holds; None means the row names its goal"""
+        sources = {model: (SDGKeyword.SDG, str(sdg)) for sdg, model in SDG_TARGET_MODELS.items()}
+        sources[Keyword] = (SDGKeyword.SDG, None)
+        sources[keywords_related_to_all_SDGs] = (SDGKeyword.ALL_SDGS, '')
+        sources[Digital_Keywords] = (SDGKeyword.DIGITAL, '')
+        return sources
+
+    # fields copied from the legacy row, see fields_for
+    MIRRORED_FIELDS = ['keyword', 'normalized', 'category', 'sdggoal', 'target', 'reference1', 'reference2', 'note']
+
+    @classmethod
+    def fields_for(cls, instance):
+        category, sdggoal = cls.source_models()[type(instance)]
+        return {
+            'keyword': instance.keyword,
+            'normalized': normalize_keyword(instance.keyword)[:200],
+            'category': category,
+            'sdggoal': instance.sdggoal if sdggoal is None else sdggoal,
+            'target': getattr(instance, 'target', ''),
+            'reference1': instance.reference1,
+            'reference2': instance.reference2,
+            'note': instance.note,
+        }
+
+    @classmethod
+    def sync(cls, instance):
+        """Create or update the row mirroring one legacy keyword"""
+        cls.objects.update_or_create(
+            source=instance._meta.model_name, source_id=instance.pk, defaults=cls.fields_for(instance))
+
+    @classmethod
+    def rebuild(cls, ids=None, batch_size=1000):
+        """
+        Bring the table in line with the legacy tables, e.g. after bulk loads that bypass signals.
+
+        `ids` maps legacy models to the primary keys to refresh; by default every
+        row of every legacy table is, and rows whose legacy row is gone are
+        dropped. Runs in one transaction and only writes rows that changed, so
+        lookups never see a partly filled table and unchanged rows keep their ids.
+        """
+        with transaction.atomic():
+            for model in cls.source_models():
+                if ids is not None and model not in ids:
+                    continue
+                source = model._meta.model_name
+                for batch in in_batches(model.objects.all(), None if ids is None else ids[model], batch_size):
+                    existing = cls.objects.filter(source=source, source_id__in=[instance.pk for instance in batch])
+                    rows = {row.source_id: row for row in existing}
+                    created, updated = [], []
+                    for instance in batch:
+                        fields = cls.fields_for(instance)
+                        row = rows.get(instance.pk)
+                        if row is None:
+                            created.append(cls(source=source, source_id=instance.pk, **fields))
+                        elif any(getattr(row, name) != value for name, value in fields.items()):
+                            for name, value in fields.items():
+                                setattr(row, name, value)
+                            updated.append(row)
+                    cls.objects.bulk_create(created)
+                    cls.objects.bulk_update(updated, cls.MIRRORED_FIELDS)
+                if ids is None:
+                    cls.objects.filter(source=source).exclude(source_id__in=model.objects.values('pk')).delete()
+
+    @classmethod
+    def lookup(cls, keyword):
+        """Rows for a keyword across every goal, ignoring case and punctuation"""
+        return cls.objects.filter(normalized=normalize_keyword(keyword))
+
+    @classmethod
+    def for_target(cls, sdggoal, target=None):
+        """Rows listed under a goal, or under one target of it"""
+        queryset = cls.objects.filter(sdggoal=str(sdggoal))
+        if target:
+            queryset = queryset.filter(target=target)
+        return queryset
+
+
+# Mirror the legacy keyword tables into SDGKeyword
+def sync_keyword(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SDGKeyword.sync(instance)
+
+
+def remove_keyword(sender, instance, **kwargs):
+    SDGKeyword.objects.filter(source=sender._meta.model_name, source_id=instance.pk).delete()
+
+
+for _model in SDGKeyword.source_models():
+    post_save.connect(sync_keyword, sender=_model)
+    post_delete.connect(remove_keyword, sender=_model)
+
+
+# Keep the autocomplete index and the classifier in step with the keywords once changes are committed
+@receiver(post_save, sender=SDGKeyword)
+def index_keyword(sender, instance, **kwargs):
+    def update():
+        autocomplete_index.index_item(KEYWORD, instance.pk, instance.keyword)
+        classifier.invalidate()
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=SDGKeyword)
+def unindex_keyword(sender, instance, **kwargs):
+    pk = instance.pk
+
+    def update():
+        autocomplete_index.remove_item(KEYWORD, pk)
+        classifier.invalidate()
+    transaction.on_commit(update)
+
+
+# Bump the keyword version the autocomplete indexes of all processes check, as for ActionDb
+@receiver([post_save, post_delete], sender=SDGKeyword)
+def expire_keyword_responses(sender, **kwargs):
+    response_cache.bump(sender)
+    transaction.on_commit(lambda: response_cache.bump(sender))
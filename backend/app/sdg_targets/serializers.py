@@ -0,0 +1,8 @@
+from rest_framework import serializers
+from .models import SDGKeyword
+
+
+class SDGKeywordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SDGKeyword
+        fields = ['id', 'keyword', 'category', 'sdggoal', 'target', 'reference1', 'reference2', 'note']
@@ -1,3 +1,143 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from sdg_actions.models import ActionDb
+from catalogue.cache import response_cache
+from .classifier import KeywordClassifier, WordAutomaton, classifier, words
+from .models import (SDG7_Target, SDG13_Target, Digital_Keywords, Keyword, SDGKeyword,
+                     keywords_related_to_all_SDGs)
+
+
+class WordAutomatonTestCase(TestCase):
+    def test_finds_overlapping_whole_word_patterns(self):
+        automaton = WordAutomaton()
+        for pattern in ['climate', 'climate change', 'change', 'art']:
+            automaton.add(words(pattern), pattern)
+        automaton.compile()
+
+        found = [pattern for pattern, _ in automaton.scan(words("Start on climate change now"))]
+        self.assertEqual(sorted(found), ['change', 'climate', 'climate change'])
+
+    def test_failure_links_recover_partial_matches(self):
+        automaton = WordAutomaton()
+        automaton.add(words('a b c'), 1)
+        automaton.add(words('b c d'), 2)
+        automaton.compile()
+
+        found = [labels for _, labels in automaton.scan(words('a b c d'))]
+        self.assertEqual(found, [[1], [2]])
+
+
+class ClassifierTestCase(APITestCase):
+    def setUp(self):
+        classifier.invalidate()
+        SDG13_Target.objects.create(keyword="climate change", target="13.1")
+        SDG13_Target.objects.create(keyword="Emissions", target="13.2")
+        SDG7_Target.objects.create(keyword="renewable energy", target="7.2")
+        SDG7_Target.objects.create(keyword="emissions", target="7.3")
+        keywords_related_to_all_SDGs.objects.create(keyword="sustainability")
+        Digital_Keywords.objects.create(keyword="smart grid")
+        self.url = reverse('sdg-classify')
+
+    def test_classify_counts_hits_per_sdg_and_target(self):
+        result = classifier.classify(
+            "Climate change is driven by emissions. Renewable energy on a smart grid cuts emissions "
+            "and supports sustainability.")
+        # equal hits are ordered by goal number
+        self.assertEqual(result['sdgs'], [
+            {'sdg': 7, 'hits': 3, 'keywords': ['emissions', 'renewable energy']},
+            {'sdg': 13, 'hits': 3, 'keywords': ['climate change', 'emissions']},
+        ])
+        self.assertIn({'sdg': 13, 'target': '13.2', 'hits': 2}, result['targets'])
+        self.assertIn({'sdg': 7, 'target': '7.2', 'hits': 1}, result['targets'])
+        self.assertEqual(result['all_sdgs_hits'], 1)
+        self.assertEqual(result['digital_hits'], 1)
+
+    def test_classify_endpoint(self):
+        resp = self.client.post(self.url, {'text': "Switch to renewable energy"}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['sdg'] for item in resp.data['sdgs']], [7])
+
+        resp = self.client.post(self.url, {'text': "  "}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyword_changes_recompile_classifier(self):
+        classifier.classify("ocean")
+        with self.captureOnCommitCallbacks(execute=True):
+            SDG13_Target.objects.create(keyword="ocean warming", target="13.1")
+        self.assertEqual(classifier.classify("ocean warming")['sdgs'][0]['sdg'], 13)
+
+    def test_keyword_changes_by_other_processes_reach_the_classifier(self):
+        worker = KeywordClassifier()
+        worker.background = False
+        worker.versions.check_interval = 0
+        self.assertEqual(worker.classify("ocean warming")['sdgs'], [])
+
+        # another process edits a keyword: this one gets no signal, only the bumped version
+        SDGKeyword.objects.filter(keyword="Emissions").update(keyword="ocean warming")
+        response_cache.cache.set(response_cache._version_key(SDGKeyword), 'another-process')
+        self.assertEqual(worker.classify("ocean warming")['sdgs'][0]['sdg'], 13)
+
+    def test_batch_command(self):
+        ActionDb.objects.create(id=1, actions="Cut emissions", action_detail="Use renewable energy.",
+                                sdgs=["7"])
+        ActionDb.objects.create(id=2, actions="Read more books", sdgs=["4"])
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'results.jsonl')
+            call_command('classify_catalogue', '--type', 'action', '--output', path, stdout=out)
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertIn('action: classified 2 records, 1 matched a keyword, '
+                      'top SDG agrees with the curated SDGs for 1', out.getvalue())
+        self.assertEqual([line['id'] for line in lines], [1, 2])
+        self.assertEqual(lines[0]['sdgs'][0]['sdg'], 7)
+        self.assertEqual(lines[1]['sdgs'], [])
+
+
+class SDGKeywordTestCase(APITestCase):
+    def setUp(self):
+        SDG13_Target.objects.create(id=5, keyword="Carbon  Footprint", target="13.2", note="n1")
+        SDG7_Target.objects.create(id=5, keyword="carbon footprint", target="7.3")
+        Keyword.objects.create(keyword="carbon-footprint", sdggoal="12", target="")
+        Digital_Keywords.objects.create(keyword="e-waste")
+        self.url = reverse('sdg-keywords')
+
+    def test_legacy_rows_are_mirrored(self):
+        row = SDGKeyword.objects.get(source='sdg13_target', source_id=5)
+        self.assertEqual((row.normalized, row.sdggoal, row.target, row.note),
+                         ("carbon footprint", "13", "13.2", "n1"))
+        self.assertEqual(SDGKeyword.objects.get(source='digital_keywords').category, SDGKeyword.DIGITAL)
+
+        legacy = SDG13_Target.objects.get(id=5)
+        legacy.target = "13.3"
+        legacy.save()
+        self.assertEqual(SDGKeyword.objects.get(source='sdg13_target', source_id=5).target, "13.3")
+
+        legacy.delete()
+        self.assertFalse(SDGKeyword.objects.filter(source='sdg13_target').exists())
+
+    def test_rebuild_matches_signals(self):
+        before = sorted(SDGKeyword.objects.values_list('source', 'source_id', 'normalized', 'sdggoal'))
+        SDGKeyword.rebuild()
+        after = sorted(SDGKeyword.objects.values_list('source', 'source_id', 'normalized', 'sdggoal'))
+        self.assertEqual(after, before)
+
+    def test_cross_sdg_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, {'keyword': 'CARBON footprint'})
+        self.assertEqual(sorted(item['sdggoal'] for item in resp.data), ['12', '13', '7'])
 
-# Create your tests here.
+    def test_target_lookup(self):
+        resp = self.client.get(self.url, {'sdg': 7, 'target': '7.3'})
+        self.assertEqual([item['keyword'] for item in resp.data], ["carbon footprint"])
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import ClassifyTextView, KeywordLookupView
+
+urlpatterns = [
+    path('classify/', ClassifyTextView.as_view(), name='sdg-classify'),
+    path('keywords/', KeywordLookupView.as_view(), name='sdg-keywords'),
+]
@@ -1,3 +1,55 @@
-from django.shortcuts import render
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .classifier import classifier
+from .models import SDGKeyword
+from .serializers import SDGKeywordSerializer
 
-# Create your views here.
+MAX_TEXT_LENGTH = 100_000
+
+
+class ClassifyTextView(APIView):
+    """
+    POST /api/sdg-targets/classify/
+    Body: {"text": "<free text>"}
+
+    Matches the text against every SDG keyword table in one pass and returns the SDGs
+    and targets it mentions, with hit counts and the matched keywords per SDG.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        text = request.data.get('text')
+        if not isinstance(text, str) or not text.strip():
+            return Response({"error": "Text is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(text) > MAX_TEXT_LENGTH:
+            return Response({"error": f"Text must be at most {MAX_TEXT_LENGTH} characters."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(classifier.classify(text), status=status.HTTP_200_OK)
+
+
+class KeywordLookupView(generics.ListAPIView):
+    """
+    GET /api/sdg-targets/keywords/?keyword=<keyword>
+    GET /api/sdg-targets/keywords/?sdg=<goal>[&target=<target>]
+
+    Returns every SDG the keyword is listed under (ignoring case and punctuation),
+    or every keyword listed under a goal or one of its targets.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    serializer_class = SDGKeywordSerializer
+    pagination_class = None  # Response becomes a list
+
+    def get_queryset(self):
+        keyword = self.request.query_params.get('keyword')
+        sdg = self.request.query_params.get('sdg')
+        if keyword:
+            queryset = SDGKeyword.lookup(keyword)
+        elif sdg:
+            queryset = SDGKeyword.for_target(sdg, self.request.query_params.get('target'))
+        else:
+            raise ValidationError({"error": "Provide a keyword or an sdg."})
+        return queryset.order_by('id')
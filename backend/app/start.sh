@@ -2,4 +2,11 @@
 
 cd /backend/app
 python manage.py migrate --fake-initial
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# Production ASGI server: WEB_CONCURRENCY worker processes serve HTTP and the real-time
+# editing websockets. They share rooms through the SQLite channel layer
+# (CHANNEL_LAYER_PATH), so all of them must run on this host.
+exec gunicorn _config.asgi:application \
+    --worker-class uvicorn_worker.UvicornWorker \
+    --workers "${WEB_CONCURRENCY:-4}" \
+    --bind "0.0.0.0:${PORT:-8000}" \
+    --graceful-timeout 30
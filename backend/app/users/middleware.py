@@ -0,0 +1,37 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from knox.auth import TokenAuthentication
+from rest_framework import exceptions
+
+
+@database_sync_to_async
+def get_token_user(token):
+    try:
+        user, _ = TokenAuthentication().authenticate_credentials(token.encode())
+    except exceptions.AuthenticationFailed:
+        return AnonymousUser()
+    return user
+
+
+def scope_token(scope):
+    """The Knox token of a WebSocket handshake: `?token=` (browsers) or an Authorization: Token header"""
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            prefix, _, token = value.decode('latin1').partition(' ')
+            if prefix.lower() == 'token' and token:
+                return token.strip()
+    tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return tokens[0] if tokens else None
+
+
+class KnoxTokenAuthMiddleware(BaseMiddleware):
+    """Sets scope['user'] from the Knox token the REST API uses, for WebSocket connections"""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token = scope_token(scope)
+        scope['user'] = await get_token_user(token) if token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
@@ -6,6 +6,8 @@ from django.shortcuts import get_object_or_404
 from .models import UserProfile, PendingUser, PasswordResetRequest
 from .serializers import ProfileSerializer
 from teams.models import Team, TeamMember
+from sdg_actions.models import ActionDb
+from sdg_education.models import EducationDb
 from unittest.mock import patch
 from django.utils import timezone
 from datetime import timedelta
@@ -218,6 +220,21 @@ class BookmarkTests(APITestCase):
         response = self.client.post(self.add_url, {})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_get_bookmarks_expanded(self):
+        ActionDb.objects.create(id=7, actions="Plant trees", sdgs=["15"])
+        EducationDb.objects.create(id=3, title="Climate course", sdgs_related=["13"])
+        for bookmark in ['education-3', 'action-7', 'action-99', 'page123']:
+            self.client.post(self.add_url, {'bookmark': bookmark})
+
+        # one query for the profile, one per record type
+        with self.assertNumQueries(3):
+            response = self.client.get(self.get_url, {'expand': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        records = response.data['records']
+        self.assertEqual([(r['type'], r['id']) for r in records], [('education', 3), ('action', 7)])
+        self.assertEqual(records[1]['actions'], "Plant trees")
+        self.assertEqual(response.data['missing'], ['action-99', 'page123'])
+
 ### Team and Invitation Tests 
 
 class TeamAndInvitationTests(APITestCase):
@@ -18,6 +18,11 @@ from .utils import generate_verification_code, send_verification_email, send_pas
 from django.utils import timezone
 from datetime import timedelta
 from admin_portal.models import EducationInteraction, ActionInteraction
+from sdg_actions.models import ActionDb
+from sdg_actions.serializers import ActionSerializer
+from sdg_education.models import EducationDb
+from sdg_education.serializers import EducationSerializer
+from catalogue.bulk import fetch_in_order
 from django.db import transaction
 import uuid
 from django.contrib.auth.hashers import make_password
@@ -208,7 +213,47 @@ class DeleteBookmarkView(generics.GenericAPIView):
         }, status=status.HTTP_200_OK)
 
 ### Function to retrieve user bookmarks
+# Bookmarks are stored as '<type>-<id>'; the record types they can point to
+BOOKMARK_SOURCES = {
+    'action': (ActionDb, ActionSerializer),
+    'education': (EducationDb, EducationSerializer),
+}
+
+
+def hydrate_bookmarks(bookmarks):
+    """
+    Load the records behind a list of bookmarks with one query per record type.
+
+    Returns the serialized records in bookmark order, each tagged with its `type`,
+    and the bookmarks that do not point to an existing record.
+    """
+    ids_by_type = {kind: [] for kind in BOOKMARK_SOURCES}
+    for bookmark in bookmarks:
+        kind, _, pk = bookmark.partition('-')
+        if kind in ids_by_type and pk.isdigit():
+            ids_by_type[kind].append(int(pk))
+
+    serialized = {}
+    for kind, ids in ids_by_type.items():
+        if not ids:
+            continue
+        model, serializer_class = BOOKMARK_SOURCES[kind]
+        found, _ = fetch_in_order(model.objects.all(), ids)
+        for data in serializer_class(found, many=True).data:
+            serialized[f"{kind}-{data['id']}"] = {**data, 'type': kind}
+
+    records = [serialized[bookmark] for bookmark in bookmarks if bookmark in serialized]
+    missing = [bookmark for bookmark in bookmarks if bookmark not in serialized]
+    return records, missing
+
+
 class GetBookmarksView(generics.GenericAPIView):
+    """
+    GET /api/auth/bookmark/get/[?expand=true]
+
+    Returns the user's bookmarks. With `expand=true` the bookmarked records are
+    included as `records`, in bookmark order, along with the `missing` bookmarks.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
@@ -219,9 +264,10 @@ class GetBookmarksView(generics.GenericAPIView):
             return Response({"error": "Unauthorised."}, status=status.HTTP_401_UNAUTHORIZED)
         user = UserProfile.objects.get(user=username)
 
-        return Response({
-            'bookmarks': user.bookmarks
-        }, status=status.HTTP_200_OK)
+        data = {'bookmarks': user.bookmarks}
+        if request.query_params.get('expand', '').lower() in ('1', 'true', 'yes'):
+            data['records'], data['missing'] = hydrate_bookmarks(user.bookmarks)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 ### Functions related to user profile
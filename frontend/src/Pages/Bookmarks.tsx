@@ -58,29 +58,19 @@ const Bookmarks = () => {
         await apiCallPost('api/auth/bookmark/set/', { bookmark: 'action-7' }, true)
       ]);
 
-      // Gets title of all bookmarks the user has
-      const data = await apiCallGet('api/auth/bookmark/get/', true);
+      // Gets all bookmarked records (tagged with their type) in one request
+      const data = await apiCallGet('api/auth/bookmark/get/?expand=true', true);
 
       const userBookmarks: any[] = [];
 
-      for (const bookmark of data.bookmarks) {
-        const [type, id] = bookmark.split('-');
-
-        if (type === 'action') {
-          const actionBookmark = await apiCallGet(`api/sdg-actions/retrieve?q=${encodeURIComponent(id)}`, false);
-          if (typeof actionBookmark.sdgs === 'number') {
-            actionBookmark.sdgs = [String(actionBookmark.sdgs)];
-          }
-          actionBookmark.type = 'action';
-          userBookmarks.push(actionBookmark);
-        } else if (type === 'education') {
-          const educationBookmark = await apiCallGet(`api/sdg-education/retrieve?q=${encodeURIComponent(id)}`, false);
-          if (typeof educationBookmark.sdgs_related === 'number') {
-            educationBookmark.sdgs_related = [educationBookmark.sdgs_related];
-          }
-          educationBookmark.type = 'education';
-          userBookmarks.push(educationBookmark);
+      for (const bookmark of data.records ?? []) {
+        if (typeof bookmark.sdgs === 'number') {
+          bookmark.sdgs = [String(bookmark.sdgs)];
+        }
+        if (typeof bookmark.sdgs_related === 'number') {
+          bookmark.sdgs_related = [bookmark.sdgs_related];
         }
+        userBookmarks.push(bookmark);
       }
       // userBookmarks has the info associated with all the bookmark titles
       setBookmarks(userBookmarks);
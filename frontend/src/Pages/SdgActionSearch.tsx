@@ -122,6 +122,17 @@ export default function SdgActionSearch() {
 
   const [modalOpen, setModalOpen] = useState(false)
   const [selectedRow, setSelectedRow] = useState<ActionRow | null>(null)
+
+  // list results only carry summary fields, so load the full record for the modal
+  async function openDetails(row: ActionRow) {
+    setSelectedRow(row)
+    setModalOpen(true)
+    const res = await apiCallGet(`api/sdg-actions/retrieve/?q=${row.id}`, false)
+    if (res.statusCode === 200) {
+      setSelectedRow(res)
+    }
+  }
+
   // building api call
   async function fetchData() {
     try {
@@ -444,10 +455,7 @@ export default function SdgActionSearch() {
                   <TableCell sx={{ py: 1.5 }}>
                     <Typography
                       sx={{ fontWeight: 'bold', cursor: 'pointer', '&:hover': { textDecoration: 'underline' } }}
-                      onClick={() => {
-                        setSelectedRow(row)
-                        setModalOpen(true)
-                      }}
+                      onClick={() => openDetails(row)}
                     >
                       {row.actions}
                     </Typography>
@@ -163,6 +163,17 @@ const SDG_OPTIONS = SDG_TITLES.map((title, idx) => ({
   
     const [modalOpen, setModalOpen] = useState(false)
     const [selectedRow, setSelectedRow] = useState<EducationRow | null>(null)
+
+    // list results only carry summary fields, so load the full record for the modal
+    async function openDetails(row: EducationRow) {
+      setSelectedRow(row)
+      setModalOpen(true)
+      const res = await apiCallGet(`api/sdg-education/retrieve/?q=${row.id}`, false)
+      if (res.statusCode === 200) {
+        setSelectedRow(res)
+      }
+    }
+
     // building api call
     async function fetchData() {
       try {
@@ -451,10 +462,7 @@ const SDG_OPTIONS = SDG_TITLES.map((title, idx) => ({
                       <TableCell sx={{ py: 1.5 }}>
                         <Typography
                           sx={{ fontWeight: 'bold', cursor: 'pointer', '&:hover': { textDecoration: 'underline' } }}
-                          onClick={() => {
-                            setSelectedRow(row)
-                            setModalOpen(true)
-                          }}
+                          onClick={() => openDetails(row)}
                         >
                           {row.title}
                         </Typography>
@@ -88,6 +88,16 @@ const SearchKeyword = () => {
   const [isFocused, setIsFocused] = useState(false); 
   const [selectedPlan, setSelectedPlan] = useState<any | null>(null);
 
+  // search results only carry summary fields, so load the full record for the modal
+  const openPlan = async (plan: any) => {
+    setSelectedPlan(plan);
+    const path = plan.actions !== undefined ? 'api/sdg-actions/retrieve/' : 'api/sdg-education/retrieve/';
+    const fullPlan = await apiCallGet(`${path}?q=${plan.id}`, false);
+    if (fullPlan.statusCode === 200) {
+      setSelectedPlan(fullPlan);
+    }
+  };
+
   useEffect(() => {
     const fetchSearchData = async () => {
       const recent = await getRecentSearches();
@@ -106,16 +116,22 @@ const SearchKeyword = () => {
         return;
       }
 
-      const [educationData, actionsData] = await Promise.all([
-        apiCallGet(`api/sdg-education/search?q=${encodeURIComponent(currentSearch)}`, false),
-        apiCallGet(`api/sdg-actions/search?q=${encodeURIComponent(currentSearch)}`, false)
-      ]);
-
-      const educationPlans = Object.values(educationData).filter((educationPlan: any) => educationPlan.title);
-
-      const actionPlans = Object.values(actionsData).filter((actionPlan: any) => actionPlan.title);
+      const data = await apiCallGet(
+        `api/catalogue/autocomplete/?q=${encodeURIComponent(currentSearch)}&kind=action,education&limit=5`,
+        false
+      );
+      if (data.statusCode !== 200) {
+        return;
+      }
 
-      const suggestions = [...educationPlans, ...actionPlans].slice(0, 5);
+      // shaped like search results so the title shows and openPlan can load the full record
+      const suggestions = Object.values(data)
+        .filter((suggestion: any) => suggestion.kind)
+        .map((suggestion: any) => (
+          suggestion.kind === 'action'
+            ? { id: suggestion.id, actions: suggestion.label }
+            : { id: suggestion.id, title: suggestion.label }
+        ));
 
       setSuggestedSearches(suggestions);
 
@@ -209,7 +225,7 @@ const SearchKeyword = () => {
                       key={index} 
                       search={search.title || search.actions} 
                       iconType='trending' 
-                      onClick={() => {setSelectedPlan(search)}}
+                      onClick={() => openPlan(search)}
                       isLast={index === trendingSearches.length - 1} 
                     />
                   ))}
@@ -225,7 +241,7 @@ const SearchKeyword = () => {
                     key={index} 
                     search={search.title || search.actions} 
                     iconType='search' 
-                    onClick={() => {setSelectedPlan(search)}}
+                    onClick={() => openPlan(search)}
                   />
                 ))}
               </Box>
@@ -50,31 +50,30 @@ describe('Bookmarks Page', () => {
     });
 
     (ApiCalls.apiCallGet as jest.Mock).mockImplementation((url) => {
-      if (url === 'api/auth/bookmark/get/') {
+      if (url === 'api/auth/bookmark/get/?expand=true') {
         return Promise.resolve({
-          bookmarks: ['action-1', 'education-2']
-        });
-      }
-      if (url.startsWith('api/sdg-actions/retrieve')) {
-        return Promise.resolve({
-          id: '1',
-          actions: 'Plant a tree',
-          aims: 'Environmental improvement',
-          action_detail: 'Planting trees to absorb carbon dioxide',
-          organization: 'Green Earth Org',
-          sdgs: ['1', '2', '3', '4', '5', '6', '7', '8', '9'],
-          type: 'action'
-        });
-      }
-      if (url.startsWith('api/sdg-education/retrieve')) {
-        return Promise.resolve({
-          id: '2',
-          title: 'Climate Change Education',
-          aims: 'Awareness',
-          descriptions: 'Learn about climate change.',
-          organization: 'UNESCO',
-          sdgs_related: ['10', '11', '12', '13', '14', '15', '16', '17', '18'],
-          type: 'education'
+          bookmarks: ['action-1', 'education-2', 'action-404'],
+          records: [
+            {
+              id: 1,
+              actions: 'Plant a tree',
+              aims: 'Environmental improvement',
+              action_detail: 'Planting trees to absorb carbon dioxide',
+              organization: 'Green Earth Org',
+              sdgs: ['1', '2', '3', '4', '5', '6', '7', '8', '9'],
+              type: 'action'
+            },
+            {
+              id: 2,
+              title: 'Climate Change Education',
+              aims: 'Awareness',
+              descriptions: 'Learn about climate change.',
+              organization: 'UNESCO',
+              sdgs_related: ['10', '11', '12', '13', '14', '15', '16', '17', '18'],
+              type: 'education'
+            }
+          ],
+          missing: ['action-404']
         });
       }
     });
@@ -95,6 +94,32 @@ describe('Bookmarks Page', () => {
     expect(await screen.findByText('Climate Change Education')).toBeInTheDocument();
   });
 
+  it('renders the records of the expanded bookmarks response', async () => {
+    renderWithRouter(<Bookmarks />);
+
+    expect(await screen.findByText('Plant a tree')).toBeInTheDocument();
+    expect(screen.getByText('Climate Change Education')).toBeInTheDocument();
+    expect(screen.getByText('Green Earth Org')).toBeInTheDocument();
+    expect(screen.getByText('UNESCO')).toBeInTheDocument();
+
+    // every record arrives with the bookmark list, so nothing is fetched one by one
+    expect(ApiCalls.apiCallGet).toHaveBeenCalledTimes(1);
+    expect(ApiCalls.apiCallGet).toHaveBeenCalledWith('api/auth/bookmark/get/?expand=true', true);
+  });
+
+  it('removes a bookmark by its type and id', async () => {
+    renderWithRouter(<Bookmarks />);
+
+    await screen.findByText('Plant a tree');
+    fireEvent.click(screen.getAllByRole('button', { name: 'Remove Bookmark' })[0]);
+
+    await waitFor(() => {
+      expect(ApiCalls.apiCallPost).toHaveBeenCalledWith('api/auth/bookmark/unset/', { bookmark: 'action-1' }, true);
+    });
+    expect(await screen.queryByText('Plant a tree')).not.toBeInTheDocument();
+    expect(screen.getByText('Climate Change Education')).toBeInTheDocument();
+  });
+
   it('can search bookmarks', async () => {
     renderWithRouter(<Bookmarks />);
     
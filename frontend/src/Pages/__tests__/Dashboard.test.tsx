@@ -84,6 +84,23 @@ describe("CreateDashboard/Search", () => {
             action_detail: "Cut down on waste and maybe save money at the coffee shop.",
           }
         ]);
+      } else if (url.startsWith('api/catalogue/autocomplete/')) {
+        // apiCallGet spreads the suggestion list into an object next to statusCode
+        const query = new URLSearchParams(url.split('?')[1]).get('q') || '';
+        const suggestions = [
+          { id: 3, label: "Introducing the Sustainability Bootcamp and the SDGs", kind: "education" },
+          { id: 5, label: "Get rid of paper bank statements", kind: "action" },
+        ].filter((suggestion) => suggestion.label.toLowerCase().startsWith(query.toLowerCase()));
+        return Promise.resolve({ statusCode: 200, ...suggestions });
+      } else if (url === 'api/sdg-education/retrieve/?q=3') {
+        return Promise.resolve({
+          statusCode: 200,
+          id: 3,
+          title: "Introducing the Sustainability Bootcamp and the SDGs",
+          aims: "Understand transboundary freshwater governance.",
+          descriptions: "Course on governance for transboundary freshwater security...",
+          organization: "SDG Academy X"
+        });
       }
       return Promise.resolve([]);
     });
@@ -130,15 +147,14 @@ describe("CreateDashboard/Search", () => {
 
     await waitFor(() => {
       expect(ApiCalls.apiCallGet).toHaveBeenCalledWith(
-        expect.stringContaining("api/sdg-education/search?q=Introducing"),
-        false
-      );
-      expect(ApiCalls.apiCallGet).toHaveBeenCalledWith(
-        expect.stringContaining("api/sdg-actions/search?q=Introducing"),
+        "api/catalogue/autocomplete/?q=Introducing&kind=action,education&limit=5",
         false
       );
     });
 
+    // only the suggestions matching the typed prefix are listed
+    expect(await screen.findByText("Introducing the Sustainability Bootcamp and the SDGs")).toBeInTheDocument();
+    expect(screen.queryByText("Get rid of paper bank statements")).not.toBeInTheDocument();
   });
 
   it("should update search input value", async () => {
@@ -163,6 +179,10 @@ describe("CreateDashboard/Search", () => {
     expect(suggestion).toBeInTheDocument();
   
     userEvent.click(suggestion);
+
+    // the suggestion only carries its id and label, so the full record is loaded for the modal
+    expect(await screen.findByText("Course on governance for transboundary freshwater security...")).toBeInTheDocument();
+    expect(ApiCalls.apiCallGet).toHaveBeenCalledWith('api/sdg-education/retrieve/?q=3', false);
   });
 
 });